@@ -0,0 +1,208 @@
+import gzip
+import hashlib
+import json
+import math
+import random
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+# Generation counters
+#
+# Every cached list page embeds the generation of the scopes it depends on in
+# its key. Bumping a generation is a single incr: every page built with the
+# previous number is never read again and expires on its own.
+
+def generation_key(scope):
+    return 'generation-%s' % (scope)
+
+def get_generation(scope):
+    """
+        Returns the current generation of a scope.
+        A missing counter (first use, eviction) starts from the current time in ms,
+        so it never goes back to a number already used by cached pages.
+    """
+    key = generation_key(scope)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+
+    return generation
+
+def bump_generation(scope):
+    key = generation_key(scope)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), None)
+        return cache.get(key)
+
+def canonical_query(query_params):
+    """
+        Query string with sorted parameters and without empty values, so
+        ?page=2&titre=x and ?titre=x&page=2 give the same result.
+    """
+    items = []
+    for key in sorted(query_params.keys()):
+        items += [(key, value) for value in query_params.getlist(key) if value != '']
+
+    return urlencode(items)
+
+def versioned_key(prefix, scopes, query_params):
+    """
+        Builds a cache key from the generations of the given scopes and
+        the hash of the canonical query string.
+
+        example:
+            ?titre=x&page=2 with the generation 1745570000000 of 'livres'
+            versioned_key('livres-list', ['livres'], request.query_params)
+            => 'livres-list-1745570000000-<md5 of page=2&titre=x>'
+    """
+    generations = '-'.join(str(get_generation(scope)) for scope in scopes)
+    digest = hashlib.md5(canonical_query(query_params).encode()).hexdigest()
+    return '%s-%s-%s' % (prefix, generations, digest)
+
+
+# Single-flight recomputation
+#
+# Values are stored as (value, expires_at, delta) where delta is the time the
+# computation took, and kept STALE_TIME seconds after expires_at. When a value
+# is missing or stale only the request holding the lock recomputes it, the
+# others serve the stale value or poll until the new one is written.
+
+NOT_FOUND = 'not-found' # returned by compute() when the object doesn't exist
+NOT_FOUND_TIME = 60 # time in seconds a missing object is remembered
+LOCK_TIMEOUT = 10 # lease of the recomputation lock in seconds
+WAIT_TIMEOUT = 2 # time a request waits for another one to fill a missing key
+POLL_INTERVAL = 0.05
+STALE_TIME = 60
+
+def lock_key(key):
+    return 'lock-%s' % (key)
+
+def get_or_compute(key, compute, timeout, early_refresh=False, beta=1.0):
+    """
+        Returns the cached value of key, or calls compute() to build it,
+        making sure concurrent requests don't all run compute() at once.
+
+        param:
+            - str key
+            - callable compute, returns the value to cache
+            - int timeout, time in seconds for the value to be fresh
+              (NOT_FOUND_TIME at most when compute() returns NOT_FOUND)
+            - bool early_refresh, recomputes a hot value shortly before it
+              expires with a probability growing with its age (and with
+              the time compute() took, scaled by beta)
+        return:
+            the cached or computed value
+    """
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, expires_at, delta = entry
+        now = time.time()
+        if early_refresh:
+            now -= delta * beta * math.log(1 - random.random())
+
+        if now < expires_at:
+            return value
+
+        if not cache.add(lock_key(key), 1, LOCK_TIMEOUT):
+            return value
+
+        return _compute_and_set(key, compute, timeout)
+
+    if cache.add(lock_key(key), 1, LOCK_TIMEOUT):
+        return _compute_and_set(key, compute, timeout)
+
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+    # the lock holder is too slow or died, don't keep the request waiting
+    return compute()
+
+def _compute_and_set(key, compute, timeout):
+    try:
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        if value == NOT_FOUND:
+            timeout = min(timeout, NOT_FOUND_TIME)
+        cache.set(key, (value, time.time() + timeout, delta), timeout + STALE_TIME)
+        return value
+    finally:
+        cache.delete(lock_key(key))
+
+
+# Pre-rendered responses
+#
+# Views cache the final JSON body (gzipped when it is big enough) instead of
+# serializer.data, so a hit involves neither the serializer nor the renderer.
+
+COMPRESS_MIN_SIZE = 1024 # bodies smaller than this are stored as is
+
+def render_json(data, status=200):
+    """
+        Renders data once and returns the entry to cache.
+
+        example:
+            render_json({'pk': 1})
+            => {'content': b'{"pk":1}', 'gzip': False, 'status': 200}
+    """
+    content = JSONRenderer().render(data)
+    compressed = len(content) >= COMPRESS_MIN_SIZE
+    if compressed:
+        content = gzip.compress(content, mtime=0)
+
+    return {'content': content, 'gzip': compressed, 'status': status}
+
+class CachedJSONResponse(Response):
+    """
+        Response built from an entry of render_json.
+        When JSON is negotiated the cached bytes are returned as they are (still
+        gzipped if the client accepts it), any other renderer (browsable API)
+        gets data decoded from them.
+    """
+
+    def __init__(self, entry, **kwargs):
+        self.entry = entry
+        self._data = None
+        super().__init__(status=entry['status'], **kwargs)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self._content_bytes())
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def _content_bytes(self):
+        if self.entry['gzip']:
+            return gzip.decompress(self.entry['content'])
+        return self.entry['content']
+
+    @property
+    def rendered_content(self):
+        if self.accepted_renderer.format != 'json' or ';' in self.accepted_media_type:
+            return super().rendered_content
+
+        self['Content-Type'] = JSONRenderer.media_type
+        patch_vary_headers(self, ['Accept-Encoding'])
+        request = self.renderer_context.get('request')
+        if self.entry['gzip'] and request and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            self['Content-Encoding'] = 'gzip'
+            return self.entry['content']
+
+        return self._content_bytes()
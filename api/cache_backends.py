@@ -0,0 +1,315 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+# Per-process storage, shared by the per-thread instances Django creates.
+_locals = {}
+_locks = {}
+_stats = {}
+_breakers = {}
+
+# methods of ResilientCache that don't change the primary cache
+READS = ('get', 'get_many', 'has_key')
+
+class TieredCache(BaseCache):
+    """
+        Cache backend that keeps a bounded in-process LRU in front of another
+        cache (memcached). Hits on the LRU cost no network round-trip and no
+        unpickling, so cached values must be treated as read-only.
+
+        Writes, deletes and incr go through to the remote cache. Local entries
+        live at most LOCAL_TIMEOUT seconds: a change made by this process is seen
+        at once, a change made by another process after LOCAL_TIMEOUT at worst.
+        Keys starting with one of REMOTE_ONLY_PREFIXES (locks) skip the LRU.
+
+        example:
+            CACHES = {
+                'default': {
+                    'BACKEND': 'api.cache_backends.TieredCache',
+                    'OPTIONS': {'REMOTE': 'memcached', 'MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 5},
+                },
+                'memcached': {
+                    'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                    'LOCATION': '127.0.0.1:11211',
+                },
+            }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._remote_alias = options.get('REMOTE', 'remote')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._remote_only_prefixes = tuple(options.get('REMOTE_ONLY_PREFIXES', ('lock-',)))
+        self._local = _locals.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, threading.Lock())
+        self.stats = _stats.setdefault(location, {
+            'local_hits': 0,
+            'local_misses': 0,
+            'remote_hits': 0,
+            'remote_misses': 0,
+        })
+
+    @property
+    def remote(self):
+        return caches[self._remote_alias]
+
+    def _is_local(self, key):
+        return not key.startswith(self._remote_only_prefixes)
+
+    def _local_get(self, key, version):
+        local_key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._local.move_to_end(local_key)
+                    self.stats['local_hits'] += 1
+                    return True, value
+                del self._local[local_key]
+
+            self.stats['local_misses'] += 1
+            return False, None
+
+    def _local_set(self, key, value, timeout, version):
+        if not self._is_local(key):
+            return
+
+        local_key = self.make_and_validate_key(key, version=version)
+        timeout = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + timeout, value)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        local_key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    def _remote_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            found, value = self._local_get(key, version)
+            if found:
+                return value
+
+        value = self.remote.get(key, self, version=version)
+        if value is self:
+            self.stats['remote_misses'] += 1
+            return default
+
+        self.stats['remote_hits'] += 1
+        self._local_set(key, value, self._local_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._remote_timeout(timeout)
+        self.remote.set(key, value, timeout, version=version)
+        self._local_set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._remote_timeout(timeout)
+        added = self.remote.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, self._remote_timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        return self.remote.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        value = self.remote.incr(key, delta, version=version)
+        self._local_set(key, value, self._local_timeout, version)
+        return value
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.remote.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.remote.clear()
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+
+class CircuitBreaker:
+    """
+        closed: calls go to the primary cache.
+        open: after FAILURE_THRESHOLD consecutive failures, calls skip the
+        primary cache for RECOVERY_TIMEOUT seconds.
+        half-open: once that time is over a single call probes the primary
+        cache, it closes the circuit if it succeeds and opens it again otherwise.
+        stale: a write (delete, incr...) didn't reach the primary cache, it may
+        hold values invalidated meanwhile.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, recovery_timeout):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.stale = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            recovered = self.state != self.CLOSED or self.failures > 0
+            self.state = self.CLOSED
+            self.failures = 0
+            return recovered
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                # the writes skip the primary cache until the circuit closes
+                self.stale = True
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+class ResilientCache(BaseCache):
+    """
+        Cache backend wrapping the memcached backend with a circuit breaker.
+        Errors of the primary cache are never raised: the call is served by a
+        local in-memory fallback instead, and after FAILURE_THRESHOLD failures in
+        a row the primary cache is skipped until a probe succeeds, so an outage
+        degrades requests to database speed instead of socket timeouts.
+        The fallback is emptied when the circuit opens and whenever the primary
+        cache answers again, it never serves values older than the current outage.
+        The primary cache is flushed before its first call after an outage (or
+        after a failed write): the deletes and generation bumps made meanwhile
+        only reached the fallback, its own entries can't be trusted anymore.
+
+        example:
+            CACHES = {
+                'memcached': {
+                    'BACKEND': 'api.cache_backends.ResilientCache',
+                    'OPTIONS': {'PRIMARY': 'memcached-server', 'FAILURE_THRESHOLD': 3, 'RECOVERY_TIMEOUT': 30},
+                },
+                'memcached-server': {
+                    'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                    'LOCATION': '127.0.0.1:11211',
+                    'OPTIONS': {'connect_timeout': 0.1, 'timeout': 0.1},
+                },
+            }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._primary_alias = options.get('PRIMARY', 'primary')
+        self.breaker = _breakers.setdefault(location, CircuitBreaker(
+            options.get('FAILURE_THRESHOLD', 3),
+            options.get('RECOVERY_TIMEOUT', 30),
+        ))
+        self.fallback = LocMemCache('resilient-fallback-%s' % (location), {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'OPTIONS': {'MAX_ENTRIES': options.get('FALLBACK_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def primary(self):
+        return caches[self._primary_alias]
+
+    def _call(self, method, *args, **kwargs):
+        if self.breaker.allow():
+            try:
+                if self.breaker.stale:
+                    self.primary.clear()
+                    self.breaker.stale = False
+                result = getattr(self.primary, method)(*args, **kwargs)
+            except ValueError:
+                # missing key on incr, not an outage
+                if self.breaker.success():
+                    self.fallback.clear()
+                raise
+            except Exception as exc:
+                if method not in READS:
+                    self.breaker.stale = True
+                if self.breaker.failure():
+                    logger.warning('Cache %s unavailable, using the local fallback: %s', self._primary_alias, exc)
+                    self.fallback.clear()
+            else:
+                if self.breaker.success():
+                    self.fallback.clear()
+                return result
+
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        return self._call('get', key, default, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set', key, value, self._timeout(timeout), version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('add', key, value, self._timeout(timeout), version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('touch', key, self._timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        return self._call('delete', key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._call('incr', key, delta, version=version)
+
+    def get_many(self, keys, version=None):
+        return self._call('get_many', keys, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set_many', data, self._timeout(timeout), version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._call('delete_many', keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._call('has_key', key, version=version)
+
+    def clear(self):
+        self.fallback.clear()
+        return self._call('clear')
@@ -1,9 +1,23 @@
 from rest_framework.views import exception_handler
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
 from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError as DjangoValidationError
+import re
+from functools import lru_cache
+
+from django.apps import apps
+from django.db import IntegrityError
 
 def custom_exception_handler(exc, context):
 
+    # full_clean() in the views and the constraints of the database raise
+    # errors DRF doesn't know, give them the shape of the serializer errors
+    if isinstance(exc, DjangoValidationError):
+        exc = ValidationError(exc.message_dict if hasattr(exc, 'error_dict') else exc.messages)
+    elif isinstance(exc, IntegrityError) and _constraint_error(exc):
+        exc = ValidationError(_constraint_error(exc))
+
     handlers = {
         'ValidationError' : _handle_generic_error,
         'Http404' : _handle_generic_error,
@@ -27,6 +41,44 @@ def custom_exception_handler(exc, context):
 
     return response
 
+# SQLite doesn't name the constraint, only its columns
+SQLITE_UNIQUE = re.compile(r'UNIQUE constraint failed: (.+)')
+
+@lru_cache(maxsize=None)
+def _constraint_errors():
+    """
+        constraints with a violation_error_message
+        => list of (name, table, columns, {first field: [message]})
+    """
+    errors = []
+    for model in apps.get_models():
+        for constraint in model._meta.constraints:
+            message = constraint.violation_error_message
+            if getattr(constraint, 'fields', None) and message != constraint.default_violation_error_message:
+                columns = frozenset(model._meta.get_field(field).column for field in constraint.fields)
+                errors.append((constraint.name, model._meta.db_table, columns, {constraint.fields[0]: [message]}))
+    return errors
+
+def _sqlite_columns(message):
+    # 'UNIQUE constraint failed: livres_livre.titre, livres_livre.auteur_id' => (table, {columns})
+    match = SQLITE_UNIQUE.search(message)
+    if not match:
+        return None
+    colonnes = [colonne.strip().rsplit('.', 1) for colonne in match.group(1).split(',')]
+    tables = {colonne[0] for colonne in colonnes}
+    if len(tables) != 1 or any(len(colonne) != 2 for colonne in colonnes):
+        return None
+    return tables.pop(), frozenset(colonne[1] for colonne in colonnes)
+
+def _constraint_error(exc):
+    # PostgreSQL names the constraint in its message, SQLite lists its columns
+    message = str(exc)
+    columns = _sqlite_columns(message)
+    for name, table, constraint_columns, error in _constraint_errors():
+        if name in message or columns == (table, constraint_columns):
+            return error
+    return None
+
 def _handle_authentication_error(exc, context, response):
     if response : 
         response.data = {
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 20:59
+
+from django.db import migrations, models
+
+
+COUNTED_MODELS = [('livres', 'livre'), ('emprunts', 'emprunt'), ('emprunts', 'avis')]
+
+def create_compteurs(apps, schema_editor):
+    Compteur = apps.get_model('api', 'Compteur')
+    for app_label, model_name in COUNTED_MODELS:
+        model = apps.get_model(app_label, model_name)
+        Compteur.objects.create(modele='%s.%s' % (app_label, model_name), lignes=model.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('livres', '0014_livre_disponible'),
+        ('emprunts', '0008_emprunt_avis_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Compteur',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(max_length=255, unique=True)),
+                ('lignes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_compteurs, migrations.RunPython.noop),
+    ]
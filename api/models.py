@@ -0,0 +1,26 @@
+from django.db import models
+from django.db.models import F
+
+class Compteur(models.Model):
+    """
+        Number of rows of a table, maintained by signals so the unfiltered
+        lists don't run a COUNT(*).
+        modele is the label of the model (livres.livre, emprunts.emprunt...)
+    """
+    modele = models.CharField(max_length=255, unique=True)
+    lignes = models.BigIntegerField(default=0)
+
+    @classmethod
+    def lignes_de(cls, model):
+        """
+            Returns the number of rows of model, counted once when the Compteur doesn't exist yet
+        """
+        label = model._meta.label_lower
+        compteur = cls.objects.filter(modele=label).first()
+        if compteur is None:
+            compteur, created = cls.objects.get_or_create(modele=label, defaults={'lignes': model.objects.count()})
+        return compteur.lignes
+
+    @classmethod
+    def ajouter(cls, model, nombre):
+        cls.objects.filter(modele=model._meta.label_lower).update(lignes=F('lignes') + nombre)
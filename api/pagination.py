@@ -1,27 +1,303 @@
-from rest_framework import pagination
+import base64
+import hashlib
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework import pagination, filters
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+from api.cache import get_generation
+from api.models import Compteur
+
+# Counts
+#
+# COUNT(*) over a whole table is what makes the first pages slow on big tables.
+# Unfiltered lists of ROW_COUNTED_MODELS read the number of rows maintained in
+# Compteur, other counts are cached under the generation of their model (bumped
+# by the receivers of livres/signals.py and emprunts/signals.py), and may lag
+# behind changes to the related tables for COUNT_CACHE_TIME seconds at most.
+
+COUNT_CACHE_TIME = 300
+ROW_COUNTED_MODELS = ['livres.livre', 'emprunts.emprunt', 'emprunts.avis']
+
+def count_key(queryset):
+    label = queryset.model._meta.label_lower
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(('%s %r' % (sql, params)).encode()).hexdigest()
+    return 'count-%s-%s-%s' % (label, get_generation(label), digest)
+
+def fast_count(queryset):
+    """
+        Returns the number of rows of queryset without running COUNT(*)
+        when it can be avoided.
+    """
+    if queryset.query.is_empty():
+        return 0
+
+    model = queryset.model
+    if not queryset.query.where and model._meta.label_lower in ROW_COUNTED_MODELS:
+        return Compteur.lignes_de(model)
+
+    key = count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIME)
+    return count
+
+class CountingPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return fast_count(self.object_list)
+        return len(self.object_list)
+
+class CountMixin:
+    """
+        Page number pagination counting with fast_count.
+        With ?count=false no count is made at all: one more row than the page
+        size is read to know if there is a next page, and count is null.
+    """
+    django_paginator_class = CountingPaginator
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.exact_count = request.query_params.get(self.count_query_param) not in ['false', '0']
+        if self.exact_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+            if self.page_number < 1:
+                raise ValueError()
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param), message='Invalid page.',
+            ))
+
+        offset = (self.page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        if not results and self.page_number > 1:
+            raise NotFound(self.invalid_page_message.format(page_number=self.page_number, message='That page contains no results'))
+
+        self.has_next = len(results) > page_size
+        return results[:page_size]
+
+    def get_next_link(self):
+        if self.exact_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.exact_count:
+            return super().get_previous_link()
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.exact_count:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': None,
+            'has_next': self.has_next,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+class KeysetPagination(pagination.BasePagination):
+    """
+        Keyset (cursor) pagination: a page is read with WHERE (ordering values)
+        after / before the ones of the last row seen, so page 1000 costs the same
+        as page 1 and rows inserted meanwhile don't shift the pages.
+
+        The ordering is the one given by OrderingFilter (?ordering=) followed by
+        pk as a tiebreaker, NULL values come first in ascending order and last
+        in descending order. Cursors are opaque base64 strings.
+    """
+    page_size = 3
+    page_size_query_param = 'page_size'
+    max_page_size = 5
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if cursor:
+            queryset = queryset.filter(self.after(cursor['v'], reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.first = self.position(results[0]) if results else None
+        self.last = self.position(results[-1]) if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+            Returns [(field, descending)], ending with ('pk', False).
+        """
+        ordering = filters.OrderingFilter().get_ordering(request, queryset, view) or []
+        fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        fields = [(name, descending) for name, descending in fields if name not in ['pk', 'id']]
+        return fields + [('pk', False)]
+
+    def order_by(self, reverse):
+        return [
+            F(name).desc(nulls_last=True) if descending != reverse else F(name).asc(nulls_first=True)
+            for name, descending in self.ordering
+        ]
+
+    def after(self, values, reverse):
+        """
+            Lexicographic condition: (f1, f2, ...) comes after (v1, v2, ...)
+            in the ordering (before it when reverse is True).
+        """
+        conditions = []
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            if descending != reverse:
+                # NULL last
+                if value is not None:
+                    conditions.append(equal & (Q(**{name + '__lt': value}) | Q(**{name + '__isnull': True})))
+            else:
+                # NULL first
+                if value is None:
+                    conditions.append(equal & Q(**{name + '__isnull': False}))
+                else:
+                    conditions.append(equal & Q(**{name + '__gt': value}))
+
+            equal &= Q(**{name + '__isnull': True}) if value is None else Q(**{name: value})
+
+        return reduce(or_, conditions, Q(pk__in=[]))
+
+    def position(self, obj):
+        values = []
+        for name, descending in self.ordering:
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr, None) if value is not None else None
+            values.append(value)
+        return values
+
+    def encode_cursor(self, values, reverse):
+        data = {'o': self.ordering, 'v': values, 'r': reverse}
+        return base64.urlsafe_b64encode(json.dumps(data, default=str).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if [tuple(field) for field in data['o']] != self.ordering or len(data['v']) != len(self.ordering):
+                raise ValueError()
+            return {'v': data['v'], 'r': bool(data['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.last, False))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.first, True))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+class KeysetSelectableMixin:
+    """
+        Page number pagination that switches to KeysetPagination when the
+        client asks for it with ?pagination=cursor, or follows a cursor link.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if request.query_params.get('pagination') == 'cursor' or self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            self.keyset.page_size = self.page_size
+            self.keyset.page_size_query_param = self.page_size_query_param
+            self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
 
-class LivrePagination(pagination.PageNumberPagination):
+class LivrePagination(KeysetSelectableMixin, CountMixin, pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'page_size'
     max_page_size = 5
 
-class CategoriePagination(pagination.PageNumberPagination):
+class CategoriePagination(CountMixin, pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'page_size'
     max_page_size = 5
 
-class EmpruntPagination(pagination.PageNumberPagination):
+class EmpruntPagination(KeysetSelectableMixin, CountMixin, pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'page_size'
     max_page_size = 5
 
-class AvisPagination(pagination.PageNumberPagination):
+class AvisPagination(KeysetSelectableMixin, CountMixin, pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'page_size'
     max_page_size = 5
 
-class MembrePagination(pagination.PageNumberPagination):
+class MembrePagination(CountMixin, pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'page_size'
     max_page_size = 5
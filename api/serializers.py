@@ -0,0 +1,45 @@
+from rest_framework import serializers
+
+def eager_loading_lookups(serializer, prefix=''):
+    """
+        Returns the select_related and prefetch_related lookups needed to
+        serialize without extra queries, read from the nested serializers
+        declared on serializer (many=True relations are prefetched).
+
+        example:
+            eager_loading_lookups(LivreSerializer())
+            => (['auteur', 'createur'], ['categorie'])
+    """
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.source == '*':
+            continue
+
+        source = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            child_select, child_prefetch = eager_loading_lookups(field.child, source + '__')
+            prefetch += [source] + child_select + child_prefetch
+        elif isinstance(field, serializers.BaseSerializer):
+            child_select, child_prefetch = eager_loading_lookups(field, source + '__')
+            select += [source] + child_select
+            prefetch += child_prefetch
+
+    return select, prefetch
+
+class EagerLoadingMixin:
+    """
+        Serializer mixin that loads the nested relations it declares in a
+        constant number of queries.
+
+        example:
+            queryset = LivreSerializer.setup_eager_loading(Livre.objects.all())
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select, prefetch = eager_loading_lookups(cls())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
@@ -0,0 +1,108 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+# Streamed exports: rows (dicts, usually from queryset.values().iterator())
+# are encoded one at a time, the response never holds more than a chunk.
+
+STREAM_CHUNK_SIZE = 2000 # rows fetched from the database at once
+STREAM_FORMATS = ['ndjson', 'csv']
+STREAM_BUFFER_SIZE = 65536 # bytes written to the client at once
+GZIP_LEVEL = 6
+
+class _Echo:
+    # file-like object for csv.writer, returns the line instead of storing it
+    def write(self, value):
+        return value
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+def csv_lines(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+def buffered(lines, size=STREAM_BUFFER_SIZE):
+    """
+        Encodes the lines and groups them in chunks of about size bytes,
+        instead of one write per line.
+    """
+    buffer, length = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+def gzipped(chunks, level=GZIP_LEVEL):
+    # compressobj keeps only its window between chunks, the gzip body is never built in memory
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+def stream_rows(rows, columns, output='ndjson', filename='export', compress=False):
+    """
+        Returns a StreamingHttpResponse writing rows as NDJSON (one JSON object
+        per line) or CSV (columns as header), gzipped on the fly when compress is True.
+
+        example:
+            stream_rows(Emprunt.objects.values('pk', 'date_ret').iterator(chunk_size=STREAM_CHUNK_SIZE), ['pk', 'date_ret'], 'csv')
+            => pk,date_ret
+               1,2025-01-01
+    """
+    if output == 'csv':
+        content = buffered(csv_lines(rows, columns))
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content = buffered(ndjson_lines(rows))
+        content_type = 'application/x-ndjson; charset=utf-8'
+
+    if compress:
+        content = gzipped(content)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    if output == 'csv':
+        response['Content-Disposition'] = 'attachment; filename="%s.csv"' % (filename)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+def stream_queryset(request, queryset, columns, filename='export'):
+    """
+        Streams the columns of queryset in the format asked by ?output=ndjson|csv
+        (400 for any other), gzipped when the client accepts it.
+
+        param:
+            - Request request
+            - QuerySet queryset, already filtered and ordered
+            - dict columns, name of the column => field (or lookup) of the model
+            - str filename, name of the CSV attachment
+    """
+    output = request.query_params.get('output', 'ndjson')
+    if output not in STREAM_FORMATS:
+        return Response({'output': ['Must be one of %s.' % (', '.join(STREAM_FORMATS))]}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = queryset.values(*columns.values()).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    rows = ({name: row[field] for name, field in columns.items()} for row in rows)
+    return stream_rows(rows, list(columns), output, filename, compress=accepts_gzip(request))
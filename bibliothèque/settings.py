@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'api',
     'livres',
     'rest_framework',
     'rest_framework.authtoken',
@@ -44,7 +45,9 @@ INSTALLED_APPS = [
     'django_filters',
     'drf_spectacular',
     "debug_toolbar",
-    'emprunts'
+    'emprunts',
+    'statistiques',
+    'recommandations',
 ]
 
 MIDDLEWARE = [
@@ -163,8 +166,30 @@ SPECTACULAR_SETTINGS = {
 }
 
 CACHES = {
+    # in-process LRU in front of memcached, see api/cache_backends.py
     'default': {
+        "BACKEND": "api.cache_backends.TieredCache",
+        "OPTIONS": {
+            "REMOTE": "memcached",
+            "MAX_ENTRIES": 1000,
+            "LOCAL_TIMEOUT": 5,
+        },
+    },
+    # circuit breaker and local fallback when memcached is unavailable
+    'memcached': {
+        "BACKEND": "api.cache_backends.ResilientCache",
+        "OPTIONS": {
+            "PRIMARY": "memcached-server",
+            "FAILURE_THRESHOLD": 3,
+            "RECOVERY_TIMEOUT": 30,
+        },
+    },
+    'memcached-server': {
         "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
         "LOCATION": "127.0.0.1:11211",
-    }
+        "OPTIONS": {
+            "connect_timeout": 0.2,
+            "timeout": 0.2,
+        },
+    },
 }
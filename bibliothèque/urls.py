@@ -24,7 +24,8 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, Spec
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('livres.urls')),
-    path('', include('emprunts.urls')),
+    path('', include('emprunts.urls', namespace='emprunts')),
+    path('', include('statistiques.urls')),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('api-token-auth/', views.obtain_auth_token, name='token-auth'),
     # YOUR PATTERNS
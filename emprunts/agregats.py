@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import F, Q, Value, Case, When, FloatField, IntegerField, BooleanField, Count, Sum, Subquery, OuterRef
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from livres.models import Livre
+from livres.cache import invalidate_livres_details, invalidate_livres_lists
+from .models import Avis, Emprunt
+
+# Aggregates of Livre (note_moyenne, nb_avis, nb_emprunts, disponible) kept up to date
+# with F() expressions by the receivers of emprunts/signals.py, so the lists
+# of Livre never aggregate the Avis and Emprunt tables.
+#
+# note_moyenne is somme_notes / nb_notes (Avis without note are not counted),
+# disponible is emprunts_en_cours == 0 (Emprunt without retourne date).
+# recalculer() rebuilds everything from the Avis and Emprunt tables.
+# Only the cached details of the Livre are evicted, the cached lists show the
+# new values after LISTS_CACHE_TIME seconds at most (livres/cache.py), except
+# for disponible: ?disponible= filters on it, the lists are evicted when it changes.
+
+def _moyenne(somme, nb):
+    return Cast(somme, FloatField()) / NullIf(nb, Value(0))
+
+def ajouter_avis(livre_id, note, nombre=1):
+    """
+        Adds (nombre=1) or removes (nombre=-1) an Avis of note to the Livre livre_id.
+    """
+    if livre_id is None:
+        return
+
+    changes = {'nb_avis': F('nb_avis') + nombre}
+    if note is not None:
+        somme = F('somme_notes') + note * nombre
+        nb = F('nb_notes') + nombre
+        changes.update(somme_notes=somme, nb_notes=nb, note_moyenne=_moyenne(somme, nb))
+
+    Livre.objects.filter(pk=livre_id).update(**changes)
+
+def ajouter_emprunt(livre_id, en_cours, nombre=1):
+    """
+        Adds (nombre=1) or removes (nombre=-1) an Emprunt to the Livre livre_id,
+        en_cours when it is not returned yet.
+        return: True when disponible changed
+    """
+    if livre_id is None:
+        return False
+
+    changes = {'nb_emprunts': F('nb_emprunts') + nombre}
+    if en_cours:
+        changes.update(
+            emprunts_en_cours=F('emprunts_en_cours') + nombre,
+            # compared with the value before the update
+            disponible=Case(When(emprunts_en_cours__lte=-nombre, then=Value(True)), default=Value(False)),
+        )
+
+    Livre.objects.filter(pk=livre_id).update(**changes)
+
+    # the first Emprunt in progress or the last one returned
+    change = en_cours and Livre.objects.filter(pk=livre_id, emprunts_en_cours=1 if nombre > 0 else 0).exists()
+    if change:
+        transaction.on_commit(invalidate_livres_lists)
+    return change
+
+def _total(model, aggregate, **filters):
+    return Coalesce(Subquery(
+        model.objects.filter(livre=OuterRef('pk'), **filters).order_by().values('livre').annotate(total=aggregate).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+def recalculer(livres=None):
+    """
+        Recomputes the aggregates of livres (every Livre by default) in a single UPDATE.
+        return: the number of Livre updated
+    """
+    livres = Livre.objects.all() if livres is None else livres
+    count = livres.update(
+        nb_avis=_total(Avis, Count('pk')),
+        nb_emprunts=_total(Emprunt, Count('pk')),
+        somme_notes=_total(Avis, Sum('note')),
+        nb_notes=_total(Avis, Count('note')),
+        emprunts_en_cours=_total(Emprunt, Count('pk'), retourne__isnull=True),
+    )
+    change = livres.filter(Q(disponible=True, emprunts_en_cours__gt=0) | Q(disponible=False, emprunts_en_cours=0)).exists()
+    livres.update(
+        note_moyenne=_moyenne(F('somme_notes'), F('nb_notes')),
+        disponible=Q(emprunts_en_cours=0),
+    )
+    pks = list(livres.values_list('pk', flat=True))
+    transaction.on_commit(lambda: invalidate_livres_details(pks))
+    if change:
+        transaction.on_commit(invalidate_livres_lists)
+    return count
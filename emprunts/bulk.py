@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from api.cache import bump_generation
+from livres.models import Livre
+from api.models import Compteur
+from livres.bulk import PK_ERROR, BATCH_SIZE
+from .models import Emprunt
+from . import agregats
+
+# Loans of a whole cart at the counter desk (POST /emprunts/bulk-return/,
+# /emprunts/bulk-checkout/).
+#
+# The Emprunt are returned with one UPDATE ... WHERE id IN and created with one
+# bulk_create. The receivers of emprunts/signals.py don't run for those, so the
+# Compteur and the aggregates of the Livre (agregats.recalculer() on the Livre
+# of the cart) are updated here, in the same transaction, and the generation of
+# the cached counts once it is committed. recalculer() also evicts the Livre
+# lists once committed when the cart changes disponible.
+
+DUREE_EMPRUNT = 21 # days, date_ret of a loan when none is given
+
+ALREADY_RETURNED_ERROR = 'Emprunt "%(pk)s" is already returned.'
+OWNER_ERROR = 'Emprunt "%(pk)s" belongs to another Membre.'
+UNAVAILABLE_ERROR = 'Livre "%(pk)s" is not available.'
+
+def _apres_modification(livres):
+    agregats.recalculer(Livre.objects.filter(pk__in={pk for pk in livres if pk is not None}))
+    # once committed: nothing is evicted by a rollback, nor cached again from the previous rows
+    transaction.on_commit(lambda: bump_generation(Emprunt._meta.label_lower))
+
+def verifier_retours(pks, membre=None):
+    """
+        Checks the Emprunt of a cart with one query per BATCH_SIZE Emprunt.
+
+        param:
+            - list pks, pk of the Emprunt
+            - Membre membre, owner of every Emprunt (None for the staff)
+        return:
+            (errors, forbidden), dicts {'emprunts': [...]}, empty when everything is valid
+    """
+    pks = list(pks)
+    emprunts = {}
+    for start in range(0, len(pks), BATCH_SIZE):
+        emprunts.update(Emprunt.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).values_list('pk', 'membre'))
+    errors, forbidden = {}, {}
+
+    manquants = sorted(set(pks) - set(emprunts))
+    if manquants:
+        errors['emprunts'] = [PK_ERROR % {'pk': pk} for pk in manquants]
+
+    if membre is not None:
+        interdits = sorted(pk for pk, membre_id in emprunts.items() if membre_id != membre.pk)
+        if interdits:
+            forbidden['emprunts'] = [OWNER_ERROR % {'pk': pk} for pk in interdits]
+
+    return errors, forbidden
+
+def retourner(pks, retourne=None):
+    """
+        Sets retourne on the Emprunt of pks that are not returned yet.
+
+        return:
+            (pk of the Emprunt returned, pk of the ones already returned)
+    """
+    retourne = retourne or date.today()
+    pks = list(pks)
+
+    with transaction.atomic():
+        ouverts = []
+        for start in range(0, len(pks), BATCH_SIZE):
+            ouverts += Emprunt.objects.select_for_update().filter(
+                pk__in=pks[start:start + BATCH_SIZE], retourne__isnull=True,
+            ).values_list('pk', 'livre')
+
+        retournes = [pk for pk, livre in ouverts]
+        for start in range(0, len(retournes), BATCH_SIZE):
+            Emprunt.objects.filter(pk__in=retournes[start:start + BATCH_SIZE]).update(retourne=retourne)
+
+        if retournes:
+            _apres_modification(livre for pk, livre in ouverts)
+
+    return retournes, sorted(set(pks) - set(retournes))
+
+def verifier_livres(livres):
+    """
+        Checks that the Livre of a cart exist, with one query per BATCH_SIZE Livre.
+    """
+    livres = list(livres)
+    existants = set()
+    for start in range(0, len(livres), BATCH_SIZE):
+        existants.update(Livre.objects.filter(pk__in=livres[start:start + BATCH_SIZE]).values_list('pk', flat=True))
+    manquants = sorted(set(livres) - existants)
+    return {'livres': [PK_ERROR % {'pk': pk} for pk in manquants]} if manquants else {}
+
+def emprunter(membre, livres, date_ret=None):
+    """
+        Creates one Emprunt per Livre for membre, unless one of them is borrowed
+        already (disponible is False): then nothing is created.
+
+        return:
+            (the Emprunt created, pk of the Livre not available)
+    """
+    date_emp = date.today()
+    date_ret = date_ret or date_emp + timedelta(days=DUREE_EMPRUNT)
+
+    with transaction.atomic():
+        # the rows of the Livre are locked until the Emprunt exist (no-op on SQLite)
+        disponibles = set()
+        for start in range(0, len(livres), BATCH_SIZE):
+            disponibles.update(
+                Livre.objects.select_for_update().filter(pk__in=livres[start:start + BATCH_SIZE], disponible=True)
+                .values_list('pk', flat=True)
+            )
+        indisponibles = sorted(set(livres) - disponibles)
+        if indisponibles:
+            return [], indisponibles
+
+        emprunts = Emprunt.objects.bulk_create([
+            Emprunt(membre=membre, livre_id=livre, date_emp=date_emp, date_ret=date_ret)
+            for livre in livres
+        ], batch_size=BATCH_SIZE)
+        Compteur.ajouter(Emprunt, len(emprunts))
+        _apres_modification(livres)
+
+    return emprunts, []
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from livres.models import Livre
+from livres.cache import invalidate_livres_lists
+from emprunts import agregats
+
+class Command(BaseCommand):
+    help = 'Recomputes note_moyenne, nb_avis and nb_emprunts of the Livre from the Avis and Emprunt tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('livres', nargs='*', type=int, help='ids of the Livre (every Livre by default)')
+
+    def handle(self, *args, **options):
+        livres = Livre.objects.filter(pk__in=options['livres']) if options['livres'] else None
+        count = agregats.recalculer(livres)
+        # the lists would show the rebuilt values after LISTS_CACHE_TIME only
+        invalidate_livres_lists()
+        self.stdout.write(self.style.SUCCESS('%s livre(s) updated' % (count)))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emprunts', '0007_alter_avis_note'),
+        ('livres', '0011_auteur_nom_prenom_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(fields=['livre', 'note'], name='avis_livre_note_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(fields=['membre', 'note'], name='avis_membre_note_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['membre', 'date_emp'], name='emprunt_membre_date_emp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['livre', 'date_emp'], name='emprunt_livre_date_emp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('retourne__isnull', True)), fields=['livre'], name='emprunt_livre_ouvert_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('retourne__isnull', True)), fields=['date_ret'], name='emprunt_ouvert_date_ret_idx'),
+        ),
+    ]
@@ -14,9 +14,26 @@ class Avis(models.Model):
     note = models.PositiveIntegerField(blank=True, null=True)
     commentaire = models.CharField(max_length=5000, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # reviews of a livre / of a membre ordered by note
+            models.Index(fields=['livre', 'note'], name='avis_livre_note_idx'),
+            models.Index(fields=['membre', 'note'], name='avis_membre_note_idx'),
+        ]
+
 class Emprunt(models.Model):
     membre = models.ForeignKey(Membre, on_delete=models.CASCADE, blank=True, null=True)
     livre = models.ForeignKey(Livre, on_delete=models.CASCADE, blank=True, null=True)
     date_emp = models.DateField(blank=True, null=True, max_length=10)
     date_ret = models.DateField(blank=True, null=True, max_length=10)
-    retourne = models.DateField(blank=True, null=True)
\ No newline at end of file
+    retourne = models.DateField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # loans of a membre / of a livre ordered by date_emp
+            models.Index(fields=['membre', 'date_emp'], name='emprunt_membre_date_emp_idx'),
+            models.Index(fields=['livre', 'date_emp'], name='emprunt_livre_date_emp_idx'),
+            # open loans (not returned yet): per livre, and by date_ret for the overdue ones
+            models.Index(fields=['livre'], condition=models.Q(retourne__isnull=True), name='emprunt_livre_ouvert_idx'),
+            models.Index(fields=['date_ret'], condition=models.Q(retourne__isnull=True), name='emprunt_ouvert_date_ret_idx'),
+        ]
@@ -1,5 +1,19 @@
 from rest_framework import permissions
 from django.contrib.auth.models import AnonymousUser
+from .models import Membre
+
+def get_membre(request):
+    """
+        Returns the Membre of the authenticated user, or None.
+        The lookup is done once per request and shared by permissions and views.
+    """
+    if not hasattr(request, '_membre'):
+        try:
+            request._membre = request.user.membre
+        except (Membre.DoesNotExist, AttributeError):
+            request._membre = None
+
+    return request._membre
 
 class IsAdminOrMembreToBookOrShareOpinion(permissions.BasePermission):
     
@@ -8,21 +22,23 @@ class IsAdminOrMembreToBookOrShareOpinion(permissions.BasePermission):
             return True
         
         if request.method == 'POST':
-            try:
-                return request.user.membre
-            except:
-                return False
+            return get_membre(request) is not None
             
         return True 
    
+def _belongs_to(obj, request):
+    # compares ids, obj.membre and its user are not needed
+    membre = get_membre(request)
+    return membre is not None and obj.membre_id == membre.pk
+
 class IsAdminOrEmpruntBelongsToMember(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         if request.user.is_staff:
             return True
     
-        if obj.membre:
-            return obj.membre.user.id == request.user.id  
+        if obj.membre_id:
+            return _belongs_to(obj, request)
         
         return True
     
@@ -32,8 +48,8 @@ class IsAdminOrAvisBelongsToMember(permissions.BasePermission):
             return True
         
         if request.method in ['PUT', 'PATCH', 'DELETE']:
-            if obj.membre:
-                return obj.membre.user.id == request.user.id  
+            if obj.membre_id:
+                return _belongs_to(obj, request)
         
         return True
 
@@ -44,4 +60,15 @@ class IsAdminOrOwnerToReadMemberInfo(permissions.BasePermission):
             return True
         
         return obj.user_id == request.user.id
-        
\ No newline at end of file
+        
+class IsAdminOrSelfMembre(permissions.BasePermission):
+    """
+        Staff, or the Membre whose pk is in the url.
+    """
+
+    def has_permission(self, request, view):
+        if request.user.is_staff:
+            return True
+
+        membre = get_membre(request)
+        return membre is not None and str(membre.pk) == str(view.kwargs.get('pk'))
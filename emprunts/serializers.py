@@ -1,7 +1,13 @@
+from django.db.models import Prefetch, Subquery, OuterRef, Count
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
 from .models import *
 from livres.serializers import LivreItemSerializer, UserItemSerializer
+from api.serializers import EagerLoadingMixin
+
+MEMBRE_NESTED_LIMIT = 5 # number of most recent Emprunt / Avis embedded in a Membre
 
 class MembreItemSerializer(serializers.Serializer):
     """
@@ -29,7 +35,7 @@ class EmpruntItemSerializer(serializers.Serializer):
     date_ret = serializers.DateField(read_only=True)
     retourne = serializers.DateField(read_only=True)
 
-class EmpruntSerializer(serializers.ModelSerializer):
+class EmpruntSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     membre = MembreItemSerializer(read_only=True)
     livre = LivreItemSerializer(read_only=True)
     class Meta:
@@ -44,10 +50,18 @@ class EmpruntSerializer(serializers.ModelSerializer):
         ]
 
 
-class MembreSerializer(serializers.ModelSerializer):
+class MembreSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """
+        Serializer of a Membre with its MEMBRE_NESTED_LIMIT most recent Emprunt
+        and Avis, their counts and the links to the paged lists of all of them.
+    """
     user = UserItemSerializer(read_only=True)
-    avis_set = AvisItemSerializer(read_only=True, many=True)
-    emprunt_set = EmpruntItemSerializer(read_only=True, many=True)
+    avis_set = AvisItemSerializer(read_only=True, many=True, source='derniers_avis')
+    emprunt_set = EmpruntItemSerializer(read_only=True, many=True, source='derniers_emprunts')
+    nb_avis = serializers.IntegerField(read_only=True)
+    nb_emprunts = serializers.IntegerField(read_only=True)
+    avis_url = serializers.SerializerMethodField()
+    emprunts_url = serializers.SerializerMethodField()
     class Meta:
         model = Membre
         fields = [
@@ -55,11 +69,44 @@ class MembreSerializer(serializers.ModelSerializer):
             'user',
             'adresse',
             'telephone',
+            'nb_avis',
             'avis_set',
+            'avis_url',
+            'nb_emprunts',
             'emprunt_set',
+            'emprunts_url',
         ]
 
-class AvisSerializer(serializers.ModelSerializer):
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related('user').prefetch_related(
+            Prefetch(
+                'emprunt_set',
+                queryset=Emprunt.objects.order_by('-date_emp', '-pk')[:MEMBRE_NESTED_LIMIT],
+                to_attr='derniers_emprunts',
+            ),
+            Prefetch(
+                'avis_set',
+                queryset=Avis.objects.order_by('-pk')[:MEMBRE_NESTED_LIMIT],
+                to_attr='derniers_avis',
+            ),
+        ).annotate(
+            nb_emprunts=_count_by_membre(Emprunt),
+            nb_avis=_count_by_membre(Avis),
+        )
+
+    def get_avis_url(self, obj):
+        return reverse('emprunts:membres-avis-list', kwargs={'membres_pk': obj.pk}, request=self.context.get('request'))
+
+    def get_emprunts_url(self, obj):
+        return reverse('emprunts:membres-emprunts-list', kwargs={'membres_pk': obj.pk}, request=self.context.get('request'))
+
+def _count_by_membre(model):
+    # correlated COUNT, avoids joining the Emprunt and Avis tables together
+    rows = model.objects.filter(membre=OuterRef('pk')).order_by().values('membre')
+    return Coalesce(Subquery(rows.annotate(nb=Count('pk')).values('nb')), 0)
+
+class AvisSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     membre = MembreItemSerializer(read_only=True)
     livre = LivreItemSerializer(read_only=True)
     class Meta:
@@ -71,3 +118,24 @@ class AvisSerializer(serializers.ModelSerializer):
             'membre',
             'livre',
         ]
+
+class BulkReturnSerializer(serializers.Serializer):
+    """
+        Body of POST /emprunts/bulk-return/, retourne is today by default.
+    """
+    emprunts = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    retourne = serializers.DateField(required=False)
+
+class BulkCheckoutSerializer(serializers.Serializer):
+    """
+        Body of POST /emprunts/bulk-checkout/, membre is only given by the staff
+        (a Membre borrows for themself), date_ret is in DUREE_EMPRUNT days by default.
+    """
+    membre = serializers.IntegerField(required=False)
+    livres = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    date_ret = serializers.DateField(required=False)
+
+    def validate_livres(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError('A Livre can only be borrowed once per cart.')
+        return value
@@ -0,0 +1,98 @@
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from api.cache import bump_generation
+from livres.cache import invalidate_livres_details
+from api.models import Compteur
+from .models import Membre, Emprunt, Avis
+from . import agregats
+
+# Receivers that keep the Compteur of Emprunt and Avis, the generations
+# of the cached counts (api/pagination.py) and the aggregates of Livre
+# (emprunts/agregats.py) up to date.
+
+@receiver(post_save, sender=Emprunt)
+@receiver(post_save, sender=Avis)
+def emprunt_or_avis_created(sender, instance, created, **kwargs):
+    if created:
+        Compteur.ajouter(sender, 1)
+
+@receiver(post_delete, sender=Emprunt)
+@receiver(post_delete, sender=Avis)
+def emprunt_or_avis_deleted(sender, instance, **kwargs):
+    Compteur.ajouter(sender, -1)
+
+@receiver(post_save, sender=Membre)
+@receiver(post_save, sender=Emprunt)
+@receiver(post_save, sender=Avis)
+@receiver(post_delete, sender=Membre)
+@receiver(post_delete, sender=Emprunt)
+@receiver(post_delete, sender=Avis)
+def emprunts_changed(sender, instance, **kwargs):
+    # after the commit, a request can't cache the previous rows under the new generation
+    transaction.on_commit(lambda: bump_generation(sender._meta.label_lower))
+
+# Aggregates of Livre: every instance remembers the values it was loaded
+# (or last saved) with, so an update only moves what changed. Instances
+# loaded with deferred fields read them from the database before saving.
+
+def _etat_avis(avis):
+    return (avis.livre_id, avis.note)
+
+def _etat_emprunt(emprunt):
+    return (emprunt.livre_id, emprunt.retourne is None)
+
+ETATS = {Avis: _etat_avis, Emprunt: _etat_emprunt}
+
+@receiver(post_init, sender=Avis)
+@receiver(post_init, sender=Emprunt)
+def remember_agregat(sender, instance, **kwargs):
+    if not instance.get_deferred_fields():
+        instance._agregat = ETATS[sender](instance)
+
+@receiver(pre_save, sender=Avis)
+@receiver(pre_save, sender=Emprunt)
+def load_agregat(sender, instance, **kwargs):
+    if not hasattr(instance, '_agregat') and not instance._state.adding:
+        ancien = sender.objects.filter(pk=instance.pk).first()
+        instance._agregat = ETATS[sender](ancien) if ancien else None
+
+def _invalidate(livres_pks):
+    livres_pks = {pk for pk in livres_pks if pk is not None}
+    if livres_pks:
+        transaction.on_commit(lambda: invalidate_livres_details(livres_pks))
+
+@receiver(post_save, sender=Avis)
+def avis_saved(sender, instance, created, **kwargs):
+    ancien = None if created else instance._agregat
+    nouveau = _etat_avis(instance)
+    if ancien != nouveau:
+        if ancien:
+            agregats.ajouter_avis(*ancien, nombre=-1)
+        agregats.ajouter_avis(*nouveau)
+        _invalidate([ancien[0] if ancien else None, nouveau[0]])
+    instance._agregat = nouveau
+
+@receiver(post_delete, sender=Avis)
+def avis_deleted(sender, instance, **kwargs):
+    livre_id, note = getattr(instance, '_agregat', None) or _etat_avis(instance)
+    agregats.ajouter_avis(livre_id, note, nombre=-1)
+    _invalidate([livre_id])
+
+@receiver(post_save, sender=Emprunt)
+def emprunt_saved(sender, instance, created, **kwargs):
+    ancien = None if created else instance._agregat
+    nouveau = _etat_emprunt(instance)
+    if ancien != nouveau:
+        if ancien:
+            agregats.ajouter_emprunt(*ancien, nombre=-1)
+        agregats.ajouter_emprunt(*nouveau)
+        _invalidate([ancien[0] if ancien else None, nouveau[0]])
+    instance._agregat = nouveau
+
+@receiver(post_delete, sender=Emprunt)
+def emprunt_deleted(sender, instance, **kwargs):
+    livre_id, en_cours = getattr(instance, '_agregat', None) or _etat_emprunt(instance)
+    agregats.ajouter_emprunt(livre_id, en_cours, nombre=-1)
+    _invalidate([livre_id])
@@ -1,3 +1,550 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import date, timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from livres.models import Livre, Auteur, User
+from .models import *
+from .serializers import MEMBRE_NESTED_LIMIT
+from api.models import Compteur
+from api.cache import get_generation
+from . import bulk, agregats
 
 # Create your tests here.
+
+#===================================================================================
+#API
+
+class MembreApiTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098')
+        self.client.force_authenticate(self.admin_user)
+
+    def create_membre(self, nb_emprunts):
+        user = User.objects.create_user(username='user%s' % User.objects.count(), password='1234')
+        membre = Membre.objects.create(user=user, adresse='Paris')
+        for i in range(nb_emprunts):
+            Emprunt.objects.create(membre=membre, livre=self.livre, date_emp='2025-01-%02d' % (i + 1))
+            Avis.objects.create(membre=membre, livre=self.livre, note=i % 5)
+        return membre
+
+    def test_list_constant_queries(self):
+        self.create_membre(2)
+        url = reverse('emprunts:membres-list', query={'page_size': 5})
+        # count, membres joined with user, emprunts, avis
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        # the generation of the cached count is bumped once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(4):
+                self.create_membre(3)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_nested_sets_are_capped(self):
+        membre = self.create_membre(MEMBRE_NESTED_LIMIT + 3)
+        response = self.client.get(reverse('emprunts:membres-detail', kwargs={'pk': membre.pk}))
+
+        self.assertEqual(response.data['nb_emprunts'], MEMBRE_NESTED_LIMIT + 3)
+        self.assertEqual(response.data['nb_avis'], MEMBRE_NESTED_LIMIT + 3)
+        self.assertEqual(len(response.data['emprunt_set']), MEMBRE_NESTED_LIMIT)
+        self.assertEqual(len(response.data['avis_set']), MEMBRE_NESTED_LIMIT)
+        self.assertEqual(response.data['emprunt_set'][0]['date_emp'], '2025-01-%02d' % (MEMBRE_NESTED_LIMIT + 3))
+        self.assertTrue(response.data['emprunts_url'].endswith('/membres/%s/emprunts/' % membre.pk))
+        self.assertTrue(response.data['avis_url'].endswith('/membres/%s/avis/' % membre.pk))
+
+class EmpruntAvisApiTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.users = [User.objects.create_user(username='user%s' % i, password='1234') for i in range(2)]
+        self.membres = [Membre.objects.create(user=user) for user in self.users]
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098')
+
+    def create_emprunts(self, count):
+        for i in range(count):
+            Emprunt.objects.create(membre=self.membres[0], livre=self.livre, date_emp='2025-01-01')
+            Avis.objects.create(membre=self.membres[0], livre=self.livre, note=4)
+
+    def test_list_constant_queries(self):
+        self.client.force_authenticate(self.admin_user)
+        for name in ['emprunts:emprunts-list', 'emprunts:avis-list']:
+            url = reverse(name, query={'page_size': 5})
+            self.create_emprunts(1)
+            # count, rows joined with membre, user and livre
+            with self.assertNumQueries(2):
+                self.client.get(url)
+
+            self.create_emprunts(4)
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), 5)
+
+    def test_member_list_constant_queries(self):
+        self.create_emprunts(3)
+        self.client.force_authenticate(User.objects.get(pk=self.users[0].pk))
+        # membre of the user, count, rows
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('emprunts:emprunts-list'))
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_object_permissions_use_ids(self):
+        self.create_emprunts(1)
+        emprunt = Emprunt.objects.first()
+        url = reverse('emprunts:emprunts-detail', kwargs={'pk': emprunt.pk})
+
+        self.client.force_authenticate(User.objects.get(pk=self.users[0].pk))
+        # emprunt joined with membre, user and livre, membre of the user
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+
+    def test_cursor_pagination(self):
+        self.client.force_authenticate(self.admin_user)
+        for i in range(7):
+            Emprunt.objects.create(membre=self.membres[0], livre=self.livre, date_ret=['2025-01-01', None][i % 2])
+
+        url = reverse('emprunts:emprunts-list', query={'pagination': 'cursor', 'ordering': '-date_ret'})
+        pks = []
+        while url:
+            response = self.client.get(url)
+            pks += [emprunt['pk'] for emprunt in response.data['results']]
+            url = response.data['next']
+
+        expected = list(Emprunt.objects.filter(date_ret__isnull=False).order_by('pk').values_list('pk', flat=True))
+        expected += list(Emprunt.objects.filter(date_ret__isnull=True).order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(pks, expected)
+
+#===================================================================================
+#Aggregates
+
+class AgregatsTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.membre = Membre.objects.create(adresse='Paris')
+        self.livres = [
+            Livre.objects.create(titre='titre1', isbn='1234567890098'),
+            Livre.objects.create(titre='titre2', isbn='1234567890099'),
+        ]
+        self.client.force_authenticate(self.admin_user)
+
+    def agregats(self, livre):
+        livre = Livre.objects.get(pk=livre.pk)
+        return (livre.note_moyenne, livre.nb_avis, livre.nb_emprunts)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_lists_kept(self):
+        # an Emprunt that doesn't change disponible evicts the detail of its Livre, not every cached list
+        detail = reverse('livres:livres-detail', args=[self.livres[0].pk])
+        self.assertEqual(self.client.get(detail).data['nb_emprunts'], 0)
+        generation = get_generation('livres.livre')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Emprunt.objects.create(membre=self.membre, livre=self.livres[0], date_emp='2025-01-01', retourne='2025-01-02')
+            # nothing is evicted before the commit
+            self.assertEqual(self.client.get(detail).data['nb_emprunts'], 0)
+        self.assertTrue(callbacks)
+        self.assertEqual(get_generation('livres.livre'), generation)
+        self.assertEqual(self.client.get(detail).data['nb_emprunts'], 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_disponible_lists(self):
+        def disponibles(valeur):
+            response = self.client.get(reverse('livres:livres-list'), {'disponible': valeur})
+            return response.data['count'], [livre['pk'] for livre in response.data['results']]
+
+        self.assertEqual(disponibles('true'), (2, [livre.pk for livre in self.livres]))
+        self.assertEqual(disponibles('false'), (0, []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emprunt = Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        self.assertEqual(disponibles('true'), (1, [self.livres[1].pk]))
+        self.assertEqual(disponibles('false'), (1, [self.livres[0].pk]))
+
+        # a second Emprunt doesn't change disponible, returning both of them does
+        generation = get_generation('livres.livre')
+        with self.captureOnCommitCallbacks(execute=True):
+            Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        self.assertEqual(get_generation('livres.livre'), generation)
+        with self.captureOnCommitCallbacks(execute=True):
+            Emprunt.objects.filter(livre=self.livres[0]).update(retourne='2025-01-01')
+            agregats.recalculer(Livre.objects.filter(pk=self.livres[0].pk))
+        self.assertEqual(disponibles('true'), (2, [livre.pk for livre in self.livres]))
+
+        # bulk checkout
+        self.client.force_authenticate(self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('emprunts:emprunts-bulk-checkout'), {'membre': self.membre.pk, 'livres': [self.livres[1].pk]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(disponibles('false'), (1, [self.livres[1].pk]))
+
+    def test_avis(self):
+        avis = Avis.objects.create(membre=self.membre, livre=self.livres[0], note=4)
+        Avis.objects.create(membre=self.membre, livre=self.livres[0], note=1)
+        Avis.objects.create(membre=self.membre, livre=self.livres[0])
+        self.assertEqual(self.agregats(self.livres[0]), (2.5, 3, 0))
+
+        avis.note = 2
+        avis.save()
+        self.assertEqual(self.agregats(self.livres[0]), (1.5, 3, 0))
+
+        response = self.client.patch(reverse('emprunts:avis-set-livre', kwargs={'pk': avis.pk, 'livre_pk': self.livres[1].pk}))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.agregats(self.livres[0]), (1.0, 2, 0))
+        self.assertEqual(self.agregats(self.livres[1]), (2.0, 1, 0))
+
+        Avis.objects.get(pk=avis.pk).delete()
+        self.assertEqual(self.agregats(self.livres[1]), (None, 0, 0))
+
+    def test_emprunts(self):
+        emprunt = Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        self.assertEqual(self.agregats(self.livres[0])[2], 2)
+
+        self.client.patch(reverse('emprunts:emprunts-set-livre', kwargs={'pk': emprunt.pk, 'livre_pk': self.livres[1].pk}))
+        self.assertEqual([self.agregats(livre)[2] for livre in self.livres], [1, 1])
+
+        self.client.patch(reverse('emprunts:emprunts-remove-livre', kwargs={'pk': emprunt.pk, 'livre_pk': self.livres[1].pk}))
+        self.assertEqual([self.agregats(livre)[2] for livre in self.livres], [1, 0])
+
+        # deferred fields are read back before saving
+        emprunt = Emprunt.objects.only('pk').get(pk=emprunt.pk)
+        emprunt.livre = self.livres[0]
+        emprunt.save()
+        self.assertEqual([self.agregats(livre)[2] for livre in self.livres], [2, 0])
+
+    def test_disponible(self):
+        emprunts = [Emprunt.objects.create(membre=self.membre, livre=self.livres[0], date_emp='2025-01-01') for i in range(2)]
+        Emprunt.objects.create(membre=self.membre, livre=self.livres[1], date_emp='2025-01-01', retourne='2025-01-02')
+        self.assertEqual([Livre.objects.get(pk=livre.pk).disponible for livre in self.livres], [False, True])
+
+        emprunts[0].retourne = '2025-01-10'
+        emprunts[0].save()
+        self.assertFalse(Livre.objects.get(pk=self.livres[0].pk).disponible)
+        emprunts[1].delete()
+        self.assertTrue(Livre.objects.get(pk=self.livres[0].pk).disponible)
+
+        emprunts[0].retourne = None
+        emprunts[0].save()
+        response = self.client.get(reverse('livres:livres-list', query={'disponible': 'true'}))
+        self.assertEqual([livre['pk'] for livre in response.data['results']], [self.livres[1].pk])
+        self.assertTrue(response.data['results'][0]['disponible'])
+        response = self.client.get(reverse('livres:livres-list', query={'disponible': 'false'}))
+        self.assertEqual([livre['pk'] for livre in response.data['results']], [self.livres[0].pk])
+
+    def test_stale_livre_does_not_overwrite_agregats(self):
+        livre = Livre.objects.get(pk=self.livres[0].pk)
+        Avis.objects.create(membre=self.membre, livre=livre, note=5)
+        livre.titre = 'autre'
+        livre.save()
+        self.assertEqual(self.agregats(livre), (5.0, 1, 0))
+
+    def test_ordering(self):
+        Avis.objects.create(membre=self.membre, livre=self.livres[1], note=5)
+        Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        response = self.client.get(reverse('livres:livres-list', query={'ordering': '-note_moyenne'}))
+        self.assertEqual([livre['pk'] for livre in response.data['results']], [self.livres[1].pk, self.livres[0].pk])
+        self.assertEqual(response.data['results'][0]['note_moyenne'], 5.0)
+
+        response = self.client.get(reverse('livres:livres-list', query={'ordering': '-nb_emprunts'}))
+        self.assertEqual(response.data['results'][0]['nb_emprunts'], 1)
+
+    def test_recalculer_agregats(self):
+        Avis.objects.create(membre=self.membre, livre=self.livres[0], note=3)
+        Emprunt.objects.create(membre=self.membre, livre=self.livres[0])
+        Livre.objects.update(note_moyenne=None, nb_avis=7, nb_emprunts=0, somme_notes=0, nb_notes=0, disponible=True)
+
+        call_command('recalculer_agregats', stdout=StringIO())
+        self.assertEqual(self.agregats(self.livres[0]), (3.0, 1, 1))
+        self.assertFalse(Livre.objects.get(pk=self.livres[0].pk).disponible)
+        self.assertEqual(self.agregats(self.livres[1]), (None, 0, 0))
+
+#===================================================================================
+#Overdue
+
+class OverdueTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        user = User.objects.create_user(username='user', password='1234', email='user@mail.fr')
+        self.membre = Membre.objects.create(user=user, telephone='0600000000')
+        self.livre = Livre.objects.create(titre='titre, 1', isbn='1234567890098')
+        self.emprunts = [
+            Emprunt.objects.create(membre=self.membre, livre=self.livre, date_emp='2025-01-01', date_ret='2025-02-01'),
+            Emprunt.objects.create(membre=self.membre, livre=self.livre, date_emp='2024-01-01', date_ret='2024-02-01'),
+            Emprunt.objects.create(membre=self.membre, livre=self.livre, date_emp='2024-01-01', date_ret='2024-02-01', retourne='2024-01-20'),
+            Emprunt.objects.create(membre=self.membre, livre=self.livre, date_emp='2025-01-01', date_ret=date.today() + timedelta(days=7)),
+        ]
+        self.url = reverse('emprunts:emprunts-overdue')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        self.client.force_authenticate(self.admin_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['pk'] for row in rows], [self.emprunts[1].pk, self.emprunts[0].pk])
+        self.assertEqual(rows[0]['email'], 'user@mail.fr')
+        self.assertEqual(rows[0]['titre'], 'titre, 1')
+        self.assertEqual(rows[0]['date_ret'], '2024-02-01')
+
+    def test_csv(self):
+        self.client.force_authenticate(self.admin_user)
+        response = self.client.get(self.url, {'output': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual([int(row['pk']) for row in rows], [self.emprunts[1].pk, self.emprunts[0].pk])
+        self.assertEqual(rows[0]['titre'], 'titre, 1')
+
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+
+    def test_staff_only(self):
+        self.assertIn(self.client.get(self.url).status_code, [401, 403])
+        self.client.force_authenticate(self.membre.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.membres = [
+            Membre.objects.create(user=User.objects.create_user(username='user%s' % (i), password='1234'))
+            for i in range(2)
+        ]
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098')
+        self.emprunts = [
+            Emprunt.objects.create(membre=self.membres[0], livre=self.livre, date_emp='2025-01-01', date_ret='2025-02-01'),
+            Emprunt.objects.create(membre=self.membres[1], livre=self.livre, date_emp='2025-03-01', date_ret='2025-04-01', retourne='2025-03-15'),
+        ]
+        self.avis = [
+            Avis.objects.create(membre=self.membres[0], livre=self.livre, note=4, commentaire='bien'),
+            Avis.objects.create(membre=self.membres[1], livre=self.livre, note=2),
+        ]
+
+    def rows(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_emprunts(self):
+        url = reverse('emprunts:emprunts-export')
+        self.client.force_authenticate(self.admin_user)
+        self.assertEqual([row['pk'] for row in self.rows(self.client.get(url))], [emprunt.pk for emprunt in self.emprunts])
+        rows = self.rows(self.client.get(url, {'date_emp_min': '2025-02-01'}))
+        self.assertEqual([row['pk'] for row in rows], [self.emprunts[1].pk])
+        self.assertEqual(rows[0]['retourne'], '2025-03-15')
+
+        # a Membre only gets their Emprunt
+        self.client.force_authenticate(self.membres[0].user)
+        self.assertEqual([row['pk'] for row in self.rows(self.client.get(url))], [self.emprunts[0].pk])
+
+        self.client.logout()
+        self.assertIn(self.client.get(url).status_code, [401, 403])
+
+    def test_avis(self):
+        url = reverse('emprunts:avis-export')
+        self.client.force_authenticate(self.admin_user)
+        response = self.client.get(url, {'output': 'csv', 'ordering': 'note'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['pk']) for row in rows], [self.avis[1].pk, self.avis[0].pk])
+        self.assertEqual(rows[1]['commentaire'], 'bien')
+
+        self.client.force_authenticate(self.membres[1].user)
+        self.assertEqual([row['note'] for row in self.rows(self.client.get(url))], [2])
+
+    def test_avis_of_livre(self):
+        # the same Avis as the list of the Livre, for a Membre too
+        url = reverse('livres:livres-avis-export', kwargs={'livres_pk': self.livre.pk})
+        liste = self.client.get(reverse('livres:livres-avis-list', kwargs={'livres_pk': self.livre.pk}))
+        self.client.force_authenticate(self.membres[1].user)
+        rows = self.rows(self.client.get(url))
+        self.assertEqual([row['pk'] for row in rows], [avis.pk for avis in self.avis])
+        self.assertEqual(sorted(row['pk'] for row in rows), sorted(avis['pk'] for avis in liste.data['results']))
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BulkEmpruntTestCase(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.membres = [
+            Membre.objects.create(user=User.objects.create_user(username='user%s' % (i), password='1234'))
+            for i in range(2)
+        ]
+        self.livres = [Livre.objects.create(titre='titre%s' % (i), isbn='12345678900%02d' % (i)) for i in range(4)]
+        self.checkout = reverse('emprunts:emprunts-bulk-checkout')
+        self.retour = reverse('emprunts:emprunts-bulk-return')
+
+    def livre(self, livre):
+        livre = Livre.objects.get(pk=livre.pk)
+        return (livre.nb_emprunts, livre.emprunts_en_cours, livre.disponible)
+
+    def test_checkout_and_return(self):
+        self.client.force_authenticate(self.membres[0].user)
+        generation = get_generation('emprunts.emprunt')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.checkout, {'livres': [self.livres[0].pk, self.livres[1].pk]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]['date_ret'], str(date.today() + timedelta(days=21)))
+        self.assertEqual(Emprunt.objects.filter(membre=self.membres[0]).count(), 2)
+        self.assertEqual(self.livre(self.livres[0]), (1, 1, False))
+        self.assertEqual(Compteur.lignes_de(Emprunt), 2)
+        self.assertNotEqual(get_generation('emprunts.emprunt'), generation)
+
+        # the whole cart is refused when one Livre is borrowed already
+        response = self.client.post(self.checkout, {'livres': [self.livres[1].pk, self.livres[2].pk]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'livres': ['Livre "%s" is not available.' % (self.livres[1].pk)]})
+        self.assertEqual(Emprunt.objects.count(), 2)
+
+        pks = list(Emprunt.objects.values_list('pk', flat=True))
+        response = self.client.post(self.retour, {'emprunts': pks}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'retournes': sorted(pks), 'deja_retournes': []})
+        self.assertEqual(self.livre(self.livres[0]), (1, 0, True))
+        self.assertEqual(Emprunt.objects.filter(retourne=date.today()).count(), 2)
+
+        response = self.client.post(self.retour, {'emprunts': pks}, format='json')
+        self.assertEqual(response.data, {'retournes': [], 'deja_retournes': sorted(pks)})
+
+    def test_staff(self):
+        self.client.force_authenticate(self.admin_user)
+        response = self.client.post(self.checkout, {'membre': self.membres[1].pk, 'livres': [self.livres[3].pk], 'date_ret': '2030-01-01'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        emprunt = Emprunt.objects.get()
+        self.assertEqual((emprunt.membre, str(emprunt.date_ret)), (self.membres[1], '2030-01-01'))
+
+        response = self.client.post(self.retour, {'emprunts': [emprunt.pk], 'retourne': '2029-12-01'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(Emprunt.objects.get().retourne), '2029-12-01')
+
+        self.assertEqual(self.client.post(self.checkout, {'membre': 999, 'livres': [self.livres[0].pk]}, format='json').status_code, 400)
+        # the staff isn't a Membre: the membre is required
+        response = self.client.post(self.checkout, {'livres': [self.livres[0].pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('membre', response.data)
+
+    def test_small_batches(self):
+        self.client.force_authenticate(self.membres[0].user)
+        with patch.object(bulk, 'BATCH_SIZE', 1):
+            response = self.client.post(self.checkout, {'livres': [self.livres[0].pk, 999, 998]}, format='json')
+            self.assertEqual(response.data, {'livres': ['Invalid pk "998" - object does not exist.', 'Invalid pk "999" - object does not exist.']})
+            response = self.client.post(self.checkout, {'livres': [livre.pk for livre in self.livres[:3]]}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+            pks = [emprunt['pk'] for emprunt in response.data]
+            other = Emprunt.objects.create(membre=self.membres[1], livre=self.livres[3], date_emp='2025-01-01')
+            response = self.client.post(self.retour, {'emprunts': pks + [other.pk]}, format='json')
+            self.assertEqual(response.data, {'emprunts': ['Emprunt "%s" belongs to another Membre.' % (other.pk)]})
+            response = self.client.post(self.retour, {'emprunts': pks}, format='json')
+            self.assertEqual(response.data['retournes'], sorted(pks))
+
+    def test_ownership(self):
+        emprunts = [
+            Emprunt.objects.create(membre=self.membres[0], livre=self.livres[0], date_emp='2025-01-01'),
+            Emprunt.objects.create(membre=self.membres[1], livre=self.livres[1], date_emp='2025-01-01'),
+        ]
+        self.client.force_authenticate(self.membres[0].user)
+        response = self.client.post(self.retour, {'emprunts': [emprunt.pk for emprunt in emprunts]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Emprunt.objects.filter(retourne__isnull=False).exists())
+
+        self.assertEqual(self.client.post(self.retour, {'emprunts': [999]}, format='json').status_code, 400)
+        response = self.client.post(self.checkout, {'membre': self.membres[1].pk, 'livres': [self.livres[2].pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.post(self.checkout, {'livres': [999]}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.checkout, {'livres': [self.livres[2].pk] * 2}, format='json').status_code, 400)
+
+        self.client.force_authenticate(User.objects.create_user(username='sans membre', password='1234'))
+        self.assertEqual(self.client.post(self.checkout, {'livres': [self.livres[2].pk]}, format='json').status_code, 403)
+        self.client.logout()
+        self.assertIn(self.client.post(self.retour, {'emprunts': [emprunts[0].pk]}, format='json').status_code, [401, 403])
+
+    def test_constant_queries(self):
+        self.client.force_authenticate(self.admin_user)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post(self.checkout, {'membre': self.membres[0].pk, 'livres': [self.livres[0].pk]}, format='json')
+        pks = [emprunt['pk'] for emprunt in response.data]
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.checkout, {'membre': self.membres[0].pk, 'livres': [livre.pk for livre in self.livres[1:]]}, format='json')
+        pks += [emprunt['pk'] for emprunt in response.data]
+        self.assertEqual(len(small), len(large))
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.retour, {'emprunts': pks[:1]}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.retour, {'emprunts': pks[1:]}, format='json')
+        self.assertEqual(len(small), len(large))
+
+#===================================================================================
+#Indexes
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite only')
+class IndexTestCase(TestCase):
+    def setUp(self):
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098')
+        self.membre = Membre.objects.create(adresse='Paris')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn('INDEX %s' % (index), plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_emprunts_of_membre_by_date_emp(self):
+        self.assertUsesIndex(Emprunt.objects.filter(membre=self.membre).order_by('date_emp'), 'emprunt_membre_date_emp_idx')
+
+    def test_emprunts_of_livre_by_date_emp(self):
+        self.assertUsesIndex(Emprunt.objects.filter(livre=self.livre).order_by('-date_emp'), 'emprunt_livre_date_emp_idx')
+
+    def test_open_emprunts_of_livre(self):
+        plan = Emprunt.objects.filter(livre=self.livre, retourne__isnull=True).explain()
+        self.assertIn('INDEX emprunt_livre_ouvert_idx', plan)
+
+    def test_overdue_emprunts(self):
+        queryset = Emprunt.objects.filter(retourne__isnull=True, date_ret__lt='2025-01-01').order_by('date_ret', 'pk')
+        self.assertUsesIndex(queryset, 'emprunt_ouvert_date_ret_idx')
+
+    def test_avis_of_livre_by_note(self):
+        self.assertUsesIndex(Avis.objects.filter(livre=self.livre).order_by('-note'), 'avis_livre_note_idx')
+
+    def test_avis_of_membre_by_note(self):
+        self.assertUsesIndex(Avis.objects.filter(membre=self.membre).order_by('note'), 'avis_membre_note_idx')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_livres_by_auteur_nom(self):
+        for i, nom in enumerate(['Zola', 'Hugo', 'Balzac']):
+            Livre.objects.create(titre='titre%s' % (i + 2), isbn='123456789009%s' % (i), auteur=Auteur.objects.create(nom=nom))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('livres:livres-list'), {'ordering': 'auteur__nom'})
+        self.assertEqual(len(queries), 3)
+        # first page: the Livre without Auteur, then Balzac and Hugo
+        self.assertEqual([livre['titre'] for livre in response.json()['results']], ['titre1', 'titre4', 'titre3'])
+
+        # the Auteur are joined on their pk, the order comes from a sort of the Livre
+        # (Livre.auteur is nullable: SQLite keeps livres_livre as the outer table of
+        # the LEFT JOIN and can't read the Livre in the order of an Auteur index)
+        sql = [query['sql'] for query in queries.captured_queries if 'ORDER BY "livres_auteur"."nom"' in query['sql']]
+        self.assertEqual(len(sql), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN %s' % (sql[0]))
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('SEARCH livres_auteur USING INTEGER PRIMARY KEY', plan)
+        self.assertNotIn('SCAN livres_auteur', plan)
+
+    def test_auteurs_by_nom_prenom(self):
+        # lookup of the Auteur of an imported catalogue
+        plan = Auteur.objects.filter(nom='Hugo', prenom='Victor').explain()
+        self.assertIn('INDEX auteur_nom_prenom_idx', plan)
@@ -1,3 +1,6 @@
+from datetime import date
+
+from django.http import Http404
 from django.shortcuts import render,get_object_or_404
 from rest_framework import filters, viewsets, status, permissions
 from django_filters.rest_framework import DjangoFilterBackend
@@ -10,10 +13,52 @@ from .models import *
 from .serializers import *
 from .permissions import *
 from api.pagination import *
+from api.streaming import stream_queryset, STREAM_FORMATS
+from recommandations.models import Voisin
+from recommandations.serializers import SimilaireSerializer
 from .filters import *
+from .bulk import verifier_retours, retourner, verifier_livres, emprunter, UNAVAILABLE_ERROR
+from livres.bulk import BULK_MAX_ITEMS
 
 # Create your views here.
 
+# column of the overdue export => field of Emprunt
+OVERDUE_COLUMNS = {
+    'pk': 'pk',
+    'date_emp': 'date_emp',
+    'date_ret': 'date_ret',
+    'membre': 'membre',
+    'username': 'membre__user__username',
+    'email': 'membre__user__email',
+    'first_name': 'membre__user__first_name',
+    'last_name': 'membre__user__last_name',
+    'telephone': 'membre__telephone',
+    'livre': 'livre',
+    'titre': 'livre__titre',
+    'isbn': 'livre__isbn',
+}
+
+# column of the exports => field of Emprunt / Avis
+EMPRUNT_EXPORT_COLUMNS = {
+    'pk': 'pk',
+    'date_emp': 'date_emp',
+    'date_ret': 'date_ret',
+    'retourne': 'retourne',
+    'membre': 'membre',
+    'livre': 'livre',
+    'titre': 'livre__titre',
+    'isbn': 'livre__isbn',
+}
+
+AVIS_EXPORT_COLUMNS = {
+    'pk': 'pk',
+    'note': 'note',
+    'commentaire': 'commentaire',
+    'membre': 'membre',
+    'livre': 'livre',
+    'titre': 'livre__titre',
+}
+
 class EmpruntViewSet(viewsets.ModelViewSet):
     """
         ViewSet that manages Emprunt with CRUD methods
@@ -31,6 +76,10 @@ class EmpruntViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]   
     ordering_fields = ['date_ret', 'retourne', 'date_emp']
 
+    def get_queryset(self):
+        # membre, membre.user and livre loaded in the same query
+        return EmpruntSerializer.setup_eager_loading(super().get_queryset())
+
     def list(self, request, membres_pk=None, livres_pk=None):
 
         if request.user.is_staff:      
@@ -41,13 +90,14 @@ class EmpruntViewSet(viewsets.ModelViewSet):
             else:    
                 emprunts = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
         else: 
-            try:
-                emprunts = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(membre=request.user.membre)))
-            except:
-                emprunts = None
+            membre = get_membre(request)
+            if membre:
+                emprunts = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(membre=membre)))
+            else:
+                emprunts = self.paginate_queryset(self.get_queryset().none())
 
         serializer = EmpruntSerializer(emprunts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
 
     @extend_schema(
         description='Method that sets a Membre to an Emprunt',
@@ -128,7 +178,154 @@ class EmpruntViewSet(viewsets.ModelViewSet):
             return Response({'status': 'livre removed'}, status=status.HTTP_204_NO_CONTENT)
     
         return Response({'status': 'this emprunt has no livre'}, status=status.HTTP_400_BAD_REQUEST)
-    
+
+    """
+        Method that streams the overdue Emprunt (date_ret passed and not returned),
+        oldest date_ret first, with their Membre and Livre.
+        Staff only, ?output=ndjson (default) or ?output=csv.
+
+        example:
+            get /emprunts/overdue/?output=csv
+            response : pk,date_emp,date_ret,membre,username,email,...
+    """
+
+    @extend_schema(
+        description='Method that streams the overdue Emprunt as NDJSON or CSV',
+        parameters=[OpenApiParameter('output', OpenApiTypes.STR, enum=STREAM_FORMATS)],
+        responses={200: OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=['get'], url_path='overdue', permission_classes=[permissions.IsAdminUser])
+    def overdue(self, request, membres_pk=None, livres_pk=None):
+        # served by the partial index emprunt_ouvert_date_ret_idx
+        emprunts = Emprunt.objects.filter(retourne__isnull=True, date_ret__lt=date.today()).order_by('date_ret', 'pk')
+        if membres_pk:
+            emprunts = emprunts.filter(membre=membres_pk)
+        elif livres_pk:
+            emprunts = emprunts.filter(livre=livres_pk)
+
+        return stream_queryset(request, emprunts, OVERDUE_COLUMNS, filename='overdue')
+
+    """
+        Method that streams every Emprunt matching the filters of the list
+        (EmpruntFilterSet, ?ordering=), by pk by default.
+        Staff get every Emprunt, a Membre only gets theirs.
+        ?output=ndjson (default) or ?output=csv, gzipped if the client accepts it.
+
+        example:
+            get /emprunts/export/?output=csv&date_emp_min=2025-01-01
+            response : pk,date_emp,date_ret,retourne,membre,livre,titre,isbn
+    """
+
+    @extend_schema(
+        description='Method that streams the filtered Emprunt as NDJSON or CSV',
+        parameters=[OpenApiParameter('output', OpenApiTypes.STR, enum=STREAM_FORMATS)],
+        responses={200: OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAuthenticated])
+    def export(self, request, membres_pk=None, livres_pk=None):
+        emprunts = Emprunt.objects.order_by('pk')
+        if request.user.is_staff:
+            if livres_pk:
+                emprunts = emprunts.filter(livre=livres_pk)
+            elif membres_pk:
+                emprunts = emprunts.filter(membre=membres_pk)
+        else:
+            membre = get_membre(request)
+            emprunts = emprunts.filter(membre=membre) if membre else emprunts.none()
+
+        return stream_queryset(request, self.filter_queryset(emprunts), EMPRUNT_EXPORT_COLUMNS, filename='emprunts')
+
+    """
+        Method that returns every Emprunt of a cart in one request.
+        Staff can return any Emprunt, a Membre only theirs: nothing is returned
+        when a pk is invalid (400) or belongs to someone else (403).
+        The Emprunt already returned are left as they are.
+
+        example:
+            post /emprunts/bulk-return/
+            {'emprunts': [1, 2, 3]}
+            response : {'retournes': [1, 2], 'deja_retournes': [3]}
+    """
+
+    @extend_schema(
+        description='Method that returns many Emprunt at once',
+        request=BulkReturnSerializer,
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-return', permission_classes=[permissions.IsAuthenticated])
+    def bulk_return(self, request, membres_pk=None, livres_pk=None):
+        serializer = BulkReturnSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        pks = set(serializer.validated_data['emprunts'])
+        if len(pks) > BULK_MAX_ITEMS:
+            return Response({'detail': 'At most %s Emprunt per request.' % (BULK_MAX_ITEMS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        membre = None
+        if not request.user.is_staff:
+            membre = get_membre(request)
+            if membre is None:
+                return Response({'detail': 'Only a Membre can return an Emprunt.'}, status=status.HTTP_403_FORBIDDEN)
+
+        errors, forbidden = verifier_retours(pks, membre)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        if forbidden:
+            return Response(forbidden, status=status.HTTP_403_FORBIDDEN)
+
+        retournes, deja_retournes = retourner(pks, serializer.validated_data.get('retourne'))
+        return Response({'retournes': sorted(retournes), 'deja_retournes': deja_retournes}, status=status.HTTP_200_OK)
+
+    """
+        Method that borrows every Livre of a cart in one request, for the Membre
+        of the user or, for the staff, the given membre.
+        Nothing is created when a Livre doesn't exist (400) or is borrowed already (409).
+
+        example:
+            post /emprunts/bulk-checkout/
+            {'membre': 1, 'livres': [4, 5], 'date_ret': '2025-09-01'}
+            response : [{'pk': 10, 'date_emp': '2025-08-11', 'date_ret': '2025-09-01', ...}, ...]
+    """
+
+    @extend_schema(
+        description='Method that creates the Emprunt of many Livre at once',
+        request=BulkCheckoutSerializer,
+        responses=EmpruntSerializer(many=True),
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-checkout', permission_classes=[permissions.IsAuthenticated])
+    def bulk_checkout(self, request, membres_pk=None, livres_pk=None):
+        serializer = BulkCheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        livres = serializer.validated_data['livres']
+        if len(livres) > BULK_MAX_ITEMS:
+            return Response({'detail': 'At most %s Livre per request.' % (BULK_MAX_ITEMS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        membre_pk = serializer.validated_data.get('membre')
+        if request.user.is_staff and membre_pk is not None:
+            membre = Membre.objects.filter(pk=membre_pk).select_related('user').first()
+            if membre is None:
+                return Response({'membre': ['Invalid pk "%s" - object does not exist.' % (membre_pk)]}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            membre = get_membre(request)
+            if membre is None and request.user.is_staff:
+                # the staff borrows for a Membre, unless they are a Membre themself
+                return Response({'membre': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+            if membre is None or (membre_pk is not None and membre_pk != membre.pk):
+                return Response({'detail': 'A Membre can only borrow for themself.'}, status=status.HTTP_403_FORBIDDEN)
+
+        errors = verifier_livres(livres)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        emprunts, indisponibles = emprunter(membre, livres, serializer.validated_data.get('date_ret'))
+        if indisponibles:
+            return Response({'livres': [UNAVAILABLE_ERROR % {'pk': pk} for pk in indisponibles]}, status=status.HTTP_409_CONFLICT)
+
+        emprunts = self.get_queryset().filter(pk__in=[emprunt.pk for emprunt in emprunts]).order_by('pk')
+        return Response(EmpruntSerializer(emprunts, many=True).data, status=status.HTTP_201_CREATED)
+
 
 class MembreViewSet(viewsets.ModelViewSet):
     """
@@ -144,6 +341,33 @@ class MembreViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]   
     ordering_fields = ['user__first_name', 'user__last_name']
 
+    def get_queryset(self):
+        return MembreSerializer.setup_eager_loading(super().get_queryset())
+
+    """
+        Method that returns the Livre a Membre may like: the Livre most similar to the
+        ones the Membre borrowed (computed by the calculer_recommandations command),
+        minus those. Staff or the Membre itself.
+
+        example:
+            get /membres/1/recommandations/
+            response : [{'pk': 4, 'titre': 'titre4', 'score': 1.62}, ...]
+    """
+
+    @extend_schema(
+        description='Method that returns the Livre recommended to a Membre from its Emprunt',
+        responses=SimilaireSerializer(many=True),
+    )
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsAdminOrSelfMembre])
+    def recommandations(self, request, pk=None):
+        try:
+            membre_pk = int(pk)
+        except ValueError:
+            raise Http404('No Membre matches the given query.')
+
+        serializer = SimilaireSerializer(Voisin.recommandations_pour(membre_pk), many=True)
+        return Response(serializer.data)
+
     @extend_schema(
         description='Method that adds an Emprunt to a Membre',
         examples=[
@@ -246,23 +470,51 @@ class AvisViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]   
     ordering_fields = ['note', 'livre__titre']
 
-    def list(self, request, membres_pk=None, livres_pk=None):
+    def get_queryset(self):
+        return AvisSerializer.setup_eager_loading(super().get_queryset())
 
+    def visibles(self, avis, membres_pk=None, livres_pk=None):
+        """
+            Avis of the list and of the export: every Avis of the Livre / Membre
+            of the nested routes, otherwise every Avis for the staff and their
+            own Avis for a Membre.
+        """
         if livres_pk:
-            avis = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(livre=livres_pk)))
-        elif membres_pk:
-            avis = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(membre=membres_pk)))
-        else:
-            if request.user.is_staff:      
-                avis = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
-            else: 
-                try:
-                    avis = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(membre=request.user.membre)))
-                except:
-                    avis = None
+            return avis.filter(livre=livres_pk)
+        if membres_pk:
+            return avis.filter(membre=membres_pk)
+        if self.request.user.is_staff:
+            return avis
+
+        membre = get_membre(self.request)
+        return avis.filter(membre=membre) if membre else avis.none()
 
+    def list(self, request, membres_pk=None, livres_pk=None):
+        avis = self.paginate_queryset(self.filter_queryset(self.visibles(self.get_queryset(), membres_pk, livres_pk)))
         serializer = AvisSerializer(avis, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
+
+    """
+        Method that streams every Avis matching the filters of the list
+        (AvisFilterSet, ?ordering=), by pk by default.
+        The same Avis as the list (visibles()): the staff gets every Avis,
+        a Membre their own, and anyone authenticated those of /livres/<pk>/avis/.
+        ?output=ndjson (default) or ?output=csv, gzipped if the client accepts it.
+
+        example:
+            get /avis/export/?note=5
+            response : {"pk": 1, "note": 5, "commentaire": "...", "membre": 1, "livre": 1, "titre": "..."}
+    """
+
+    @extend_schema(
+        description='Method that streams the filtered Avis as NDJSON or CSV',
+        parameters=[OpenApiParameter('output', OpenApiTypes.STR, enum=STREAM_FORMATS)],
+        responses={200: OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAuthenticated])
+    def export(self, request, membres_pk=None, livres_pk=None):
+        avis = self.visibles(Avis.objects.order_by('pk'), membres_pk, livres_pk)
+        return stream_queryset(request, self.filter_queryset(avis), AVIS_EXPORT_COLUMNS, filename='avis')
 
 
     @extend_schema(
@@ -0,0 +1,265 @@
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.utils.translation import gettext_lazy as _
+
+from .models import Livre, Auteur, Categorie, validate_isbn
+from api.models import Compteur
+from .serializers import LivreBulkItemSerializer
+from .cache import invalidate_livres
+from .search import index_livres
+
+# Bulk creation of Livre (POST /livres/bulk/) and bulk changes of their
+# Categorie (/categories/<pk>/livres/bulk-add/, bulk-remove/, /livres/bulk-categories/).
+#
+# Every check is made once for the whole list: one IN query per related
+# model and per unique rule, then one bulk_create for the Livre and one for
+# the rows of Livre.categorie. The receivers of livres/signals.py don't run
+# for bulk_create, apres_creation() does their work for all the new Livre.
+
+BULK_MAX_ITEMS = 5000
+BATCH_SIZE = 500
+ISBN_RE = re.compile(r'\d{13}')
+
+ISBN_UNIQUE_ERROR = _("livre with this isbn already exists.")
+PK_ERROR = _('Invalid pk "%(pk)s" - object does not exist.')
+CONFLICT_ERROR = _("The Livre could not be created, try again.")
+CREATEUR_ERROR = _('You must be the createur of the Livre "%(pk)s" to edit it.')
+
+def apres_creation(pks):
+    """
+        Counts, indexes and invalidates the cache for Livre created without signals,
+        including the NOT_FOUND remembered for their pk by the detail view.
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    Compteur.ajouter(Livre, len(pks))
+    index_livres(pks)
+    # after the commit, a request can't cache the 404 or the previous lists again
+    transaction.on_commit(lambda: invalidate_livres(pks))
+
+def creer_livres(items, createur=None):
+    """
+        Creates the valid items of a list of Livre and leaves out the others.
+
+        param:
+            - list items, dicts read by LivreBulkItemSerializer
+            - User createur
+        return:
+            one result per item, in the same order
+            {'index': 0, 'status': 'created', 'pk': 12}
+            {'index': 1, 'status': 'error', 'errors': {'isbn': ['...']}}
+    """
+    errors = [{} for item in items]
+    data = [None] * len(items)
+
+    def erreur(index, champ, message):
+        errors[index].setdefault(champ, []).append(str(message))
+        data[index] = None
+
+    # fields of each item, no query
+    for index, item in enumerate(items):
+        serializer = LivreBulkItemSerializer(data=item)
+        if serializer.is_valid():
+            data[index] = serializer.validated_data
+        else:
+            errors[index] = dict(serializer.errors)
+
+    # isbn format, validate_isbn gives the message of the invalid ones
+    for index, livre in enumerate(data):
+        if livre and livre.get('isbn') and not ISBN_RE.fullmatch(livre['isbn']):
+            try:
+                validate_isbn(livre['isbn'])
+            except ValidationError as exc:
+                erreur(index, 'isbn', exc.messages[0])
+
+    # related objects, one query each
+    valides = [livre for livre in data if livre]
+    auteurs = set(Auteur.objects.filter(
+        pk__in={livre['auteur'] for livre in valides if livre.get('auteur') is not None},
+    ).values_list('pk', flat=True))
+    categories = set(Categorie.objects.filter(
+        pk__in={pk for livre in valides for pk in livre['categorie']},
+    ).values_list('pk', flat=True))
+
+    for index, livre in enumerate(data):
+        if not livre:
+            continue
+        if livre.get('auteur') is not None and livre['auteur'] not in auteurs:
+            erreur(index, 'auteur', PK_ERROR % {'pk': livre['auteur']})
+        for pk in livre['categorie']:
+            if pk not in categories:
+                erreur(index, 'categorie', PK_ERROR % {'pk': pk})
+
+    # uniqueness against the database (isbn, titre / auteur as Livre.clean)
+    verifier_existants(data, erreur)
+
+    # uniqueness within the list: an item only claims its isbn and its titre / auteur
+    # once every check passed, so a rejected item never blocks a later one
+    isbns, paires = set(), set()
+    for index, livre in enumerate(data):
+        if not livre:
+            continue
+        isbn, paire = livre.get('isbn'), _paire(livre)
+        if isbn and isbn in isbns:
+            erreur(index, 'isbn', ISBN_UNIQUE_ERROR)
+        if paire and paire in paires:
+            erreur(index, 'titre', Livre.TITRE_AUTEUR_ERROR)
+        if data[index]:
+            isbns.add(isbn)
+            paires.add(paire)
+
+    # inserts, a Livre created meanwhile by another request fails the unique
+    # constraints: its items are reported and the others inserted again
+    while True:
+        indexes = [index for index, livre in enumerate(data) if livre]
+        try:
+            livres = _inserer([data[index] for index in indexes], createur)
+            break
+        except IntegrityError:
+            if not verifier_existants(data, erreur):
+                for index in indexes:
+                    erreur(index, 'non_field_errors', CONFLICT_ERROR)
+
+    pks = {index: livre.pk for index, livre in zip(indexes, livres)}
+    return [
+        {'index': index, 'status': 'created', 'pk': pks[index]} if index in pks
+        else {'index': index, 'status': 'error', 'errors': errors[index]}
+        for index in range(len(items))
+    ]
+
+def verifier_categories(livres, categories, user):
+    """
+        Checks that the Livre and Categorie exist and that user is the createur
+        of the Livre (as IsCreateurOrReadOnly), with one query each.
+
+        return:
+            (errors, forbidden), dicts {'livres': [...], 'categories': [...]} and
+            {'livres': [...]}, empty when everything is valid
+    """
+    createurs = dict(Livre.objects.filter(pk__in=livres).values_list('pk', 'createur'))
+    existantes = set(Categorie.objects.filter(pk__in=categories).values_list('pk', flat=True))
+
+    errors = {}
+    manquants = sorted(set(livres) - set(createurs))
+    if manquants:
+        errors['livres'] = [str(PK_ERROR % {'pk': pk}) for pk in manquants]
+    manquantes = sorted(set(categories) - existantes)
+    if manquantes:
+        errors['categories'] = [str(PK_ERROR % {'pk': pk}) for pk in manquantes]
+
+    forbidden = {}
+    interdits = sorted(pk for pk, createur in createurs.items() if createur != user.pk)
+    if interdits:
+        forbidden['livres'] = [str(CREATEUR_ERROR % {'pk': pk}) for pk in interdits]
+
+    return errors, forbidden
+
+def modifier_categories(ajouts=(), retraits=(), remplacer=None):
+    """
+        Adds and removes (livre_id, categorie_id) pairs of Livre.categorie in one
+        transaction: one query for the current rows of the Livre, one delete and
+        one bulk_create, then a single invalidation for every Livre changed.
+
+        param:
+            - iterable ajouts, pairs to add (the existing ones are skipped)
+            - iterable retraits, pairs to remove
+            - iterable remplacer, Livre whose pairs not in ajouts are removed
+        return:
+            (number of pairs added, number of pairs removed)
+    """
+    Through = Livre.categorie.through
+    ajouts, retraits = set(ajouts), set(retraits)
+    remplacer = set(remplacer or ())
+    livres = {livre for livre, categorie in ajouts | retraits} | remplacer
+
+    with transaction.atomic():
+        existantes = {}
+        livres_liste = list(livres)
+        for start in range(0, len(livres_liste), BATCH_SIZE):
+            rows = Through.objects.filter(livre__in=livres_liste[start:start + BATCH_SIZE])
+            for pk, livre, categorie in rows.values_list('pk', 'livre', 'categorie'):
+                existantes[(livre, categorie)] = pk
+
+        if remplacer:
+            retraits |= {paire for paire in existantes if paire[0] in remplacer and paire not in ajouts}
+
+        nouvelles = ajouts - set(existantes)
+        supprimees = [paire for paire in retraits if paire in existantes]
+        pks = [existantes[paire] for paire in supprimees]
+        for start in range(0, len(pks), BATCH_SIZE):
+            Through.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).delete()
+        Through.objects.bulk_create(
+            [Through(livre_id=livre, categorie_id=categorie) for livre, categorie in nouvelles],
+            batch_size=BATCH_SIZE,
+        )
+
+        modifies = {livre for livre, categorie in nouvelles} | {livre for livre, categorie in supprimees}
+        index_livres(modifies)
+
+    # after the commit, a request can't cache the previous categories again
+    if modifies:
+        invalidate_livres(modifies)
+
+    return len(nouvelles), len(supprimees)
+
+def _paire(livre):
+    if livre.get('titre') is not None and livre.get('auteur') is not None:
+        return (livre['titre'], livre['auteur'])
+    return None
+
+def verifier_existants(data, erreur):
+    """
+        Reports the items whose isbn or titre / auteur is used by a Livre of
+        the database, one query each (the titre / auteur one returns a superset).
+        return: the number of items reported
+    """
+    valides = [livre for livre in data if livre]
+    isbns = set(Livre.objects.filter(
+        isbn__in={livre['isbn'] for livre in valides if livre.get('isbn')},
+    ).values_list('isbn', flat=True))
+
+    paires = {_paire(livre) for livre in valides} - {None}
+    existantes = set()
+    if paires:
+        existantes = set(Livre.objects.filter(
+            titre__in={titre for titre, auteur in paires},
+            auteur__in={auteur for titre, auteur in paires},
+        ).values_list('titre', 'auteur'))
+
+    reportes = 0
+    for index, livre in enumerate(data):
+        if not livre:
+            continue
+        if livre.get('isbn') in isbns:
+            erreur(index, 'isbn', ISBN_UNIQUE_ERROR)
+        if _paire(livre) in existantes:
+            erreur(index, 'titre', Livre.TITRE_AUTEUR_ERROR)
+        reportes += data[index] is None
+
+    return reportes
+
+def _inserer(data, createur):
+    livres = [
+        Livre(
+            titre=livre.get('titre'),
+            date_publication=livre.get('date_publication'),
+            isbn=livre.get('isbn'),
+            auteur_id=livre.get('auteur'),
+            createur=createur,
+        )
+        for livre in data
+    ]
+
+    with transaction.atomic():
+        Livre.objects.bulk_create(livres, batch_size=BATCH_SIZE)
+        Livre.categorie.through.objects.bulk_create([
+            Livre.categorie.through(livre_id=livre.pk, categorie_id=pk)
+            for livre, item in zip(livres, data)
+            for pk in set(item['categorie'])
+        ], batch_size=BATCH_SIZE)
+        apres_creation(livre.pk for livre in livres)
+
+    return livres
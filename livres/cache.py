@@ -0,0 +1,93 @@
+from django.core.cache import cache
+
+from api.cache import versioned_key, get_generation, bump_generation
+from .models import Livre
+
+# Cache keys used by the views of the livres app and the rows they depend on.
+#
+#   livres-<pk>             Livre detail (auteur, createur and categories nested)
+#   livres-list-<host>-...  filtered / ordered / paginated Livre lists, versioned by
+#                           the 'livres.livre' generation (see api/cache.py)
+#                           and kept LISTS_CACHE_TIME seconds: the aggregates of
+#                           Livre (emprunts/agregats.py) only evict the details,
+#                           unless disponible changes
+#   categories-<pk>         Categorie detail
+#   categories-list-<pk>    Categories of the Livre <pk> ('None' for every Categorie)
+#   auteurs-<pk>            Auteur detail
+#   auteurs-list-<pk>       Auteur of the Livre <pk> ('None' for every Auteur)
+#   livres-similaires-<pk>  Voisin of the Livre <pk>, versioned by the 'livres.livre'
+#                           and 'recommandations' generations
+
+CACHE_TIME = 86400 # time in seconds for cache to be valid
+LISTS_CACHE_TIME = 300 # lag of note_moyenne, nb_avis, nb_emprunts in the lists
+LIVRES_SCOPE = 'livres.livre' # also the scope of the cached Livre counts (api/pagination.py)
+
+def livre_key(pk):
+    return 'livres-%s' % (pk)
+
+def categorie_key(pk):
+    return 'categories-%s' % (pk)
+
+def auteur_key(pk):
+    return 'auteurs-%s' % (pk)
+
+def categories_list_key(livres_pk=None):
+    return 'categories-list-%s' % (livres_pk)
+
+def auteurs_list_key(livres_pk=None):
+    return 'auteurs-list-%s' % (livres_pk)
+
+def livres_list_key(query_params, auteurs_pk=None, categories_pk=None, host=''):
+    # the host is part of the key because next/previous links are absolute
+    prefix = 'livres-list-%s-%s-%s' % (host, auteurs_pk, categories_pk)
+    return versioned_key(prefix, [LIVRES_SCOPE], query_params)
+
+def similaires_key(pk, scope):
+    return 'livres-similaires-%s-%s-%s' % (pk, get_generation(LIVRES_SCOPE), get_generation(scope))
+
+#invalidation
+
+def invalidate_livres_lists():
+    bump_generation(LIVRES_SCOPE)
+
+def invalidate_livres(pks):
+    """
+        Evicts the detail of the given Livre, the nested categories / auteurs
+        lists of those Livre and every Livre list.
+    """
+    keys = []
+    for pk in pks:
+        keys += [livre_key(pk), categories_list_key(pk), auteurs_list_key(pk)]
+
+    cache.delete_many(keys)
+    invalidate_livres_lists()
+
+def invalidate_livres_details(pks):
+    """
+        Evicts the detail of the given Livre only, for changes that don't move
+        them in the lists (their aggregates): every Emprunt or Avis would
+        otherwise drop every cached list.
+    """
+    cache.delete_many([livre_key(pk) for pk in pks])
+
+def invalidate_auteurs(pks, livres_pks=None):
+    """
+        Evicts the given Auteur and every Livre that nests them.
+        livres_pks can be given when the relation is already gone (deletion).
+    """
+    if livres_pks is None:
+        livres_pks = Livre.objects.filter(auteur__in=pks).values_list('pk', flat=True)
+
+    cache.delete_many([auteur_key(pk) for pk in pks] + [auteurs_list_key()])
+    invalidate_livres(livres_pks)
+
+def invalidate_categories(pks, livres_pks=None):
+    """
+        Evicts the given Categorie and every Livre that nests them.
+        livres_pks can be given when the relation is already gone (deletion).
+    """
+    if livres_pks is None:
+        livres_pks = Livre.objects.filter(categorie__in=pks).values_list('pk', flat=True)
+
+    cache.delete_many([categorie_key(pk) for pk in pks] + [categories_list_key()])
+    invalidate_livres(livres_pks)
@@ -0,0 +1,261 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from api.cache import bump_generation
+from .models import Livre, Auteur, Categorie, validate_isbn
+from api.models import Compteur
+from .cache import invalidate_livres, invalidate_auteurs, invalidate_categories
+from .search import index_livres
+
+# Import of publisher catalogs (manage.py import_catalogue).
+#
+# The file is read one row at a time and imported by chunks of CHUNK_SIZE
+# rows, each in its own transaction: memory only depends on the chunk size
+# and on the lookup maps of Auteur / Categorie (emptied past MAX_LOOKUP).
+# Livre are upserted on isbn, so importing the same file twice is harmless.
+#
+# columns (CSV header or JSONL keys):
+#   isbn (required), titre, date_publication (YYYY-MM-DD), auteur_nom,
+#   auteur_prenom, categories ('|' separated in CSV, list or string in JSONL)
+
+CHUNK_SIZE = 1000
+MAX_LOOKUP = 100000
+FORMATS = ['csv', 'jsonl']
+CATEGORIES_SEPARATOR = '|'
+DOUBLON_ERROR = 'isbn %(isbn)s is imported again by row %(numero)s.'
+
+def lire(fichier, format):
+    """
+        Yields the rows of an open CSV or JSONL file as dicts,
+        None for a JSONL line that isn't a JSON object.
+    """
+    if format == 'csv':
+        yield from csv.DictReader(fichier)
+        return
+
+    for line in fichier:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+def _texte(row, champ, max_length=255):
+    value = row.get(champ)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise ValidationError('%s is longer than %s characters.' % (champ, max_length))
+    return value or None
+
+def normaliser(row):
+    """
+        Validates a row and returns the Livre it describes as a dict.
+        raise: ValidationError with the reason of the rejection
+    """
+    if row is None:
+        raise ValidationError('Not a JSON object.')
+
+    isbn = _texte(row, 'isbn', 13)
+    if not isbn:
+        raise ValidationError('isbn is required.')
+    validate_isbn(isbn)
+
+    date_publication = _texte(row, 'date_publication')
+    if date_publication:
+        try:
+            date_publication = parse_date(date_publication)
+        except ValueError:
+            date_publication = None
+        if date_publication is None:
+            raise ValidationError('date_publication is not a valid date (YYYY-MM-DD).')
+
+    categories = row.get('categories') or []
+    if isinstance(categories, str):
+        categories = categories.split(CATEGORIES_SEPARATOR)
+    categories = [str(nom).strip()[:255] for nom in categories if str(nom).strip()]
+
+    auteur = (_texte(row, 'auteur_nom'), _texte(row, 'auteur_prenom'))
+    return {
+        'isbn': isbn,
+        'titre': _texte(row, 'titre'),
+        'date_publication': date_publication,
+        'auteur': auteur if any(auteur) else None,
+        'categories': categories,
+    }
+
+def _in_ou_null(champ, valeurs):
+    # IN doesn't match NULL
+    lookup = Q(**{'%s__in' % champ: valeurs - {None}})
+    if None in valeurs:
+        lookup |= Q(**{'%s__isnull' % champ: True})
+    return lookup
+
+class Importeur:
+    """
+        Imports chunks of rows, keeps the Auteur / Categorie already seen
+        and the totals of the import.
+
+        example:
+            importeur = Importeur(rejeter=lambda numero, raison, row: print(numero, raison))
+            importeur.importer([(1, {'isbn': '1234567890123', 'titre': 'titre1'})])
+            importeur.totaux => {'lignes': 1, 'crees': 1, 'modifies': 0, 'rejetes': 0}
+    """
+
+    def __init__(self, createur=None, rejeter=None):
+        self.createur = createur
+        self.rejeter = rejeter
+        self.auteurs = {}
+        self.categories = {}
+        self.totaux = {'lignes': 0, 'crees': 0, 'modifies': 0, 'rejetes': 0}
+
+    def rejet(self, numero, raison, row):
+        self.totaux['rejetes'] += 1
+        if self.rejeter:
+            self.rejeter(numero, raison, row)
+
+    def _auteurs(self, cles):
+        """
+            pk of the Auteur (nom, prenom) of cles, created when missing.
+        """
+        manquants = {cle for cle in cles if cle not in self.auteurs}
+        if len(self.auteurs) + len(manquants) > MAX_LOOKUP:
+            self.auteurs = {}
+            manquants = set(cles)
+
+        if manquants:
+            existants = Auteur.objects.filter(
+                _in_ou_null('nom', {nom for nom, prenom in manquants}),
+                _in_ou_null('prenom', {prenom for nom, prenom in manquants}),
+            ).order_by('pk').values_list('nom', 'prenom', 'pk')
+            for nom, prenom, pk in existants:
+                if (nom, prenom) in manquants:
+                    self.auteurs.setdefault((nom, prenom), pk)
+
+            nouveaux = [Auteur(nom=nom, prenom=prenom) for nom, prenom in manquants if (nom, prenom) not in self.auteurs]
+            if nouveaux:
+                Auteur.objects.bulk_create(nouveaux)
+                auteurs_pks = [auteur.pk for auteur in nouveaux]
+                transaction.on_commit(lambda: invalidate_auteurs(auteurs_pks, []))
+                transaction.on_commit(lambda: bump_generation(Auteur._meta.label_lower))
+            for auteur in nouveaux:
+                self.auteurs[(auteur.nom, auteur.prenom)] = auteur.pk
+
+        return {cle: self.auteurs[cle] for cle in cles}
+
+    def _categories(self, noms):
+        manquants = {nom for nom in noms if nom not in self.categories}
+        if len(self.categories) + len(manquants) > MAX_LOOKUP:
+            self.categories = {}
+            manquants = set(noms)
+
+        if manquants:
+            for nom, pk in Categorie.objects.filter(nom__in=manquants).order_by('pk').values_list('nom', 'pk'):
+                self.categories.setdefault(nom, pk)
+
+            nouvelles = [Categorie(nom=nom) for nom in manquants if nom not in self.categories]
+            if nouvelles:
+                Categorie.objects.bulk_create(nouvelles)
+                categories_pks = [categorie.pk for categorie in nouvelles]
+                transaction.on_commit(lambda: invalidate_categories(categories_pks, []))
+                transaction.on_commit(lambda: bump_generation(Categorie._meta.label_lower))
+            for categorie in nouvelles:
+                self.categories[categorie.nom] = categorie.pk
+
+        return {nom: self.categories[nom] for nom in noms}
+
+    def importer(self, lot):
+        """
+            Imports a chunk of (line number, row) in one transaction.
+        """
+        self.totaux['lignes'] += len(lot)
+
+        livres = {}
+        for numero, row in lot:
+            try:
+                livre = normaliser(row)
+            except ValidationError as exc:
+                self.rejet(numero, ' '.join(exc.messages), row)
+                continue
+            # the same isbn twice in a chunk: the last row wins, the earlier one is rejected
+            livre['numero'], livre['row'] = numero, row
+            precedent = livres.pop(livre['isbn'], None)
+            if precedent:
+                self.rejet(precedent['numero'], DOUBLON_ERROR % {'isbn': livre['isbn'], 'numero': numero}, precedent['row'])
+            livres[livre['isbn']] = livre
+
+        if not livres:
+            return
+
+        with transaction.atomic():
+            auteurs = self._auteurs({livre['auteur'] for livre in livres.values() if livre['auteur']})
+            for livre in livres.values():
+                livre['auteur_id'] = auteurs.get(livre['auteur'])
+
+            existants = dict(Livre.objects.filter(isbn__in=livres.keys()).values_list('isbn', 'pk'))
+
+            # titre / auteur used by another isbn (in the database or earlier in the chunk)
+            pris = {}
+            paires = [(livre['titre'], livre['auteur_id']) for livre in livres.values() if livre['titre'] and livre['auteur_id']]
+            if paires:
+                pris = {
+                    (titre, auteur_id): isbn for titre, auteur_id, isbn in Livre.objects.filter(
+                        titre__in={titre for titre, auteur_id in paires},
+                        auteur__in={auteur_id for titre, auteur_id in paires},
+                    ).values_list('titre', 'auteur', 'isbn')
+                }
+            for isbn, livre in list(livres.items()):
+                paire = (livre['titre'], livre['auteur_id'])
+                if livre['titre'] and livre['auteur_id']:
+                    if pris.get(paire, isbn) != isbn:
+                        self.rejet(livre['numero'], str(Livre.TITRE_AUTEUR_ERROR), livre['row'])
+                        del livres[isbn]
+                        continue
+                    pris[paire] = isbn
+
+            objets = [
+                Livre(
+                    isbn=isbn,
+                    titre=livre['titre'],
+                    date_publication=livre['date_publication'],
+                    auteur_id=livre['auteur_id'],
+                    createur=self.createur,
+                )
+                for isbn, livre in livres.items()
+            ]
+            Livre.objects.bulk_create(
+                objets,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=['titre', 'date_publication', 'auteur'],
+            )
+            pks = {livre.isbn: livre.pk for livre in objets}
+
+            # the categories of the file replace the ones of the Livre
+            categories = self._categories({nom for livre in livres.values() for nom in livre['categories']})
+            avec_categories = [pks[isbn] for isbn, livre in livres.items() if livre['categories']]
+            Through = Livre.categorie.through
+            Through.objects.filter(livre__in=avec_categories).delete()
+            Through.objects.bulk_create([
+                Through(livre_id=pks[isbn], categorie_id=categorie_id)
+                for isbn, livre in livres.items()
+                for categorie_id in {categories[nom] for nom in livre['categories']}
+            ])
+
+            crees = len([isbn for isbn in livres if isbn not in existants])
+            Compteur.ajouter(Livre, crees)
+            index_livres(pks.values())
+            # after the commit, a request can't cache the previous rows under the new generation
+            livres_pks = list(pks.values())
+            transaction.on_commit(lambda: invalidate_livres(livres_pks))
+
+        self.totaux['crees'] += crees
+        self.totaux['modifies'] += len(livres) - crees
@@ -1,10 +1,14 @@
 import django_filters
 from django_filters.widgets import RangeWidget
 from .models import *
+from rest_framework.exceptions import ValidationError
+
+from .search import search
 
 class LivreFilterSet(django_filters.FilterSet):
     titre = django_filters.CharFilter(lookup_expr='icontains', field_name='titre')
     date_publication = django_filters.DateFromToRangeFilter(widget=RangeWidget(attrs={'type': 'date'}))
+    q = django_filters.CharFilter(method='filter_q', label='Full-text search on titre, auteur and categories')
     
     class Meta:
         model = Livre
@@ -14,7 +18,12 @@ class LivreFilterSet(django_filters.FilterSet):
             'auteur__prenom',
             'date_publication',
             'categorie__nom',
+            'disponible',
             ]
-        
 
-    
\ No newline at end of file
+    def filter_q(self, queryset, name, value):
+        # the keyset pagination orders by ?ordering= and pk, the BM25 rank would be lost
+        query_params = self.request.query_params if self.request else {}
+        if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+            raise ValidationError({'q': ['The full-text search is not available with ?pagination=cursor.']})
+        return search(queryset, value)
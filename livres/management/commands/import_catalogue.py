@@ -0,0 +1,102 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from livres.catalogue import CHUNK_SIZE, FORMATS, Importeur, lire
+
+class Command(BaseCommand):
+    help = 'Imports (creates or updates on isbn) the Livre of a CSV or JSONL catalog, by chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help='CSV or JSONL file')
+        parser.add_argument('--format', choices=FORMATS, help='format of the file (from its extension by default)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows imported per transaction')
+        parser.add_argument('--checkpoint', help='JSON file keeping the last imported row, the import resumes after it')
+        parser.add_argument('--rejets', help='CSV file receiving the rejected rows (ligne, raison, donnees)')
+        parser.add_argument('--createur', help='username of the createur of the new Livre')
+
+    def handle(self, *args, **options):
+        format = options['format'] or os.path.splitext(options['fichier'])[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError('Unknown format "%s", use --format (%s).' % (format, ', '.join(FORMATS)))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        createur = None
+        if options['createur']:
+            createur = User.objects.filter(username=options['createur']).first()
+            if createur is None:
+                raise CommandError('Unknown user "%s".' % options['createur'])
+
+        checkpoint = options['checkpoint']
+        deja_importe = lire_checkpoint(checkpoint)
+        if deja_importe:
+            self.stdout.write('Resuming after row %s' % (deja_importe))
+
+        rejets = open(options['rejets'], 'a', newline='', encoding='utf-8') if options['rejets'] else None
+        writer = csv.writer(rejets) if rejets else None
+
+        def rejeter(numero, raison, row):
+            if writer:
+                writer.writerow([numero, raison, json.dumps(row, default=str, ensure_ascii=False)])
+
+        importeur = Importeur(createur=createur, rejeter=rejeter)
+        debut = time.monotonic()
+
+        try:
+            with open(options['fichier'], newline='', encoding='utf-8') as fichier:
+                rows = enumerate(lire(fichier, format), start=1)
+                # rows already imported are read again but not imported
+                for numero, row in islice(rows, deja_importe):
+                    pass
+
+                while True:
+                    lot = list(islice(rows, options['chunk_size']))
+                    if not lot:
+                        break
+
+                    importeur.importer(lot)
+                    ecrire_checkpoint(checkpoint, lot[-1][0])
+                    if rejets:
+                        rejets.flush()
+
+                    duree = time.monotonic() - debut
+                    self.stdout.write('row %s: %s row(s)/s' % (lot[-1][0], int(importeur.totaux['lignes'] / duree) if duree else importeur.totaux['lignes']))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError('Unreadable file: %s' % (exc))
+        finally:
+            if rejets:
+                rejets.close()
+
+        totaux = importeur.totaux
+        duree = time.monotonic() - debut
+        self.stdout.write(self.style.SUCCESS(
+            '%(lignes)s row(s): %(crees)s created, %(modifies)s updated, %(rejetes)s rejected' % totaux
+            + ' in %.1fs' % (duree)
+        ))
+
+def lire_checkpoint(checkpoint):
+    """
+        Number of rows already imported according to the checkpoint file, 0 when it doesn't exist.
+    """
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint, encoding='utf-8') as fichier:
+        try:
+            return int(json.load(fichier)['ligne'])
+        except (ValueError, KeyError, TypeError):
+            raise CommandError('Invalid checkpoint file "%s".' % (checkpoint))
+
+def ecrire_checkpoint(checkpoint, ligne):
+    # written next to the file then renamed: an interrupted write never leaves a truncated checkpoint
+    if not checkpoint:
+        return
+    temporaire = '%s.tmp' % (checkpoint)
+    with open(temporaire, 'w', encoding='utf-8') as fichier:
+        json.dump({'ligne': ligne}, fichier)
+    os.replace(temporaire, checkpoint)
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# SQLite only: FTS5 index of the catalog used by livres/search.py,
+# the rowid of a row is the id of its Livre.
+
+CREATE_SQL = """
+    CREATE VIRTUAL TABLE livres_livre_fts USING fts5(
+        titre, auteur, categories,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+POPULATE_SQL = """
+    INSERT INTO livres_livre_fts (rowid, titre, auteur, categories)
+    SELECT
+        livre.id,
+        COALESCE(livre.titre, ''),
+        TRIM(COALESCE(auteur.prenom, '') || ' ' || COALESCE(auteur.nom, '')),
+        COALESCE((
+            SELECT group_concat(categorie.nom, ' ')
+            FROM livres_livre_categorie AS lien
+            JOIN livres_categorie AS categorie ON categorie.id = lien.categorie_id
+            WHERE lien.livre_id = livre.id
+        ), '')
+    FROM livres_livre AS livre
+    LEFT JOIN livres_auteur AS auteur ON auteur.id = livre.auteur_id
+"""
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS livres_livre_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livres', '0009_remove_emprunt_livre_remove_emprunt_membre_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
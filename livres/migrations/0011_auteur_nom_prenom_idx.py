@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livres', '0010_livre_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auteur',
+            index=models.Index(fields=['nom', 'prenom'], name='auteur_nom_prenom_idx'),
+        ),
+    ]
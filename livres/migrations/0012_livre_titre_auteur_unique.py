@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 20:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livres', '0011_auteur_nom_prenom_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='livre',
+            constraint=models.UniqueConstraint(fields=('titre', 'auteur'), name='livre_titre_auteur_unique', violation_error_message='This author already used this title.'),
+        ),
+    ]
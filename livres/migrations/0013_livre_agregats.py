@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-18 20:28
+
+from django.db import migrations, models
+from django.db.models import F, Value, FloatField, IntegerField, Count, Sum, Subquery, OuterRef
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_agregats(apps, schema_editor):
+    Livre = apps.get_model('livres', 'Livre')
+    Avis = apps.get_model('emprunts', 'Avis')
+    Emprunt = apps.get_model('emprunts', 'Emprunt')
+
+    def total(model, aggregate):
+        return Coalesce(Subquery(
+            model.objects.filter(livre=OuterRef('pk')).order_by().values('livre').annotate(total=aggregate).values('total'),
+            output_field=IntegerField(),
+        ), 0)
+
+    Livre.objects.update(
+        nb_avis=total(Avis, Count('pk')),
+        nb_emprunts=total(Emprunt, Count('pk')),
+        somme_notes=total(Avis, Sum('note')),
+        nb_notes=total(Avis, Count('note')),
+    )
+    Livre.objects.update(note_moyenne=Cast(F('somme_notes'), FloatField()) / NullIf(F('nb_notes'), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livres', '0012_livre_titre_auteur_unique'),
+        ('emprunts', '0008_emprunt_avis_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livre',
+            name='nb_avis',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='livre',
+            name='nb_emprunts',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='livre',
+            name='nb_notes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livre',
+            name='note_moyenne',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='livre',
+            name='somme_notes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_agregats, migrations.RunPython.noop),
+    ]
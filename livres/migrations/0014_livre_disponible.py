@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+def fill_disponible(apps, schema_editor):
+    Livre = apps.get_model('livres', 'Livre')
+    Emprunt = apps.get_model('emprunts', 'Emprunt')
+    en_cours = Emprunt.objects.filter(retourne__isnull=True)
+    for livre_id in en_cours.values_list('livre', flat=True).distinct():
+        if livre_id is not None:
+            Livre.objects.filter(pk=livre_id).update(
+                emprunts_en_cours=en_cours.filter(livre=livre_id).count(),
+                disponible=False,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livres', '0013_livre_agregats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livre',
+            name='disponible',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AddField(
+            model_name='livre',
+            name='emprunts_en_cours',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_disponible, migrations.RunPython.noop),
+    ]
@@ -26,6 +26,12 @@ class Auteur(models.Model):
     prenom = models.CharField(max_length=255, null=True, blank=True)
     date_naissance = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # lookup of an Auteur by name (catalogue import)
+            models.Index(fields=['nom', 'prenom'], name='auteur_nom_prenom_idx'),
+        ]
+
 class Categorie(models.Model):
     """
         Model that describes an category.
@@ -46,13 +52,59 @@ class Livre(models.Model):
     createur = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     categorie = models.ManyToManyField(Categorie, related_name='livre', null=True, blank=True)
 
+    # aggregates of the Avis and Emprunt of the Livre, maintained by emprunts/agregats.py
+    note_moyenne = models.FloatField(null=True, blank=True, db_index=True)
+    nb_avis = models.PositiveIntegerField(default=0, db_index=True)
+    nb_emprunts = models.PositiveIntegerField(default=0, db_index=True)
+    somme_notes = models.PositiveIntegerField(default=0)
+    nb_notes = models.PositiveIntegerField(default=0)
+    emprunts_en_cours = models.PositiveIntegerField(default=0) # Emprunt not returned yet
+    disponible = models.BooleanField(default=True, db_index=True) # no Emprunt en cours
+
+    AGREGATS = ['note_moyenne', 'nb_avis', 'nb_emprunts', 'somme_notes', 'nb_notes', 'emprunts_en_cours', 'disponible']
+
+    TITRE_AUTEUR_ERROR = _("This author already used this title.")
+
+    class Meta:
+        constraints = [
+            # also the index used by titre_deja_utilise()
+            models.UniqueConstraint(
+                fields=['titre', 'auteur'],
+                name='livre_titre_auteur_unique',
+                violation_error_message=_("This author already used this title."),
+            ),
+        ]
+
+    @classmethod
+    def titre_deja_utilise(cls, titre, auteur_id, pk=None):
+        """
+            Returns True if another Livre of the Auteur has this titre.
+            Like the constraint, a Livre without titre or Auteur never conflicts.
+        """
+        if titre is None or auteur_id is None:
+            return False
+        return cls.objects.filter(titre=titre, auteur_id=auteur_id).exclude(pk=pk).exists()
+
     def clean(self):
         errors = {}
-        double = Livre.objects.filter(titre=self.titre, auteur=self.auteur)
-        if double:
-            errors['titre'] = ValidationError(_("This author already used this title."))
+        if Livre.titre_deja_utilise(self.titre, self.auteur_id, self.pk):
+            errors['titre'] = ValidationError(self.TITRE_AUTEUR_ERROR)
 
         if errors:
             raise ValidationError(errors)
     
         super().clean()
+
+    def save(self, *args, **kwargs):
+        # the aggregates are only written with F() expressions, an instance
+        # loaded before an Avis or Emprunt was saved must not overwrite them
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.AGREGATS
+            ]
+        super().save(*args, **kwargs)
+
+    def validate_constraints(self, exclude=None):
+        # titre / auteur is already checked by clean()
+        super().validate_constraints(exclude={*(exclude or ()), 'titre'})
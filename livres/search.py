@@ -0,0 +1,108 @@
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Livre
+
+# Full-text search on the catalog, backed by the SQLite FTS5 table
+# livres_livre_fts (created by migration 0010) whose rowid is the id of the Livre:
+#
+#   titre       Livre.titre
+#   auteur      prenom and nom of the Auteur
+#   categories  nom of every Categorie of the Livre
+#
+# The table is kept in sync by the receivers of livres/signals.py.
+
+FTS_TABLE = 'livres_livre_fts'
+CHUNK_SIZE = 500
+# highlight() returns the stored titre as it is: the matches are framed with
+# these control characters, replaced by <b></b> once the titre is escaped
+DEBUT_SURLIGNE = '\x02'
+FIN_SURLIGNE = '\x03'
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+def match_expression(text):
+    """
+        Turns the text typed by the user into a FTS5 query where every word
+        must match, as a prefix.
+
+        example:
+            match_expression('Petit prin') => '"Petit"* "prin"*'
+    """
+    return ' '.join('"%s"*' % word for word in re.findall(r'\w+', text))
+
+def surligner(titre_surligne):
+    """
+        HTML of a titre returned by search(), escaped, with the matches in <b></b>.
+
+        example:
+            surligner('<i> \\x02Petit\\x03') => '&lt;i&gt; <b>Petit</b>'
+    """
+    if titre_surligne is None:
+        return None
+    return html.escape(titre_surligne).replace(DEBUT_SURLIGNE, '<b>').replace(FIN_SURLIGNE, '</b>')
+
+def index_livres(pks):
+    """
+        (Re)indexes the given Livre, the ones that don't exist anymore are
+        removed from the index.
+    """
+    if not is_enabled():
+        return
+
+    pks = list(pks)
+    for start in range(0, len(pks), CHUNK_SIZE):
+        chunk = pks[start:start + CHUNK_SIZE]
+        livres = Livre.objects.filter(pk__in=chunk).select_related('auteur').prefetch_related('categorie')
+        rows = [
+            (
+                livre.pk,
+                livre.titre or '',
+                ' '.join(filter(None, [livre.auteur.prenom, livre.auteur.nom])) if livre.auteur else '',
+                ' '.join(filter(None, [categorie.nom for categorie in livre.categorie.all()])),
+            )
+            for livre in livres
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(chunk))),
+                chunk,
+            )
+            cursor.executemany(
+                'INSERT INTO %s (rowid, titre, auteur, categories) VALUES (%%s, %%s, %%s, %%s)' % FTS_TABLE,
+                rows,
+            )
+
+def search(queryset, text):
+    """
+        Filters queryset on the Livre matching text, best matches (BM25) first.
+        Each Livre gets titre_surligne, its titre with the matching words between
+        DEBUT_SURLIGNE and FIN_SURLIGNE (see surligner()).
+    """
+    expression = match_expression(text)
+    if not expression:
+        return queryset
+
+    if not is_enabled():
+        return queryset.filter(
+            Q(titre__icontains=text)
+            | Q(auteur__nom__icontains=text)
+            | Q(auteur__prenom__icontains=text)
+            | Q(categorie__nom__icontains=text)
+        ).distinct()
+
+    return queryset.extra(
+        select={
+            'rang': 'bm25(%s)' % FTS_TABLE,
+            'titre_surligne': 'highlight(%s, 0, %%s, %%s)' % FTS_TABLE,
+        },
+        select_params=[DEBUT_SURLIGNE, FIN_SURLIGNE],
+        tables=[FTS_TABLE],
+        where=['%s.rowid = livres_livre.id' % FTS_TABLE, '%s MATCH %%s' % FTS_TABLE],
+        params=[expression],
+    ).order_by('rang')
@@ -5,6 +5,8 @@ from datetime import date
   
 from django.utils.translation import gettext_lazy as _
 from rest_framework.validators import UniqueTogetherValidator
+from api.serializers import EagerLoadingMixin
+from .search import surligner
 
 class LivreItemSerializer(serializers.Serializer):
     """
@@ -81,7 +83,14 @@ class AuteurSerializer(serializers.ModelSerializer):
             'date_naissance',
         ]
 
-class LivreSerializer(serializers.ModelSerializer):
+class SurligneField(serializers.CharField):
+    """
+        titre_surligne of the full-text search, escaped HTML with the matches in <b></b>.
+    """
+    def to_representation(self, value):
+        return surligner(value)
+
+class LivreSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """
         Serializer that transforms data passed into a Livre
         JSON, form => Livre (object)
@@ -89,17 +98,24 @@ class LivreSerializer(serializers.ModelSerializer):
     auteur = AuteurItemSerializer(read_only=True)
     createur = UserItemSerializer(read_only=True)
     categorie = CategorieItemSerializer(read_only=True, many=True)
+    titre_surligne = SurligneField(read_only=True) # only set by the full-text search (?q=)
     class Meta:
         model = Livre
         fields = [
             'pk',
             'titre',
+            'titre_surligne',
             'auteur',
             'date_publication',
             'isbn',
             'createur',
-            'categorie'
+            'categorie',
+            'note_moyenne',
+            'nb_avis',
+            'nb_emprunts',
+            'disponible',
         ]
+        read_only_fields = ['note_moyenne', 'nb_avis', 'nb_emprunts', 'disponible']
 
     """
         Function that checks if a date is valid.
@@ -120,5 +136,47 @@ class LivreSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(_(str(value) + " is in the future."))
         return value
 
-   
-    
\ No newline at end of file
+    def validate(self, attrs):
+        # the Auteur is only set by set-auteur, a new Livre has none
+        if self.instance is not None and 'titre' in attrs:
+            if Livre.titre_deja_utilise(attrs['titre'], self.instance.auteur_id, self.instance.pk):
+                raise serializers.ValidationError({'titre': [Livre.TITRE_AUTEUR_ERROR]})
+        return attrs
+
+class LivreBulkItemSerializer(serializers.Serializer):
+    """
+        Serializer of one Livre of POST /livres/bulk/, it makes no query:
+        the isbn format, the uniqueness checks and the related objects are
+        validated by livres/bulk.py for the whole list at once.
+        auteur is the pk of an Auteur, categorie a list of pk of Categorie.
+    """
+    titre = serializers.CharField(max_length=255, required=False, allow_null=True, allow_blank=True)
+    date_publication = serializers.DateField(required=False, allow_null=True)
+    isbn = serializers.CharField(max_length=13, required=False, allow_null=True)
+    auteur = serializers.IntegerField(required=False, allow_null=True)
+    categorie = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate_date_publication(self, value):
+        if value:
+            if value > date.today():
+                raise serializers.ValidationError(_(str(value) + " is in the future."))
+        return value
+
+class LivresPkSerializer(serializers.Serializer):
+    """
+        Body of /categories/<pk>/livres/bulk-add/ and bulk-remove/, the pk of the Livre.
+    """
+    livres = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+class CategoriesMappingSerializer(serializers.Serializer):
+    """
+        Body of PUT /livres/bulk-categories/, pk of a Livre => pk of its Categorie.
+        example: {'livres': {'1': [2, 3], '4': []}}
+    """
+    livres = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()), allow_empty=False)
+
+    def validate_livres(self, value):
+        try:
+            return {int(pk): set(categories) for pk, categories in value.items()}
+        except ValueError:
+            raise serializers.ValidationError(_("The keys must be pk of Livre."))
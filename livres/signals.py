@@ -0,0 +1,73 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from api.cache import bump_generation
+from .models import Livre, Auteur, Categorie
+from api.models import Compteur
+from .cache import invalidate_livres, invalidate_auteurs, invalidate_categories
+from .search import index_livres
+
+# Receivers that keep the response caches of livres/views.py, the
+# full-text index of livres/search.py and the Compteur of Livre up to date.
+
+@receiver(post_save, sender=Livre)
+@receiver(post_delete, sender=Livre)
+def livre_changed(sender, instance, **kwargs):
+    invalidate_livres([instance.pk])
+    index_livres([instance.pk])
+
+@receiver(post_save, sender=Livre)
+def livre_created(sender, instance, created, **kwargs):
+    if created:
+        Compteur.ajouter(Livre, 1)
+
+@receiver(post_delete, sender=Livre)
+def livre_deleted(sender, instance, **kwargs):
+    Compteur.ajouter(Livre, -1)
+
+# The relations to Livre are removed before post_delete is sent
+# (SET_NULL for Auteur, through rows for Categorie), keep them on the instance.
+
+@receiver(pre_delete, sender=Auteur)
+def remember_auteur_livres(sender, instance, **kwargs):
+    instance._livres_pks = list(instance.livre_set.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Categorie)
+def remember_categorie_livres(sender, instance, **kwargs):
+    instance._livres_pks = list(instance.livre.values_list('pk', flat=True))
+
+@receiver(post_save, sender=Auteur)
+@receiver(post_delete, sender=Auteur)
+def auteur_changed(sender, instance, **kwargs):
+    livres_pks = getattr(instance, '_livres_pks', None)
+    if livres_pks is None:
+        livres_pks = list(instance.livre_set.values_list('pk', flat=True))
+
+    invalidate_auteurs([instance.pk], livres_pks)
+    bump_generation(sender._meta.label_lower)
+    index_livres(livres_pks)
+
+@receiver(post_save, sender=Categorie)
+@receiver(post_delete, sender=Categorie)
+def categorie_changed(sender, instance, **kwargs):
+    livres_pks = getattr(instance, '_livres_pks', None)
+    if livres_pks is None:
+        livres_pks = list(instance.livre.values_list('pk', flat=True))
+
+    invalidate_categories([instance.pk], livres_pks)
+    bump_generation(sender._meta.label_lower)
+    index_livres(livres_pks)
+
+@receiver(m2m_changed, sender=Livre.categorie.through)
+def livre_categorie_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            instance._cleared_livres_pks = list(instance.livre.values_list('pk', flat=True))
+            return
+        livres_pks = pk_set if pk_set is not None else getattr(instance, '_cleared_livres_pks', [])
+    else:
+        livres_pks = [instance.pk]
+
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_livres(livres_pks)
+        index_livres(livres_pks)
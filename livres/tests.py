@@ -1,11 +1,36 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.core.exceptions import ValidationError
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError, transaction, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from .models import * 
 from .serializers import *
 from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import QueryDict
+from api.cache_backends import CircuitBreaker
+from api.cache import get_generation, generation_key, get_or_compute, lock_key
+from .cache import livres_list_key, livre_key, invalidate_livres_lists
+from .search import match_expression, search
+from .catalogue import Importeur
+from . import bulk
+from api.pagination import fast_count
+from api.models import Compteur
+from api.exceptions import custom_exception_handler
+from api.streaming import buffered, gzipped
 
 # Create your tests here.
 
@@ -152,6 +177,66 @@ class LivreTestCase(TestCase):
         self.assertIsNone(livre1.auteur)
         self.assertIsNone(livre2.auteur)
 
+class LivreTitreAuteurTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='1234')
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098', auteur=self.auteur, createur=self.user)
+        self.autre = Livre.objects.create(titre='titre2', isbn='1234567890099', createur=self.user)
+        self.client.force_authenticate(self.user)
+
+    def test_clean_does_not_flag_the_livre_itself(self):
+        # auteur and createur exist, titre / auteur, isbn uniqueness
+        with self.assertNumQueries(4):
+            self.livre.full_clean()
+
+    def test_clean_flags_the_same_titre(self):
+        self.autre.titre = 'titre1'
+        self.autre.auteur = self.auteur
+        with self.assertRaises(ValidationError) as context:
+            self.autre.full_clean()
+        self.assertEqual(context.exception.message_dict, {'titre': ['This author already used this title.']})
+
+    def test_constraint(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Livre.objects.create(titre='titre1', auteur=self.auteur)
+
+        # like NULL in every unique index, a Livre without Auteur never conflicts
+        Livre.objects.create(titre='titre2')
+
+    def test_integrity_error_by_constraint_name(self):
+        # a database naming the violated constraint (PostgreSQL) gets the serializer error
+        exc = IntegrityError('duplicate key value violates unique constraint "livre_titre_auteur_unique"')
+        response = custom_exception_handler(exc, {'request': None, 'view': None})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['titre'], ['This author already used this title.'])
+
+    def test_integrity_error_from_sqlite(self):
+        # the check of the serializer is skipped: the constraint of the database rejects the Livre
+        self.client.patch(reverse('livres:livres-set-auteur', kwargs={'pk': self.autre.pk, 'auteur_pk': self.auteur.pk}))
+        with patch.object(Livre, 'titre_deja_utilise', return_value=False):
+            with transaction.atomic():
+                response = self.client.patch(reverse('livres:livres-detail', kwargs={'pk': self.autre.pk}), {'titre': 'titre1'})
+                transaction.set_rollback(True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['titre'], [Livre.TITRE_AUTEUR_ERROR])
+
+    def test_api_errors(self):
+        url = reverse('livres:livres-detail', kwargs={'pk': self.autre.pk})
+        response = self.client.patch(reverse('livres:livres-set-auteur', kwargs={'pk': self.autre.pk, 'auteur_pk': self.auteur.pk}))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.patch(url, {'titre': 'titre1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['titre'], ['This author already used this title.'])
+
+        self.client.patch(url, {'titre': 'titre3'})
+        Livre.objects.filter(pk=self.autre.pk).update(titre='titre1', auteur=None)
+        response = self.client.patch(reverse('livres:livres-set-auteur', kwargs={'pk': self.autre.pk, 'auteur_pk': self.auteur.pk}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['titre'], ['This author already used this title.'])
+
 class AuteurTestCase(TestCase):
     
     def test_nom_bellow_255_characters(self):
@@ -260,7 +345,7 @@ class LivreSerializerTestCase(TestCase):
     def test_is_valid_serializer(self):
         data = {
             'titre': 'titre 1',
-            'date_publication': '2025-12-12',
+            'date_publication': str(date.today() + timedelta(days=1)),
             'isbn': '1234567890098'
         }
         serializer = LivreSerializer(data=data)
@@ -516,7 +601,7 @@ class LivreApiTestCase(APITestCase):
         }
         url = reverse('livres:livres-list')
         response = self.client.post(url)
-        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.status_code, 403)
  
         livre_data = {
             'titre': 'un nouveau titre',
@@ -525,18 +610,18 @@ class LivreApiTestCase(APITestCase):
         }
         url = reverse('livres:livres-detail', kwargs={'pk': 1})
         response = self.client.put(url)
-        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.status_code, 403)
 
         livre_data = {
             'titre': 'un nouveau titre',
         }
         url = reverse('livres:livres-detail', kwargs={'pk': 1})
         response = self.client.patch(url)
-        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.status_code, 403)
 
         url = reverse('livres:livres-detail', kwargs={'pk': 1})
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.status_code, 403)
 
         self.authenticate()
 
@@ -610,4 +695,1032 @@ class LivreApiTestCase(APITestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, 201)
         cache.clear()
-        
\ No newline at end of file
+        
+
+#===================================================================================
+#Cache
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheInvalidationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='1234')
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        self.categorie = Categorie.objects.create(nom='Aventure', description='voyage')
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098', createur=self.user)
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_edit_livre_invalidates_detail_and_list(self):
+        detail = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        liste = reverse('livres:livres-list', query={'titre': 'titre'})
+        self.assertEqual(self.client.get(detail).data['titre'], 'titre1')
+        self.assertEqual(self.client.get(liste).data['count'], 1)
+
+        self.client.patch(detail, {'titre': 'autre'})
+        self.assertEqual(self.client.get(detail).data['titre'], 'autre')
+        self.assertEqual(self.client.get(liste).data['count'], 0)
+
+    def test_set_auteur_and_rename_auteur(self):
+        detail = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        self.assertIsNone(self.client.get(detail).data['auteur'])
+
+        url = reverse('livres:livres-set-auteur', kwargs={'pk': self.livre.pk, 'auteur_pk': self.auteur.pk})
+        self.client.patch(url)
+        self.assertEqual(self.client.get(detail).data['auteur']['nom'], 'Sithi')
+
+        self.auteur.nom = 'Perosino'
+        self.auteur.save()
+        self.assertEqual(self.client.get(detail).data['auteur']['nom'], 'Perosino')
+
+        self.auteur.delete()
+        self.assertIsNone(self.client.get(detail).data['auteur'])
+
+    def test_add_and_remove_categorie(self):
+        detail = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        categories = reverse('livres:livres-categories-list', kwargs={'livres_pk': self.livre.pk})
+        self.assertEqual(len(self.client.get(categories).data), 0)
+
+        url = reverse('livres:livres-add-categorie', kwargs={'pk': self.livre.pk, 'categorie_pk': self.categorie.pk})
+        self.client.patch(url)
+        self.assertEqual(len(self.client.get(categories).data), 1)
+        self.assertEqual(len(self.client.get(detail).data['categorie']), 1)
+
+        self.categorie.livre.clear()
+        self.assertEqual(len(self.client.get(categories).data), 0)
+        self.assertEqual(len(self.client.get(detail).data['categorie']), 0)
+
+    def test_delete_categorie(self):
+        self.livre.categorie.add(self.categorie)
+        detail = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        self.assertEqual(len(self.client.get(detail).data['categorie']), 1)
+        self.assertEqual(len(self.client.get(reverse('livres:categorie-list')).data), 1)
+
+        self.categorie.delete()
+        self.assertEqual(len(self.client.get(detail).data['categorie']), 0)
+        self.assertEqual(len(self.client.get(reverse('livres:categorie-list')).data), 0)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GenerationKeyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_equivalent_queries_share_a_key(self):
+        key1 = livres_list_key(QueryDict('page=2&titre=x'))
+        key2 = livres_list_key(QueryDict('titre=x&page=2&auteur__nom='))
+        key3 = livres_list_key(QueryDict('titre=y&page=2'))
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, key3)
+
+    def test_bump_changes_every_list_key(self):
+        key1 = livres_list_key(QueryDict('page=2'))
+        key2 = livres_list_key(QueryDict('page=2'), categories_pk=1)
+        invalidate_livres_lists()
+        self.assertNotEqual(key1, livres_list_key(QueryDict('page=2')))
+        self.assertNotEqual(key2, livres_list_key(QueryDict('page=2'), categories_pk=1))
+
+    def test_generation_restarts_above_evicted_values(self):
+        generation = get_generation('livres.livre')
+        cache.delete(generation_key('livres.livre'))
+        self.assertGreaterEqual(get_generation('livres.livre'), generation)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SingleFlightTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def tearDown(self):
+        cache.clear()
+
+    def compute(self):
+        self.calls += 1
+        return 'valeur %s' % self.calls
+
+    def test_computes_once(self):
+        self.assertEqual(get_or_compute('cle', self.compute, 60), 'valeur 1')
+        self.assertEqual(get_or_compute('cle', self.compute, 60), 'valeur 1')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get(lock_key('cle')))
+
+    def test_stale_value_served_while_locked(self):
+        get_or_compute('cle', self.compute, -1)
+        cache.add(lock_key('cle'), 1)
+        self.assertEqual(get_or_compute('cle', self.compute, 60), 'valeur 1')
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(lock_key('cle'))
+        self.assertEqual(get_or_compute('cle', self.compute, 60), 'valeur 2')
+
+    def test_waiter_gets_value_written_by_lock_holder(self):
+        cache.add(lock_key('cle'), 1)
+        with patch('time.sleep', lambda seconds: cache.set('cle', ('calculee', time.time() + 60, 0))):
+            self.assertEqual(get_or_compute('cle', self.compute, 60), 'calculee')
+        self.assertEqual(self.calls, 0)
+
+    def test_lock_released_when_compute_fails(self):
+        def fail():
+            raise Livre.DoesNotExist()
+
+        with self.assertRaises(Livre.DoesNotExist):
+            get_or_compute('cle', fail, 60)
+        self.assertIsNone(cache.get(lock_key('cle')))
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'api.cache_backends.TieredCache',
+        'LOCATION': 'tiered-tests',
+        'OPTIONS': {'REMOTE': 'remote', 'MAX_ENTRIES': 2, 'LOCAL_TIMEOUT': 60},
+    },
+    'remote': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-tests'},
+})
+class TieredCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.remote = caches['remote']
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_hit_served_from_local_tier(self):
+        cache.set('cle', 'valeur')
+        self.remote.delete('cle')
+        hits = cache.stats['local_hits']
+        self.assertEqual(cache.get('cle'), 'valeur')
+        self.assertEqual(cache.stats['local_hits'], hits + 1)
+
+    def test_remote_hit_fills_local_tier(self):
+        self.remote.set('cle', 'valeur')
+        self.assertEqual(cache.get('cle'), 'valeur')
+        self.remote.delete('cle')
+        self.assertEqual(cache.get('cle'), 'valeur')
+
+    def test_delete_and_incr_are_coherent(self):
+        cache.set('cle', 'valeur')
+        cache.delete('cle')
+        self.assertIsNone(cache.get('cle'))
+        self.assertIsNone(self.remote.get('cle'))
+
+        cache.set('generation-livres', 1)
+        cache.incr('generation-livres')
+        self.assertEqual(cache.get('generation-livres'), 2)
+        self.assertEqual(self.remote.get('generation-livres'), 2)
+
+    def test_local_tier_is_bounded(self):
+        for cle in ['a', 'b', 'c']:
+            cache.set(cle, cle)
+        self.remote.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'c')
+
+    def test_locks_skip_local_tier(self):
+        self.assertTrue(cache.add(lock_key('cle'), 1))
+        self.remote.delete(lock_key('cle'))
+        self.assertTrue(cache.add(lock_key('cle'), 1))
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RenderedResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.livres = [
+            Livre.objects.create(titre='titre %s' % i, isbn='12345678900%s' % (10 + i), date_publication='2025-01-01')
+            for i in range(5)
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_hit_skips_serializer(self):
+        url = reverse('livres:livres-detail', kwargs={'pk': self.livres[0].pk})
+        first = self.client.get(url)
+        with patch.object(LivreSerializer, 'to_representation') as to_representation:
+            second = self.client.get(url)
+            to_representation.assert_not_called()
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.json()['titre'], 'titre 0')
+        self.assertIsInstance(cache.get(livre_key(self.livres[0].pk))[0]['content'], bytes)
+
+    def test_big_body_served_gzipped(self):
+        url = reverse('livres:livres-list', query={'page_size': 5})
+        with patch('api.cache.COMPRESS_MIN_SIZE', 0):
+            plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(plain.data['count'], 5)
+
+    def test_browsable_api_still_rendered(self):
+        url = reverse('livres:livres-detail', kwargs={'pk': self.livres[0].pk})
+        self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/html', response['Content-Type'])
+
+class FakeMemcachedCache(LocMemCache):
+    """
+        Stand-in for memcached that can be switched off
+    """
+    down = False
+    calls = 0
+
+    def _check(self):
+        FakeMemcachedCache.calls += 1
+        if FakeMemcachedCache.down:
+            raise ConnectionRefusedError('memcached is down')
+
+    def get(self, *args, **kwargs):
+        self._check()
+        return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self._check()
+        return super().set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        self._check()
+        return super().add(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._check()
+        return super().delete(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        self._check()
+        return super().incr(*args, **kwargs)
+
+    def clear(self):
+        self._check()
+        return super().clear()
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'api.cache_backends.ResilientCache',
+        'LOCATION': 'resilient-tests',
+        'OPTIONS': {'PRIMARY': 'memcached-server', 'FAILURE_THRESHOLD': 2, 'RECOVERY_TIMEOUT': 30},
+    },
+    'memcached-server': {'BACKEND': 'livres.tests.FakeMemcachedCache', 'LOCATION': 'resilient-tests'},
+})
+class ResilientCacheTestCase(APITestCase):
+    def setUp(self):
+        FakeMemcachedCache.down = False
+        cache.clear()
+        cache.breaker.success()
+        self.livre = Livre.objects.create(titre='titre1', isbn='1234567890098')
+
+    def tearDown(self):
+        FakeMemcachedCache.down = False
+        cache.clear()
+        cache.breaker.success()
+
+    def test_outage_degrades_to_database(self):
+        FakeMemcachedCache.down = True
+        url = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['titre'], 'titre1')
+        self.assertEqual(cache.breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_circuit_skips_primary(self):
+        FakeMemcachedCache.down = True
+        cache.get('cle')
+        cache.get('cle')
+        calls = FakeMemcachedCache.calls
+        cache.set('cle', 'valeur')
+        self.assertEqual(cache.get('cle'), 'valeur')
+        self.assertEqual(FakeMemcachedCache.calls, calls)
+
+    def test_probe_closes_circuit(self):
+        FakeMemcachedCache.down = True
+        cache.set('cle', 'locale')
+        cache.set('cle', 'locale')
+        self.assertEqual(cache.breaker.state, CircuitBreaker.OPEN)
+
+        FakeMemcachedCache.down = False
+        cache.breaker.opened_at -= 30
+        self.assertIsNone(cache.get('cle'))
+        self.assertEqual(cache.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_invalidation_during_outage_holds_after_recovery(self):
+        url = reverse('livres:livres-detail', kwargs={'pk': self.livre.pk})
+        self.assertEqual(self.client.get(url).data['titre'], 'titre1')
+        generation = get_generation('livres.livre')
+
+        FakeMemcachedCache.down = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.livre.titre = 'nouveau'
+            self.livre.save()
+        self.assertEqual(cache.breaker.state, CircuitBreaker.OPEN)
+
+        FakeMemcachedCache.down = False
+        cache.breaker.opened_at -= 30
+        self.assertEqual(self.client.get(url).data['titre'], 'nouveau')
+        self.assertNotEqual(get_generation('livres.livre'), generation)
+        self.assertEqual(cache.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_delete_flushes_primary(self):
+        cache.set('cle', 'ancienne')
+        FakeMemcachedCache.down = True
+        cache.delete('cle')
+        self.assertEqual(cache.breaker.state, CircuitBreaker.CLOSED)
+
+        FakeMemcachedCache.down = False
+        self.assertIsNone(cache.get('cle'))
+
+    def test_failed_probe_opens_circuit_again(self):
+        FakeMemcachedCache.down = True
+        cache.get('cle')
+        cache.get('cle')
+        cache.breaker.opened_at -= 30
+        cache.get('cle')
+        self.assertEqual(cache.breaker.state, CircuitBreaker.OPEN)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class NotFoundCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_unknown_ids_return_404(self):
+        for name in ['livres:livres-detail', 'livres:categorie-detail', 'livres:auteur-detail']:
+            response = self.client.get(reverse(name, kwargs={'pk': 999}))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.data['status_code'], 404)
+
+        response = self.client.get(reverse('livres:livres-detail', kwargs={'pk': 'abc'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_leading_zeros_share_the_keys(self):
+        objets = [
+            ('livres:livres-detail', 'titre', Livre.objects.create(titre='titre1', isbn='1234567890098')),
+            ('livres:categorie-detail', 'nom', Categorie.objects.create(nom='Roman')),
+            ('livres:auteur-detail', 'nom', Auteur.objects.create(nom='Sithi')),
+        ]
+        for name, champ, objet in objets:
+            url = reverse(name, kwargs={'pk': '0%s' % (objet.pk)})
+            self.assertEqual(self.client.get(url).data[champ], getattr(objet, champ))
+            with self.captureOnCommitCallbacks(execute=True):
+                setattr(objet, champ, 'nouveau')
+                objet.save()
+            self.assertEqual(self.client.get(url).data[champ], 'nouveau')
+
+    def test_not_found_is_cached(self):
+        url = reverse('livres:livres-detail', kwargs={'pk': 999})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_creation_invalidates_not_found(self):
+        url = reverse('livres:auteur-detail', kwargs={'pk': 999})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        Auteur.objects.create(pk=999, nom='Sithi')
+        self.assertEqual(self.client.get(url).data['nom'], 'Sithi')
+
+
+#===================================================================================
+#Queries
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class LivreQueryCountTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='1234')
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        self.categories = [
+            Categorie.objects.create(nom='Aventure'),
+            Categorie.objects.create(nom='Horreur'),
+        ]
+
+    def create_livres(self, count):
+        for i in range(count):
+            livre = Livre.objects.create(
+                titre='titre %s' % Livre.objects.count(),
+                createur=self.user,
+                auteur=self.auteur,
+            )
+            livre.categorie.add(*self.categories)
+
+    def assert_constant_queries(self, url, queries):
+        self.create_livres(1)
+        with self.assertNumQueries(queries):
+            self.client.get(url)
+
+        self.create_livres(4)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        # count, livres joined with auteur and createur, categories
+        self.assert_constant_queries(reverse('livres:livres-list', query={'page_size': 5}), 3)
+
+    def test_nested_lists(self):
+        url = reverse('livres:categories-livres-list', kwargs={'categories_pk': self.categories[0].pk})
+        self.assert_constant_queries(url + '?page_size=5', 3)
+
+        url = reverse('livres:auteurs-livres-list', kwargs={'auteurs_pk': self.auteur.pk})
+        self.assert_constant_queries(url + '?page_size=5', 3)
+
+    def test_retrieve(self):
+        self.create_livres(1)
+        livre = Livre.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('livres:livres-detail', kwargs={'pk': livre.pk}))
+        self.assertEqual(len(response.data['categorie']), 2)
+
+
+#===================================================================================
+#Search
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.auteur = Auteur.objects.create(nom='Saint-Exupéry', prenom='Antoine')
+        self.categorie = Categorie.objects.create(nom='Conte')
+        self.livres = [
+            Livre.objects.create(titre='Le Petit Prince', isbn='1234567890098', auteur=self.auteur),
+            Livre.objects.create(titre='Vol de nuit', isbn='1234567890093', auteur=self.auteur),
+            Livre.objects.create(titre='Le prince de Machiavel', isbn='1234567890099'),
+        ]
+        self.livres[0].categorie.add(self.categorie)
+
+    def search(self, q):
+        response = self.client.get(reverse('livres:livres-list', query={'q': q}))
+        return [livre['titre'] for livre in response.data['results']]
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('Petit prin'), '"Petit"* "prin"*')
+        self.assertEqual(match_expression('" OR *'), '"OR"*')
+
+    def test_search_titre_auteur_categorie(self):
+        self.assertEqual(self.search('petit'), ['Le Petit Prince'])
+        self.assertCountEqual(self.search('exupery'), ['Le Petit Prince', 'Vol de nuit'])
+        self.assertEqual(self.search('conte'), ['Le Petit Prince'])
+        self.assertEqual(self.search('inconnu'), [])
+
+    def test_prefix_ranking_and_highlight(self):
+        self.assertEqual(len(self.search('prin')), 2)
+        response = self.client.get(reverse('livres:livres-list', query={'q': 'petit prince'}))
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['titre_surligne'], 'Le <b>Petit</b> <b>Prince</b>')
+
+    def test_highlight_is_escaped(self):
+        Livre.objects.create(titre='<script>alert(1)</script> Pirate', isbn='1234567890097')
+        response = self.client.get(reverse('livres:livres-list', query={'q': 'pirate'}))
+        self.assertEqual(response.data['results'][0]['titre_surligne'], '&lt;script&gt;alert(1)&lt;/script&gt; <b>Pirate</b>')
+
+    def test_cursor_rejected(self):
+        # the keyset ordering would drop the BM25 ranking
+        response = self.client.get(reverse('livres:livres-list', query={'q': 'prince', 'pagination': 'cursor'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('q', response.data)
+
+    def test_index_follows_changes(self):
+        self.auteur.nom = 'Camus'
+        self.auteur.save()
+        self.assertEqual(len(self.search('camus')), 2)
+
+        self.categorie.delete()
+        self.assertEqual(self.search('conte'), [])
+
+        self.livres[1].titre = 'Terre des hommes'
+        self.livres[1].save()
+        self.assertEqual(self.search('terre'), ['Terre des hommes'])
+
+        self.livres[1].delete()
+        self.assertEqual(self.search('terre'), [])
+
+
+#===================================================================================
+#Pagination
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        auteurs = [None, Auteur.objects.create(nom='B'), Auteur.objects.create(nom='A')]
+        dates = [None, '2020-01-01', '2021-06-01']
+        for i in range(11):
+            Livre.objects.create(
+                titre='titre %s' % (i % 4),
+                isbn='12345678900%s' % (10 + i),
+                auteur=auteurs[i % 3],
+                date_publication=dates[(i // 3) % 3],
+            )
+
+    def walk(self, url, link='next'):
+        pks = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pks += [livre['pk'] for livre in response.data['results']]
+            url = response.data[link]
+        return pks
+
+    def expected(self, ordering):
+        livres = sorted(Livre.objects.select_related('auteur'), key=lambda livre: livre.pk)
+        for field in reversed(ordering):
+            name = field.lstrip('-')
+            def key(livre):
+                value = livre
+                for attr in name.split('__'):
+                    value = getattr(value, attr, None) if value is not None else None
+                return (value is not None, value) if value is not None else (False, '')
+            livres = sorted(livres, key=key, reverse=field.startswith('-'))
+        return [livre.pk for livre in livres]
+
+    def test_every_ordering(self):
+        for ordering in [[], ['titre'], ['-date_publication'], ['auteur__nom', '-titre'], ['date_publication', '-auteur__nom']]:
+            query = {'pagination': 'cursor'}
+            if ordering:
+                query['ordering'] = ','.join(ordering)
+            pks = self.walk(reverse('livres:livres-list', query=query))
+            self.assertEqual(pks, self.expected(ordering), ordering)
+
+    def test_previous_links(self):
+        url = reverse('livres:livres-list', query={'pagination': 'cursor', 'ordering': '-date_publication'})
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append(response.data)
+            url = response.data['next']
+
+        self.assertIsNone(pages[0]['previous'])
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+
+    def test_insert_does_not_shift_pages(self):
+        first = self.client.get(reverse('livres:livres-list', query={'pagination': 'cursor'}))
+        Livre.objects.create(titre='nouveau', isbn='1234567890999')
+        Livre.objects.filter(pk=first.data['results'][0]['pk']).delete()
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.data['results'][0]['pk'], first.data['results'][-1]['pk'] + 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('livres:livres-list', query={'cursor': 'abc'}))
+        self.assertEqual(response.status_code, 404)
+
+        url = self.client.get(reverse('livres:livres-list', query={'pagination': 'cursor'})).data['next']
+        response = self.client.get(url + '&ordering=titre')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_still_default(self):
+        response = self.client.get(reverse('livres:livres-list', query={'page': 2}))
+        self.assertEqual(response.data['count'], 11)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CountTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.auteur = Auteur.objects.create(nom='A')
+        for i in range(7):
+            Livre.objects.create(titre='titre %s' % (i), isbn='12345678900%s' % (10 + i), auteur=self.auteur if i % 2 else None)
+
+    def test_unfiltered_count_uses_compteur(self):
+        self.assertEqual(fast_count(Livre.objects.all()), 7)
+        with self.assertNumQueries(1):
+            self.assertEqual(fast_count(Livre.objects.all()), 7)
+
+        Livre.objects.create(titre='nouveau', isbn='1234567890999')
+        Livre.objects.filter(titre='titre 0').delete()
+        Livre.objects.get(titre='titre 1').delete()
+        self.assertEqual(fast_count(Livre.objects.all()), Livre.objects.count())
+
+    def test_filtered_count_is_cached_per_generation(self):
+        queryset = Livre.objects.filter(auteur=self.auteur)
+        self.assertEqual(fast_count(queryset), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(fast_count(Livre.objects.filter(auteur=self.auteur)), 3)
+
+        Livre.objects.create(titre='nouveau', isbn='1234567890999', auteur=self.auteur)
+        self.assertEqual(fast_count(Livre.objects.filter(auteur=self.auteur)), 4)
+        self.assertEqual(fast_count(Livre.objects.none()), 0)
+
+    def test_count_false(self):
+        url = reverse('livres:livres-list', query={'count': 'false'})
+        pks = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            self.assertEqual(response.data['has_next'], response.data['next'] is not None)
+            pks += [livre['pk'] for livre in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(pks, list(Livre.objects.order_by('pk').values_list('pk', flat=True)))
+        previous = self.client.get(reverse('livres:livres-list', query={'count': 'false', 'page': 2})).data['previous']
+        self.assertEqual(self.client.get(previous).data['results'], self.client.get(reverse('livres:livres-list', query={'count': 'false'})).data['results'])
+        self.assertEqual(self.client.get(reverse('livres:livres-list', query={'count': 'false', 'page': 9})).status_code, 404)
+
+    def test_exact_count_still_default(self):
+        response = self.client.get(reverse('livres:livres-list'))
+        self.assertEqual(response.data['count'], 7)
+        self.assertNotIn('has_next', response.data)
+
+#===================================================================================
+#Bulk
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BulkCreateTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='1234')
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        self.categories = [Categorie.objects.create(nom='Aventure'), Categorie.objects.create(nom='Horreur')]
+        Livre.objects.create(titre='existant', isbn='1234567890000', auteur=self.auteur)
+        self.url = reverse('livres:livres-bulk')
+        self.client.force_authenticate(self.user)
+
+    def items(self, count, start=0):
+        return [
+            {'titre': 'bulk %s' % (i), 'isbn': '12345678%05d' % (i), 'auteur': self.auteur.pk, 'categorie': [self.categories[i % 2].pk]}
+            for i in range(start, start + count)
+        ]
+
+    def test_create(self):
+        liste = reverse('livres:livres-list')
+        self.assertEqual(self.client.get(liste).data['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.items(3), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        livre = Livre.objects.get(pk=response.data['results'][2]['pk'])
+        self.assertEqual(livre.titre, 'bulk 2')
+        self.assertEqual(livre.createur, self.user)
+        self.assertEqual(list(livre.categorie.all()), [self.categories[0]])
+
+        # counted, indexed and visible in the cached lists
+        self.assertEqual(self.client.get(liste).data['count'], 4)
+        self.assertEqual(self.client.get(liste, {'q': 'bulk'}).data['count'], 3)
+
+    def test_not_found_evicted(self):
+        # the 404 of a pk not created yet is remembered by the detail view
+        pk = Livre.objects.order_by('-pk').first().pk + 1
+        self.assertEqual(self.client.get(reverse('livres:livres-detail', args=[pk])).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.items(1), format='json')
+            # nothing is evicted before the commit
+            self.assertEqual(self.client.get(reverse('livres:livres-detail', args=[pk])).status_code, 404)
+        self.assertEqual(response.data['results'][0]['pk'], pk)
+        self.assertEqual(self.client.get(reverse('livres:livres-detail', args=[pk])).status_code, 200)
+
+    def test_errors(self):
+        items = [
+            {'titre': 'a', 'isbn': '123'},
+            {'titre': 'b', 'isbn': '12345678901ab'},
+            {'titre': 'c', 'isbn': '1234567890000'},
+            {'titre': 'd', 'isbn': '1234567890001'},
+            {'titre': 'e', 'isbn': '1234567890001'},
+            {'titre': 'existant', 'auteur': self.auteur.pk},
+            {'titre': 'double', 'auteur': self.auteur.pk},
+            {'titre': 'double', 'auteur': self.auteur.pk},
+            {'titre': 'f', 'auteur': 999, 'categorie': [self.categories[0].pk, 999]},
+            {'titre': 'g', 'date_publication': '2999-01-01'},
+            {'titre': 'sans auteur'},
+            'pas un livre',
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [
+            'error', 'error', 'error', 'created', 'error', 'error', 'created', 'error', 'error', 'error', 'created', 'error',
+        ])
+        self.assertEqual(results[0]['errors'], {'isbn': ['123 size is not correct.']})
+        self.assertEqual(results[1]['errors'], {'isbn': ['12345678901ab is incorrect. It must contain numbers only']})
+        self.assertEqual(results[2]['errors'], {'isbn': ['livre with this isbn already exists.']})
+        self.assertEqual(results[4]['errors'], {'isbn': ['livre with this isbn already exists.']})
+        self.assertEqual(results[5]['errors'], {'titre': ['This author already used this title.']})
+        self.assertEqual(results[7]['errors'], {'titre': ['This author already used this title.']})
+        self.assertEqual(set(results[8]['errors']), {'auteur', 'categorie'})
+        self.assertIn('date_publication', results[9]['errors'])
+        self.assertEqual(Livre.objects.count(), 4)
+
+    def test_rejected_item_claims_nothing(self):
+        items = [
+            {'titre': 'existant', 'isbn': '1234567890010', 'auteur': self.auteur.pk},
+            {'titre': 'autre', 'isbn': '1234567890010', 'auteur': self.auteur.pk},
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], ['error', 'created'])
+        self.assertEqual(response.data['results'][0]['errors'], {'titre': ['This author already used this title.']})
+
+    def test_concurrent_insert(self):
+        verifier_existants = bulk.verifier_existants
+        appels = []
+
+        def verifier(data, erreur):
+            reportes = verifier_existants(data, erreur)
+            if not appels:
+                # another request creates the first Livre right after the check
+                Livre.objects.create(titre='concurrent', isbn='1234567800000')
+            appels.append(1)
+            return reportes
+
+        with patch('livres.bulk.verifier_existants', verifier):
+            response = self.client.post(self.url, self.items(2), format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual(results[0]['errors'], {'isbn': ['livre with this isbn already exists.']})
+        self.assertEqual(results[1]['status'], 'created')
+
+    def test_constant_queries(self):
+        self.client.post(self.url, self.items(2), format='json')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, self.items(3, start=10), format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, self.items(300, start=100), format='json')
+        self.assertEqual(response.data['created'], 300)
+        # only the inserts are split in batches (bound by the number of parameters of the database)
+        def checks(context):
+            return [query['sql'] for query in context.captured_queries if not query['sql'].startswith('INSERT')]
+        self.assertEqual(len(checks(small)), len(checks(large)))
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.client.post(self.url, {'titre': 'a'}, format='json').status_code, 400)
+        with patch('livres.views.BULK_MAX_ITEMS', 2):
+            self.assertEqual(self.client.post(self.url, self.items(3), format='json').status_code, 400)
+        self.client.logout()
+        self.assertIn(self.client.post(self.url, self.items(1), format='json').status_code, [401, 403])
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BulkCategoriesTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='1234')
+        self.autre = User.objects.create_user(username='autre', password='1234')
+        self.categories = [Categorie.objects.create(nom='Aventure'), Categorie.objects.create(nom='Horreur')]
+        self.livres = [
+            Livre.objects.create(titre='livre %s' % (i), isbn='12345678900%02d' % (i), createur=self.user)
+            for i in range(4)
+        ]
+        self.livres[0].categorie.add(self.categories[0])
+        self.client.force_authenticate(self.user)
+
+    def categories_de(self, livre):
+        return sorted(livre.categorie.values_list('pk', flat=True))
+
+    def test_bulk_add_remove(self):
+        url = reverse('livres:categorie-bulk-add', args=[self.categories[0].pk])
+        pks = [livre.pk for livre in self.livres]
+        # the cached categories of a Livre are evicted
+        self.client.get(reverse('livres:livres-categories-list', args=[self.livres[1].pk]))
+
+        response = self.client.post(url, {'livres': pks}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'added': 3, 'removed': 0})
+        self.assertEqual(Livre.objects.filter(categorie=self.categories[0]).count(), 4)
+        response = self.client.get(reverse('livres:livres-categories-list', args=[self.livres[1].pk]))
+        self.assertEqual([categorie['nom'] for categorie in response.data], ['Aventure'])
+        self.assertEqual(self.client.get(reverse('livres:livres-list'), {'q': 'aventure'}).data['count'], 4)
+
+        url = reverse('livres:categorie-bulk-remove', args=[self.categories[0].pk])
+        response = self.client.post(url, {'livres': pks[:2]}, format='json')
+        self.assertEqual(response.data, {'added': 0, 'removed': 2})
+        self.assertEqual(Livre.objects.filter(categorie=self.categories[0]).count(), 2)
+
+    def test_mapping(self):
+        url = reverse('livres:livres-bulk-categories')
+        mapping = {
+            str(self.livres[0].pk): [self.categories[1].pk],
+            str(self.livres[1].pk): [self.categories[0].pk, self.categories[1].pk],
+        }
+        response = self.client.put(url, {'livres': mapping}, format='json')
+        self.assertEqual(response.data, {'added': 3, 'removed': 1})
+        self.assertEqual(self.categories_de(self.livres[0]), [self.categories[1].pk])
+        self.assertEqual(self.categories_de(self.livres[1]), sorted(categorie.pk for categorie in self.categories))
+
+        response = self.client.put(url, {'livres': {str(self.livres[1].pk): []}}, format='json')
+        self.assertEqual(response.data, {'added': 0, 'removed': 2})
+
+    def test_constant_queries(self):
+        url = reverse('livres:categorie-bulk-add', args=[self.categories[1].pk])
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, {'livres': [self.livres[0].pk]}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(url, {'livres': [livre.pk for livre in self.livres[1:]]}, format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_errors(self):
+        url = reverse('livres:categorie-bulk-add', args=[self.categories[1].pk])
+        response = self.client.post(url, {'livres': [self.livres[0].pk, 999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'livres': ['Invalid pk "999" - object does not exist.']})
+
+        response = self.client.put(reverse('livres:livres-bulk-categories'), {'livres': {str(self.livres[0].pk): [999]}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('categories', response.data)
+        self.assertEqual(self.client.put(reverse('livres:livres-bulk-categories'), {'livres': {'a': []}}, format='json').status_code, 400)
+
+        self.assertEqual(self.client.post(reverse('livres:categorie-bulk-add', args=[999]), {'livres': [1]}, format='json').status_code, 404)
+
+        # nothing changes when one Livre belongs to someone else
+        livre = Livre.objects.create(titre='autre', isbn='1234567890999', createur=self.autre)
+        response = self.client.post(url, {'livres': [self.livres[0].pk, livre.pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.categories_de(self.livres[0]), [self.categories[0].pk])
+
+        self.client.logout()
+        self.assertIn(self.client.post(url, {'livres': [self.livres[0].pk]}, format='json').status_code, [401, 403])
+
+#===================================================================================
+#Export
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        auteur = Auteur.objects.create(nom='Hugo', prenom='Victor')
+        self.livres = [
+            Livre.objects.create(titre='Les Misérables', isbn='1234567890001', auteur=auteur),
+            Livre.objects.create(titre='Notre-Dame, de Paris', isbn='1234567890002', auteur=auteur),
+            Livre.objects.create(titre='Germinal', isbn='1234567890003'),
+        ]
+        self.url = reverse('livres:livres-export')
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in self.content(response).decode().splitlines()]
+        # not limited by the page size of the list
+        self.assertEqual([row['pk'] for row in rows], [livre.pk for livre in self.livres])
+        self.assertEqual(rows[0]['auteur_nom'], 'Hugo')
+        self.assertEqual(rows[2]['auteur'], None)
+
+    def test_csv_filters(self):
+        response = self.client.get(self.url, {'output': 'csv', 'auteur__nom': 'Hugo', 'ordering': '-titre'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(self.content(response).decode())))
+        self.assertEqual([row['titre'] for row in rows], ['Notre-Dame, de Paris', 'Les Misérables'])
+
+        response = self.client.get(self.url, {'q': 'germ'})
+        rows = [json.loads(line) for line in self.content(response).decode().splitlines()]
+        self.assertEqual([row['pk'] for row in rows], [self.livres[2].pk])
+
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        lines = gzip.decompress(self.content(response)).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_buffered(self):
+        lines = ['%05d\n' % (i) for i in range(1000)]
+        chunks = list(buffered(lines, size=600))
+        self.assertEqual(len(chunks), 10)
+        self.assertEqual(gzip.decompress(b''.join(gzipped(chunks))), ''.join(lines).encode())
+
+#===================================================================================
+#Import
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ImportCatalogueTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dossier = tempfile.TemporaryDirectory()
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        Livre.objects.create(titre='existant', isbn='1234567890000', auteur=self.auteur)
+
+    def tearDown(self):
+        self.dossier.cleanup()
+
+    def chemin(self, nom):
+        return os.path.join(self.dossier.name, nom)
+
+    def ecrire_csv(self, rows, nom='catalogue.csv'):
+        with open(self.chemin(nom), 'w', newline='', encoding='utf-8') as fichier:
+            writer = csv.DictWriter(fichier, ['isbn', 'titre', 'date_publication', 'auteur_nom', 'auteur_prenom', 'categories'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return self.chemin(nom)
+
+    def importer(self, *args, **options):
+        out = StringIO()
+        call_command('import_catalogue', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_csv(self):
+        fichier = self.ecrire_csv([
+            {'isbn': '1234567890001', 'titre': 'un', 'date_publication': '2001-02-03', 'auteur_nom': 'Sithi', 'auteur_prenom': 'Jean-Luck', 'categories': 'Aventure|Horreur'},
+            {'isbn': '1234567890002', 'titre': 'deux', 'auteur_nom': 'Hugo', 'auteur_prenom': 'Victor', 'categories': 'Aventure'},
+            {'isbn': '1234567890003', 'titre': 'trois', 'auteur_nom': 'Hugo', 'auteur_prenom': 'Victor'},
+        ])
+        output = self.importer(fichier, chunk_size=2)
+        self.assertIn('3 row(s): 3 created, 0 updated, 0 rejected', output)
+
+        livre = Livre.objects.get(isbn='1234567890001')
+        self.assertEqual(str(livre.date_publication), '2001-02-03')
+        self.assertEqual(livre.auteur, self.auteur)
+        self.assertEqual(sorted(livre.categorie.values_list('nom', flat=True)), ['Aventure', 'Horreur'])
+        # one Auteur / Categorie per name, even across chunks
+        self.assertEqual(Auteur.objects.filter(nom='Hugo').count(), 1)
+        self.assertEqual(Categorie.objects.filter(nom='Aventure').count(), 1)
+        self.assertEqual(Compteur.lignes_de(Livre), 4)
+        self.assertEqual(search(Livre.objects.all(), 'Hugo').count(), 2)
+
+    def test_jsonl_upsert(self):
+        with open(self.chemin('catalogue.jsonl'), 'w', encoding='utf-8') as fichier:
+            fichier.write(json.dumps({'isbn': '1234567890000', 'titre': 'renomme', 'auteur_nom': 'Sithi', 'auteur_prenom': 'Jean-Luck', 'categories': ['Roman']}) + '\n')
+            fichier.write('\n')
+            fichier.write(json.dumps({'isbn': '1234567890004', 'titre': 'quatre'}) + '\n')
+
+        output = self.importer(self.chemin('catalogue.jsonl'))
+        self.assertIn('2 row(s): 1 created, 1 updated, 0 rejected', output)
+        livre = Livre.objects.get(isbn='1234567890000')
+        self.assertEqual(livre.titre, 'renomme')
+        self.assertEqual(list(livre.categorie.values_list('nom', flat=True)), ['Roman'])
+
+        # importing the same file again changes nothing
+        output = self.importer(self.chemin('catalogue.jsonl'))
+        self.assertIn('2 row(s): 0 created, 2 updated, 0 rejected', output)
+        self.assertEqual(Livre.objects.count(), 2)
+        self.assertEqual(Compteur.lignes_de(Livre), 2)
+
+    def test_rejets(self):
+        fichier = self.ecrire_csv([
+            {'isbn': '', 'titre': 'sans isbn'},
+            {'isbn': '123', 'titre': 'court'},
+            {'isbn': '1234567890005', 'titre': 'date', 'date_publication': '2001-13-01'},
+            {'isbn': '1234567890006', 'titre': 'existant', 'auteur_nom': 'Sithi', 'auteur_prenom': 'Jean-Luck'},
+            {'isbn': '1234567890007', 'titre': 'valide'},
+        ])
+        output = self.importer(fichier, rejets=self.chemin('rejets.csv'))
+        self.assertIn('5 row(s): 1 created, 0 updated, 4 rejected', output)
+
+        with open(self.chemin('rejets.csv'), newline='', encoding='utf-8') as rejets:
+            rows = list(csv.reader(rejets))
+        self.assertEqual([row[0] for row in rows], ['1', '2', '3', '4'])
+        self.assertEqual(rows[1][1], '123 size is not correct.')
+        self.assertEqual(rows[3][1], 'This author already used this title.')
+        self.assertEqual(json.loads(rows[1][2])['titre'], 'court')
+
+    def test_cache_evicted_on_commit(self):
+        livre = Livre.objects.get(isbn='1234567890000')
+        cache.set(livre_key(livre.pk), 'ancien')
+        generation = get_generation('livres.livre')
+        fichier = self.ecrire_csv([{'isbn': '1234567890000', 'titre': 'renomme', 'auteur_nom': 'Hugo', 'categories': 'Roman'}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.importer(fichier)
+            # a request made before the commit can't cache the previous rows under a new generation
+            self.assertEqual(cache.get(livre_key(livre.pk)), 'ancien')
+            self.assertEqual(get_generation('livres.livre'), generation)
+        self.assertIsNone(cache.get(livre_key(livre.pk)))
+        self.assertNotEqual(get_generation('livres.livre'), generation)
+
+    def test_duplicate_isbn_in_chunk(self):
+        fichier = self.ecrire_csv([
+            {'isbn': '1234567890008', 'titre': 'premier'},
+            {'isbn': '1234567890009', 'titre': 'autre'},
+            {'isbn': '1234567890008', 'titre': 'second'},
+        ])
+        output = self.importer(fichier, rejets=self.chemin('rejets.csv'))
+        self.assertIn('3 row(s): 2 created, 0 updated, 1 rejected', output)
+        self.assertEqual(Livre.objects.get(isbn='1234567890008').titre, 'second')
+
+        with open(self.chemin('rejets.csv'), newline='', encoding='utf-8') as rejets:
+            rows = list(csv.reader(rejets))
+        self.assertEqual(rows[0][:2], ['1', 'isbn 1234567890008 is imported again by row 3.'])
+
+    def test_checkpoint(self):
+        rows = [{'isbn': '12345678%05d' % (i), 'titre': 'livre %s' % (i)} for i in range(1, 6)]
+        fichier = self.ecrire_csv(rows)
+        checkpoint = self.chemin('checkpoint.json')
+
+        # the third chunk fails: the first two are committed and checkpointed
+        original = Importeur.importer
+        def importer(importeur, lot):
+            if lot[0][0] == 5:
+                raise RuntimeError('interrupted')
+            return original(importeur, lot)
+        with patch.object(Importeur, 'importer', importer):
+            with self.assertRaises(RuntimeError):
+                self.importer(fichier, chunk_size=2, checkpoint=checkpoint)
+        self.assertEqual(Livre.objects.count(), 5)
+        with open(checkpoint) as fichier_checkpoint:
+            self.assertEqual(json.load(fichier_checkpoint), {'ligne': 4})
+
+        output = self.importer(fichier, chunk_size=2, checkpoint=checkpoint)
+        self.assertIn('Resuming after row 4', output)
+        self.assertIn('1 row(s): 1 created, 0 updated, 0 rejected', output)
+        self.assertEqual(Livre.objects.count(), 6)
+
+    def test_invalid_arguments(self):
+        fichier = self.chemin('catalogue.txt')
+        open(fichier, 'w').close()
+        with self.assertRaises(CommandError):
+            self.importer(fichier)
+        with self.assertRaises(CommandError):
+            self.importer(fichier, format='csv', createur='inconnu')
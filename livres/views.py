@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.cache import cache
+from django.http import Http404
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -16,9 +17,61 @@ from api.pagination import *
 from .serializers import * 
 from .models import *
 from .filters import *
+from .cache import *
+from .bulk import creer_livres, verifier_categories, modifier_categories, BULK_MAX_ITEMS
+from api.streaming import stream_queryset, STREAM_FORMATS
+from api.cache import get_or_compute, render_json, CachedJSONResponse, NOT_FOUND
+from recommandations.models import Voisin, RECOMMANDATIONS_SCOPE
+from recommandations.serializers import SimilaireSerializer
 
 # Create your views here.
 
+def normaliser_pk(pk, model):
+    """
+        pk of the url as an int, so that /livres/01/ and /livres/1/ share the
+        cache keys evicted by the signals.
+        raise: Http404 when pk isn't a number
+    """
+    if pk is None:
+        return None
+    try:
+        return int(pk)
+    except ValueError:
+        raise Http404('No %s matches the given query.' % (model.__name__))
+
+# column of the export => field of Livre
+LIVRE_EXPORT_COLUMNS = {
+    'pk': 'pk',
+    'isbn': 'isbn',
+    'titre': 'titre',
+    'date_publication': 'date_publication',
+    'auteur': 'auteur',
+    'auteur_nom': 'auteur__nom',
+    'auteur_prenom': 'auteur__prenom',
+    'note_moyenne': 'note_moyenne',
+    'nb_avis': 'nb_avis',
+    'nb_emprunts': 'nb_emprunts',
+    'disponible': 'disponible',
+}
+
+def appliquer_categories(request, livres, categories, **changes):
+    """
+        Applies the changes of modifier_categories() after checking the Livre and
+        Categorie (400) and that the user is the createur of every Livre (403),
+        nothing is changed when one check fails.
+    """
+    if len(livres) > BULK_MAX_ITEMS:
+        return Response({'detail': 'At most %s Livre per request.' % (BULK_MAX_ITEMS)}, status=status.HTTP_400_BAD_REQUEST)
+
+    errors, forbidden = verifier_categories(livres, categories, request.user)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    if forbidden:
+        return Response(forbidden, status=status.HTTP_403_FORBIDDEN)
+
+    added, removed = modifier_categories(**changes)
+    return Response({'added': added, 'removed': removed}, status=status.HTTP_200_OK)
+
 class LivreViewSet(viewsets.ModelViewSet):
     """
         ViewSet for the object Livre with CRUD methods
@@ -30,7 +83,7 @@ class LivreViewSet(viewsets.ModelViewSet):
     filterset_class = LivreFilterSet
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]   
     pagination_class = LivrePagination
-    ordering_fields = ['titre', 'date_publication', 'auteur__nom']
+    ordering_fields = ['titre', 'date_publication', 'auteur__nom', 'note_moyenne', 'nb_avis', 'nb_emprunts']
 
     def create(self, request, categories_pk=None):
         serializer = LivreSerializer(data=request.data)
@@ -45,44 +98,43 @@ class LivreViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    def list(self, request, categories_pk=None):
-        cache_key = 'livres-list-%s-%s' % (auteurs_pk, categories_pk)
-        for key, item in request.query_params.items():
-            cache_key += "-%s-%s" % (key, item)
-        
-        cache_time = 86400 # time in seconds for cache to be valid
-        #cache.set(cache_key, None, cache_time)   
-        data = cache.get(cache_key) # returns None if no key-value pair    
-       
-        if data:
-            self.paginator.page = data[0]
-            self.paginator.request = request
-            self.paginator.display_page_controls = True
-            return self.get_paginated_response(data[1]) 
-            
-        if categories_pk:
-            livres = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(categorie=categories_pk)))
-        else:
-            livres = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
-       
-        serializer = self.get_serializer(livres, many=True)
-        cache.set(cache_key, [self.paginator.page, serializer.data], cache_time)
-        return self.get_paginated_response(serializer.data)
+    def list(self, request, categories_pk=None, auteurs_pk=None):
+        cache_key = livres_list_key(request.query_params, auteurs_pk, categories_pk, request.get_host())
+        cache_time = LISTS_CACHE_TIME
+
+        def compute():
+            if categories_pk:
+                livres = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(categorie=categories_pk)))
+            elif auteurs_pk:
+                livres = self.paginate_queryset(self.filter_queryset(self.get_queryset().filter(auteur=auteurs_pk)))
+            else:
+                livres = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+
+            serializer = self.get_serializer(livres, many=True)
+            return render_json(self.get_paginated_response(serializer.data).data)
+
+        # only one request rebuilds an expired page, the others wait or get the stale one
+        entry = get_or_compute(cache_key, compute, cache_time, early_refresh=True)
+        return CachedJSONResponse(entry)
     
-    def retrieve(self, request, pk, categories_pk=None):
-        
-        cache_key = 'livres-%s' % (pk)
-        cache_time = 86400 # time in seconds for cache to be valid
-        #cache.set(cache_key, None, cache_time)   
-        data = cache.get(cache_key) # returns None if no key-value pair   
+    def retrieve(self, request, pk, categories_pk=None, auteurs_pk=None):
+        pk = normaliser_pk(pk, Livre)
+        cache_key = livre_key(pk)
+        cache_time = CACHE_TIME
 
-        if not data:
-            livre = self.queryset.get(pk=pk)
-            serializer = LivreSerializer(livre)
-            cache.set(cache_key, serializer.data, cache_time)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        def compute():
+            try:
+                livre = self.get_queryset().get(pk=pk)
+            except Livre.DoesNotExist:
+                # remembered for a short time, crawlers probing unknown ids don't reach the database
+                return NOT_FOUND
+            return render_json(LivreSerializer(livre).data)
 
-        return Response(data, status=status.HTTP_200_OK)
+        entry = get_or_compute(cache_key, compute, cache_time)
+        if entry == NOT_FOUND:
+            raise Http404('No Livre matches the given query.')
+
+        return CachedJSONResponse(entry)
 
     """
         Method that sets an Auteur to a Livre
@@ -240,6 +292,130 @@ class LivreViewSet(viewsets.ModelViewSet):
         livre.categorie.remove(categorie)
         return Response({'status': 'categorie removed'}, status=status.HTTP_200_OK)
     
+    """
+        Method that creates many Livre at once, the valid items are created and
+        the others are reported with their errors, in the order of the list.
+        auteur is the pk of an Auteur, categorie a list of pk of Categorie.
+
+        example:
+            post /livres/bulk/
+            [{'titre': 'titre1', 'isbn': '1234567890123', 'auteur': 1, 'categorie': [1, 2]}, {'isbn': '12'}]
+            response : {'created': 1, 'errors': 1, 'results': [
+                {'index': 0, 'status': 'created', 'pk': 12},
+                {'index': 1, 'status': 'error', 'errors': {'isbn': ['12 size is not correct.']}},
+            ]}
+    """
+
+    @extend_schema(
+        description='Method that creates many Livre at once',
+        request=LivreBulkItemSerializer(many=True),
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request, categories_pk=None, auteurs_pk=None):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of Livre.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > BULK_MAX_ITEMS:
+            return Response({'detail': 'At most %s Livre per request.' % (BULK_MAX_ITEMS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = creer_livres(request.data, createur=request.user)
+        created = len([result for result in results if result['status'] == 'created'])
+        if created == len(results):
+            code = status.HTTP_201_CREATED
+        elif created:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+
+        return Response({'created': created, 'errors': len(results) - created, 'results': results}, status=code)
+
+    """
+        Method that streams every Livre matching the filters of the list
+        (LivreFilterSet, ?q=, ?ordering=), by pk by default, with no page size limit.
+        ?output=ndjson (default) or ?output=csv, gzipped if the client accepts it.
+
+        example:
+            get /livres/export/?output=csv&disponible=true
+            response : pk,isbn,titre,date_publication,auteur,auteur_nom,...
+    """
+
+    @extend_schema(
+        description='Method that streams the filtered Livre as NDJSON or CSV',
+        parameters=[OpenApiParameter('output', OpenApiTypes.STR, enum=STREAM_FORMATS)],
+        responses={200: OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request, categories_pk=None, auteurs_pk=None):
+        livres = Livre.objects.order_by('pk')
+        if categories_pk:
+            livres = livres.filter(categorie=categories_pk)
+        elif auteurs_pk:
+            livres = livres.filter(auteur=auteurs_pk)
+
+        return stream_queryset(request, self.filter_queryset(livres), LIVRE_EXPORT_COLUMNS, filename='livres')
+
+    """
+        Method that sets the Categorie of many Livre at once, the Categorie of each
+        Livre of the mapping become exactly the given ones (the others are removed).
+        Every change is made in one transaction, or none if a pk is invalid.
+
+        example:
+            put /livres/bulk-categories/
+            {'livres': {'1': [2, 3], '4': []}}
+            response : {'added': 2, 'removed': 1}
+    """
+
+    @extend_schema(
+        description='Method that sets the Categorie of many Livre at once',
+        request=CategoriesMappingSerializer,
+    )
+    @action(detail=False, methods=['put'], url_path='bulk-categories')
+    def bulk_categories(self, request, categories_pk=None, auteurs_pk=None):
+        serializer = CategoriesMappingSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        mapping = serializer.validated_data['livres']
+        return appliquer_categories(
+            request,
+            livres=list(mapping),
+            categories={pk for categories in mapping.values() for pk in categories},
+            ajouts={(livre, categorie) for livre, categories in mapping.items() for categorie in categories},
+            remplacer=mapping.keys(),
+        )
+
+    """
+        Method that returns the Livre most often borrowed by the readers of a Livre,
+        most similar first (computed by the calculer_recommandations command)
+
+        example:
+            get /livres/1/similaires/
+            response : [{'pk': 4, 'titre': 'titre4', 'score': 0.81}, ...]
+    """
+
+    @extend_schema(
+        description='Method that returns the Livre most often borrowed by the readers of a Livre',
+        responses=SimilaireSerializer(many=True),
+    )
+    @action(detail=True, methods=['get'])
+    def similaires(self, request, pk=None, categories_pk=None, auteurs_pk=None):
+        pk = normaliser_pk(pk, Livre)
+
+        def compute():
+            voisins = list(Voisin.similaires_de(pk))
+            if not voisins and not Livre.objects.filter(pk=pk).exists():
+                return NOT_FOUND
+            return render_json(SimilaireSerializer(voisins, many=True).data)
+
+        entry = get_or_compute(similaires_key(pk, RECOMMANDATIONS_SCOPE), compute, CACHE_TIME)
+        if entry == NOT_FOUND:
+            raise Http404('No Livre matches the given query.')
+
+        return CachedJSONResponse(entry)
+
+    def get_queryset(self):
+        # auteur, createur and categorie are nested in LivreSerializer
+        return LivreSerializer.setup_eager_loading(super().get_queryset())
+
     def get_permissions(self):
         return super().get_permissions()
 
@@ -251,40 +427,82 @@ class CategorieViewSet(viewsets.ModelViewSet):
     serializer_class = CategorieSerializer
 
     def list(self, request, livres_pk=None):
-        cache_key = 'categories-list-%s' % (livres_pk)    
-        cache_time = 86400 # time in seconds for cache to be valid
-        data = cache.get(cache_key) # returns None if no key-value pair    
+        livres_pk = normaliser_pk(livres_pk, Livre)
+        cache_key = categories_list_key(livres_pk)    
+        cache_time = CACHE_TIME
 
-        if not data: 
-        
+        def compute():
             if livres_pk:
                 #categories = self.queryset.filter(livre=livres_pk)
                 categories = Livre.objects.prefetch_related("categorie").get(pk=livres_pk).categorie.all()
             else:
-                categories = self.queryset
+                categories = self.get_queryset()
             
-            serializer = CategorieSerializer(categories, many=True)
-            data=serializer.data
-            cache.set(cache_key, data, cache_time)
-        
-        return Response(data, status=status.HTTP_200_OK)
+            return render_json(CategorieSerializer(categories, many=True).data)
+
+        entry = get_or_compute(cache_key, compute, cache_time)
+        return CachedJSONResponse(entry)
 
 
     def retrieve(self, request, pk, livres_pk=None):
-        
-        cache_key = 'categories-%s' % (pk)
-        cache_time = 86400 # time in seconds for cache to be valid
-        #cache.set(cache_key, None, cache_time)   
-        data = cache.get(cache_key) # returns None if no key-value pair   
-
-        if not data:
-            categorie = self.queryset.get(pk=pk)
-            serializer = CategorieSerializer(categorie)
-            cache.set(cache_key, serializer.data, cache_time)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        return Response(data, status=status.HTTP_200_OK)
+        pk = normaliser_pk(pk, Categorie)
+        cache_key = categorie_key(pk)
+        cache_time = CACHE_TIME
+
+        def compute():
+            try:
+                categorie = self.get_queryset().get(pk=pk)
+            except Categorie.DoesNotExist:
+                return NOT_FOUND
+            return render_json(CategorieSerializer(categorie).data)
+
+        entry = get_or_compute(cache_key, compute, cache_time)
+        if entry == NOT_FOUND:
+            raise Http404('No Categorie matches the given query.')
+
+        return CachedJSONResponse(entry)
     
+    """
+        Methods that add the Categorie to / remove it from many Livre at once,
+        in one transaction, or none if a Livre is invalid.
+
+        example:
+            post /categories/1/livres/bulk-add/
+            {'livres': [1, 2, 3]}
+            response : {'added': 3, 'removed': 0}
+    """
+
+    @extend_schema(
+        description='Method that adds a Categorie to many Livre',
+        request=LivresPkSerializer,
+    )
+    @action(detail=True, methods=['post'], url_path='livres/bulk-add', permission_classes=[permissions.IsAuthenticated])
+    def bulk_add(self, request, pk=None, livres_pk=None):
+        return self.bulk_livres(request, pk, 'ajouts')
+
+    @extend_schema(
+        description='Method that removes a Categorie from many Livre',
+        request=LivresPkSerializer,
+    )
+    @action(detail=True, methods=['post'], url_path='livres/bulk-remove', permission_classes=[permissions.IsAuthenticated])
+    def bulk_remove(self, request, pk=None, livres_pk=None):
+        return self.bulk_livres(request, pk, 'retraits')
+
+    def bulk_livres(self, request, pk, changement):
+        serializer = LivresPkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            categorie = int(pk)
+        except ValueError:
+            raise Http404('No Categorie matches the given query.')
+        if not Categorie.objects.filter(pk=categorie).exists():
+            raise Http404('No Categorie matches the given query.')
+
+        livres = set(serializer.validated_data['livres'])
+        return appliquer_categories(request, list(livres), [categorie], **{changement: {(livre, categorie) for livre in livres}})
+
 class AuteurViewSet(viewsets.ModelViewSet):
     """
         ViewSet for the object Auteur with CRUD methods
@@ -293,36 +511,36 @@ class AuteurViewSet(viewsets.ModelViewSet):
     serializer_class = AuteurSerializer
 
     def list(self, request, livres_pk=None):
-        
-        cache_key = 'auteurs-list-%s' % (livres_pk)    
-        cache_time = 86400 # time in seconds for cache to be valid
-        data = cache.get(cache_key) # returns None if no key-value pair    
-        
-        if not data: 
+        livres_pk = normaliser_pk(livres_pk, Livre)
+        cache_key = auteurs_list_key(livres_pk)    
+        cache_time = CACHE_TIME
+
+        def compute():
             if livres_pk:
                 auteur = self.queryset.filter(livre=livres_pk)
             else:
-                auteur = self.queryset
-            
-            serializer = AuteurSerializer(auteur, many=True)
-            data=serializer.data
-            cache.set(cache_key, data, cache_time)
+                auteur = self.get_queryset()
             
-        return Response(data, status=status.HTTP_200_OK)
+            return render_json(AuteurSerializer(auteur, many=True).data)
+
+        entry = get_or_compute(cache_key, compute, cache_time)
+        return CachedJSONResponse(entry)
 
 
     def retrieve(self, request, pk, livres_pk=None):
-        
-        cache_key = 'auteurs-%s' % (pk)
-        cache_time = 86400 # time in seconds for cache to be valid
-        #cache.set(cache_key, None, cache_time)   
-        data = cache.get(cache_key) # returns None if no key-value pair   
-
-        if not data:
-            auteur = self.queryset.get(pk=pk)
-            serializer = AuteurSerializer(auteur)
-            cache.set(cache_key, serializer.data, cache_time)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        return Response(data, status=status.HTTP_200_OK)
-    
\ No newline at end of file
+        pk = normaliser_pk(pk, Auteur)
+        cache_key = auteur_key(pk)
+        cache_time = CACHE_TIME
+
+        def compute():
+            try:
+                auteur = self.get_queryset().get(pk=pk)
+            except Auteur.DoesNotExist:
+                return NOT_FOUND
+            return render_json(AuteurSerializer(auteur).data)
+
+        entry = get_or_compute(cache_key, compute, cache_time)
+        if entry == NOT_FOUND:
+            raise Http404('No Auteur matches the given query.')
+
+        return CachedJSONResponse(entry)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recommandations import moteur
+
+class Command(BaseCommand):
+    help = 'Updates the similar Livre of the Livre borrowed since the last run (--complet to recompute every Livre).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--complet', action='store_true', help='recompute the Voisin of every Livre')
+
+    def handle(self, *args, **options):
+        if options['complet']:
+            count = moteur.calculer()
+            self.stdout.write(self.style.SUCCESS('%s voisin(s) written' % (count)))
+        else:
+            count = moteur.mettre_a_jour()
+            self.stdout.write(self.style.SUCCESS('%s livre(s) updated' % (count)))
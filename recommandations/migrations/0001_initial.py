@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('livres', '0014_livre_disponible'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Voisin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rang', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('livre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='voisins', to='livres.livre')),
+                ('voisin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='livres.livre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('livre', 'rang'), name='voisin_livre_rang_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Repere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dernier_pk', models.BigIntegerField(default=0)),
+                ('date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models import F, Sum
+
+from livres.models import Livre
+from emprunts.models import Emprunt
+
+TOP_RECOMMANDATIONS = 10 # Livre returned by /membres/<pk>/recommandations/
+RECOMMANDATIONS_SCOPE = 'recommandations' # generation bumped when Voisin are rewritten
+
+class Voisin(models.Model):
+    """
+        One of the TOP_K Livre most often borrowed by the readers of livre,
+        filled by recommandations/moteur.py.
+        rang starts at 1 for the most similar Livre.
+    """
+    livre = models.ForeignKey(Livre, on_delete=models.CASCADE, related_name='voisins')
+    voisin = models.ForeignKey(Livre, on_delete=models.CASCADE, related_name='+')
+    rang = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['livre', 'rang'], name='voisin_livre_rang_unique')]
+
+    @classmethod
+    def similaires_de(cls, livre_pk):
+        """
+            The Voisin of a Livre, most similar first (one query on the (livre, rang) index).
+        """
+        return cls.objects.filter(livre=livre_pk).order_by('rang').values(
+            'score', pk=F('voisin'), titre=F('voisin__titre'),
+        )
+
+    @classmethod
+    def recommandations_pour(cls, membre_pk, limite=TOP_RECOMMANDATIONS):
+        """
+            The Livre most similar to the ones a Membre borrowed, minus those:
+            scores of the Voisin summed over the Livre of the Membre.
+        """
+        lus = Emprunt.objects.filter(membre=membre_pk, livre__isnull=False).values('livre')
+        return (
+            cls.objects.filter(livre__in=lus).exclude(voisin__in=lus)
+            .values(pk=F('voisin'), titre=F('voisin__titre'))
+            .annotate(score=Sum('score'))
+            .order_by('-score', 'pk')[:limite]
+        )
+
+class Repere(models.Model):
+    """
+        Watermark of moteur.mettre_a_jour(): the Voisin take the Emprunt
+        up to dernier_pk into account. A single row.
+    """
+    dernier_pk = models.BigIntegerField(default=0)
+    date = models.DateTimeField(auto_now=True)
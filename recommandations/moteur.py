@@ -0,0 +1,206 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from api.cache import bump_generation
+from emprunts.models import Emprunt
+from livres.bulk import BATCH_SIZE
+from .models import Voisin, Repere, RECOMMANDATIONS_SCOPE
+
+# Item-item recommendations from the loan graph.
+#
+# Two Livre are similar when the same Membre borrowed both: the score is the
+# cosine similarity of their columns in the binary Membre x Livre matrix,
+#
+#   score(a, b) = lecteurs(a and b) / sqrt(lecteurs(a) * lecteurs(b))
+#
+# The co-occurrences are counted with NumPy from the (membre, livre) pairs,
+# never as a dense matrix, and only the TOP_K best Voisin of every Livre are
+# stored. calculer() rebuilds some Livre or all of them, mettre_a_jour()
+# only the ones whose neighbourhood changed since the last run (watermark).
+
+TOP_K = 20
+MAX_LIVRES_PAR_MEMBRE = 200 # most recent Livre of a Membre taken into account
+PAIRES_PAR_LOT = 2000000 # co-occurrences expanded at once (sum of the squared number of Livre of the Membre)
+
+def _paires(membres=None):
+    """
+        Distinct (membre, livre) pairs as two int64 arrays sorted by membre,
+        keeping the MAX_LIVRES_PAR_MEMBRE most recent Livre of every Membre.
+    """
+    emprunts = Emprunt.objects.filter(membre__isnull=False, livre__isnull=False)
+    if membres is None:
+        lots = [emprunts]
+    else:
+        # sorted lots of Membre, so that the pairs stay sorted by membre
+        membres = sorted(membres)
+        lots = [emprunts.filter(membre__in=membres[start:start + BATCH_SIZE]) for start in range(0, len(membres), BATCH_SIZE)]
+
+    paires = np.fromiter(
+        (
+            value
+            for lot in lots
+            for membre, livre, dernier in lot.values_list('membre', 'livre').annotate(dernier=Max('pk')).order_by('membre', '-dernier').iterator(chunk_size=5000)
+            for value in (membre, livre)
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    membres, livres = paires[:, 0], paires[:, 1]
+
+    # position of each pair within its Membre
+    debuts = np.flatnonzero(np.r_[True, membres[1:] != membres[:-1]]) if len(membres) else np.zeros(0, dtype=np.int64)
+    tailles = np.diff(np.r_[debuts, len(membres)])
+    positions = np.arange(len(membres)) - np.repeat(debuts, tailles)
+    garder = positions < MAX_LIVRES_PAR_MEMBRE
+    return membres[garder], livres[garder]
+
+def _cooccurrences(membres, livres, cibles):
+    """
+        Counts, for every Livre a of cibles (indexes), the Membre who borrowed
+        a and b. membres / livres are indexes, sorted by membre.
+        return: arrays a, b, count
+    """
+    n_livres = livres.max() + 1 if len(livres) else 0
+    debuts = np.flatnonzero(np.r_[True, membres[1:] != membres[:-1]]) if len(membres) else np.zeros(0, dtype=np.int64)
+    tailles = np.diff(np.r_[debuts, len(membres)])
+
+    # a Membre with n Livre expands into n * n pairs: the lots are cut on
+    # their cumulative count, with at least one Membre per lot
+    cumul = np.cumsum(tailles * tailles)
+    cles, comptes = [], []
+    lot = 0
+    while lot < len(debuts):
+        avant = cumul[lot - 1] if lot else 0
+        fin = max(int(np.searchsorted(cumul, avant + PAIRES_PAR_LOT, side='right')), lot + 1)
+        lot_debuts = debuts[lot:fin]
+        lot_tailles = tailles[lot:fin]
+        lot = fin
+
+        # every pair of the lot, repeated once per Livre of its Membre (gauche),
+        # against each of these Livre in turn (droite)
+        par_paire = np.repeat(lot_tailles, lot_tailles)
+        gauche = np.repeat(np.arange(lot_debuts[0], lot_debuts[-1] + lot_tailles[-1]), par_paire)
+        bloc = np.repeat(np.cumsum(par_paire) - par_paire, par_paire)
+        droite = np.repeat(lot_debuts, lot_tailles * lot_tailles) + np.arange(len(gauche)) - bloc
+
+        a, b = livres[gauche], livres[droite]
+        garder = (a != b) & cibles[a]
+        lot_cles, lot_comptes = np.unique(a[garder] * n_livres + b[garder], return_counts=True)
+        cles.append(lot_cles)
+        comptes.append(lot_comptes)
+
+    if not cles:
+        vide = np.zeros(0, dtype=np.int64)
+        return vide, vide, vide
+
+    cles, inverse = np.unique(np.concatenate(cles), return_inverse=True)
+    comptes = np.bincount(inverse, weights=np.concatenate(comptes)).astype(np.int64)
+    return cles // n_livres, cles % n_livres, comptes
+
+def _top_k(a, b, scores):
+    # best TOP_K b of every a: sorted by a then score desc
+    ordre = np.lexsort((b, -scores, a))
+    a, b, scores = a[ordre], b[ordre], scores[ordre]
+    debuts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if len(a) else np.zeros(0, dtype=np.int64)
+    rangs = np.arange(len(a)) - np.repeat(debuts, np.diff(np.r_[debuts, len(a)]))
+    garder = rangs < TOP_K
+    return a[garder], b[garder], scores[garder], rangs[garder] + 1
+
+def _membres_de(livres):
+    membres = set()
+    for start in range(0, len(livres), BATCH_SIZE):
+        membres.update(
+            Emprunt.objects.filter(livre__in=livres[start:start + BATCH_SIZE], membre__isnull=False)
+            .values_list('membre', flat=True).distinct()
+        )
+    return sorted(membres)
+
+def _lecteurs(ids):
+    """
+        Number of readers of every Livre of ids (sorted array), counted on the
+        pairs of _paires() like a full calculer(): only the last
+        MAX_LIVRES_PAR_MEMBRE Livre of a Membre count.
+    """
+    lecteurs = np.zeros(len(ids), dtype=np.int64)
+    membres = _membres_de(ids.tolist())
+    for start in range(0, len(membres), BATCH_SIZE):
+        _, livres_ids = _paires(membres[start:start + BATCH_SIZE])
+        livres_ids = livres_ids[np.isin(livres_ids, ids)]
+        lecteurs += np.bincount(np.searchsorted(ids, livres_ids), minlength=len(ids))
+    return lecteurs
+
+def calculer(livres=None):
+    """
+        Recomputes the Voisin of livres (ids, every Livre when None).
+        return: the number of Voisin written
+    """
+    if livres is not None:
+        livres = sorted(set(livres))
+        membres_ids, livres_ids = _paires(_membres_de(livres))
+    else:
+        membres_ids, livres_ids = _paires()
+
+    # ids => indexes
+    ids, livres_idx = np.unique(livres_ids, return_inverse=True)
+    _, membres_idx = np.unique(membres_ids, return_inverse=True)
+    cibles = np.ones(len(ids), dtype=bool) if livres is None else np.isin(ids, livres)
+
+    # number of readers of every Livre, from all the Membre when only some were loaded
+    lecteurs = np.bincount(livres_idx, minlength=len(ids)) if livres is None else _lecteurs(ids)
+
+    a, b, communs = _cooccurrences(membres_idx, livres_idx, cibles)
+    scores = communs / np.sqrt(lecteurs[a] * lecteurs[b])
+    a, b, scores, rangs = _top_k(a, b, scores)
+
+    voisins = [
+        Voisin(livre_id=livre, voisin_id=voisin, rang=rang, score=score)
+        for livre, voisin, rang, score in zip(ids[a].tolist(), ids[b].tolist(), rangs.tolist(), scores.tolist())
+    ]
+    with transaction.atomic():
+        if livres is None:
+            Voisin.objects.all().delete()
+        else:
+            for start in range(0, len(livres), BATCH_SIZE):
+                Voisin.objects.filter(livre__in=livres[start:start + BATCH_SIZE]).delete()
+        Voisin.objects.bulk_create(voisins, batch_size=1000)
+        transaction.on_commit(lambda: bump_generation(RECOMMANDATIONS_SCOPE))
+
+    return len(voisins)
+
+def mettre_a_jour():
+    """
+        Recomputes the Voisin of the Livre whose scores changed since the last
+        run: the Livre borrowed since then, and the Livre read with those.
+        return: the number of Livre recomputed
+    """
+    repere, created = Repere.objects.get_or_create(pk=1)
+    dernier = Emprunt.objects.aggregate(dernier=Max('pk'))['dernier'] or 0
+    nouveaux = Emprunt.objects.filter(pk__gt=repere.dernier_pk, pk__lte=dernier, membre__isnull=False, livre__isnull=False)
+    # a new reader changes the number of readers of the borrowed Livre and its
+    # co-occurrences with the other Livre of that reader, which changes the
+    # scores of every Livre read with it. Past MAX_LIVRES_PAR_MEMBRE Livre, a
+    # new Emprunt also drops the oldest Livre of its Membre: every Livre of
+    # these Membre changes then.
+    complets = (
+        Emprunt.objects.filter(membre__in=nouveaux.values('membre'), livre__isnull=False)
+        .values('membre').annotate(nb_livres=Count('livre', distinct=True)).filter(nb_livres__gt=MAX_LIVRES_PAR_MEMBRE)
+        .values('membre')
+    )
+    changes = Emprunt.objects.filter(
+        Q(pk__in=nouveaux.values('pk')) | Q(membre__in=complets), livre__isnull=False,
+    ).values('livre')
+    lecteurs = Emprunt.objects.filter(livre__in=changes, membre__isnull=False).values('membre')
+    livres = set(
+        Emprunt.objects.filter(membre__in=lecteurs, livre__isnull=False)
+        .values_list('livre', flat=True).distinct()
+    )
+    # computed outside the lock: running it twice only rewrites the same Voisin
+    if livres:
+        calculer(livres)
+
+    with transaction.atomic():
+        repere = Repere.objects.select_for_update().get(pk=repere.pk)
+        repere.dernier_pk = max(dernier, repere.dernier_pk)
+        repere.save()
+
+    return len(livres)
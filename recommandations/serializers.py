@@ -0,0 +1,10 @@
+from rest_framework import serializers
+
+class SimilaireSerializer(serializers.Serializer):
+    """
+        Livre recommended from the loans, with its score
+        (cosine similarity, summed over the Livre of the Membre for the recommandations)
+    """
+    pk = serializers.IntegerField(read_only=True)
+    titre = serializers.CharField(read_only=True)
+    score = serializers.FloatField(read_only=True)
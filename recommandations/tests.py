@@ -0,0 +1,146 @@
+import math
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from livres.models import Livre, User
+from emprunts.models import Membre, Emprunt
+from .models import Voisin
+from . import moteur
+
+# Create your tests here.
+
+LECTURES = [
+    # livres borrowed by each membre
+    [0, 1, 2],
+    [0, 1],
+    [1, 2, 3],
+    [0, 3],
+    [4],
+]
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class MoteurTestCase(APITestCase):
+    def setUp(self):
+        self.livres = [Livre.objects.create(titre='titre%s' % (i), isbn='12345678900%s' % (10 + i)) for i in range(5)]
+        self.membres = []
+        for i, lectures in enumerate(LECTURES):
+            user = User.objects.create_user(username='user%s' % (i), password='1234')
+            membre = Membre.objects.create(user=user)
+            self.membres.append(membre)
+            for livre in lectures:
+                self.emprunter(membre, livre)
+        # borrowing twice doesn't count twice
+        self.emprunter(self.membres[0], 0)
+
+    def emprunter(self, membre, livre):
+        return Emprunt.objects.create(membre=membre, livre=self.livres[livre])
+
+    def attendu(self):
+        lecteurs = {}
+        for membre, lectures in enumerate(LECTURES):
+            for livre in lectures:
+                lecteurs.setdefault(livre, set()).add(membre)
+
+        scores = {}
+        for a in lecteurs:
+            for b in lecteurs:
+                communs = len(lecteurs[a] & lecteurs[b])
+                if a != b and communs:
+                    scores[(self.livres[a].pk, self.livres[b].pk)] = communs / math.sqrt(len(lecteurs[a]) * len(lecteurs[b]))
+        return scores
+
+    def scores(self):
+        return {(voisin.livre_id, voisin.voisin_id): voisin.score for voisin in Voisin.objects.all()}
+
+    def test_cosine_similarity(self):
+        moteur.calculer()
+        attendu = self.attendu()
+        scores = self.scores()
+        self.assertEqual(set(scores), set(attendu))
+        for key in attendu:
+            self.assertAlmostEqual(scores[key], attendu[key])
+
+        rangs = list(Voisin.objects.filter(livre=self.livres[1]).order_by('rang').values_list('score', flat=True))
+        self.assertEqual(rangs, sorted(rangs, reverse=True))
+
+    def test_top_k_and_small_batches(self):
+        with patch.object(moteur, 'TOP_K', 1), patch.object(moteur, 'PAIRES_PAR_LOT', 5):
+            moteur.calculer()
+        self.assertEqual(Voisin.objects.filter(livre=self.livres[0]).count(), 1)
+        self.assertEqual(Voisin.objects.get(livre=self.livres[0]).voisin_id, self.livres[1].pk)
+
+    def test_incremental_update_matches_full_computation(self):
+        call_command('calculer_recommandations', stdout=StringIO())
+        self.emprunter(self.membres[4], 0)
+        self.emprunter(self.membres[4], 2)
+        self.assertEqual(moteur.mettre_a_jour(), 5)
+        incremental = self.scores()
+
+        moteur.calculer()
+        complet = self.scores()
+        self.assertEqual(set(incremental), set(complet))
+        for key in complet:
+            self.assertAlmostEqual(incremental[key], complet[key])
+        self.assertEqual(moteur.mettre_a_jour(), 0)
+
+    def test_incremental_update_only_readers_of_new_livres(self):
+        moteur.mettre_a_jour()
+        # 2 and 3 are not read with 4: their scores don't change
+        self.emprunter(self.membres[1], 4)
+        with patch.object(moteur, 'BATCH_SIZE', 2):
+            self.assertEqual(moteur.mettre_a_jour(), 3)
+        incremental = self.scores()
+
+        moteur.calculer()
+        self.assertEqual(incremental, self.scores())
+
+    def test_incremental_update_with_capped_membres(self):
+        # only the 2 last Livre of a Membre count, in the pairs and in the number of readers
+        membre = Membre.objects.create(user=User.objects.create_user(username='user5', password='1234'))
+        self.livres.append(Livre.objects.create(titre='titre5', isbn='1234567890015'))
+        self.emprunter(membre, 1)
+        self.emprunter(membre, 4)
+        with patch.object(moteur, 'MAX_LIVRES_PAR_MEMBRE', 2):
+            moteur.mettre_a_jour()
+            # 1 isn't one of the 2 last Livre of membre anymore: its score with 0 changes
+            self.emprunter(membre, 5)
+            moteur.mettre_a_jour()
+            incremental = self.scores()
+
+            moteur.calculer()
+            complet = self.scores()
+        self.assertEqual(set(incremental), set(complet))
+        for key in complet:
+            self.assertAlmostEqual(incremental[key], complet[key])
+
+    def test_similaires(self):
+        moteur.calculer()
+        url = reverse('livres:livres-similaires', kwargs={'pk': self.livres[0].pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data[0]['pk'], self.livres[1].pk)
+        self.assertEqual(response.data[0]['titre'], 'titre1')
+
+        self.assertEqual(self.client.get(reverse('livres:livres-similaires', kwargs={'pk': 999})).status_code, 404)
+
+    def test_recommandations(self):
+        moteur.calculer()
+        url = reverse('emprunts:membres-recommandations', kwargs={'pk': self.membres[1].pk})
+        self.assertIn(self.client.get(url).status_code, [401, 403])
+
+        self.client.force_authenticate(self.membres[0].user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(User.objects.get(pk=self.membres[1].user.pk))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # 0 and 1 are read already, 2 and 3 come from both of them
+        self.assertEqual([livre['pk'] for livre in response.data], [self.livres[2].pk, self.livres[3].pk])
+        score = self.attendu()
+        self.assertAlmostEqual(response.data[0]['score'], score[(self.livres[0].pk, self.livres[2].pk)] + score[(self.livres[1].pk, self.livres[2].pk)])
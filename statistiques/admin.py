@@ -0,0 +1,9 @@
+from django.contrib import admin
+from . import models
+
+# Register your models here.
+admin.site.register(models.EmpruntsParLivre)
+admin.site.register(models.EmpruntsParCategorie)
+admin.site.register(models.EmpruntsParAuteur)
+admin.site.register(models.EmpruntsParMembre)
+admin.site.register(models.Rafraichissement)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from statistiques import rafraichissement
+
+class Command(BaseCommand):
+    help = 'Adds the Emprunt created since the last run to the statistics (--reconstruire to count every Emprunt again).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconstruire', action='store_true', help='empty the statistics and count every Emprunt again')
+        parser.add_argument('--chunk-size', type=int, default=rafraichissement.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['reconstruire']:
+            dernier, precedent = rafraichissement.reconstruire(options['chunk_size'])
+        else:
+            dernier, precedent = rafraichissement.rafraichir(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Statistics up to Emprunt %s (previously %s)' % (dernier, precedent)))
@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('emprunts', '0008_emprunt_avis_indexes'),
+        ('livres', '0014_livre_disponible'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rafraichissement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('dernier_pk', models.BigIntegerField(default=0)),
+                ('date', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmpruntsParAuteur',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField()),
+                ('nb_emprunts', models.PositiveIntegerField(default=0)),
+                ('auteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='livres.auteur')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('mois', 'auteur'), name='stats_auteur_mois_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmpruntsParCategorie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField()),
+                ('nb_emprunts', models.PositiveIntegerField(default=0)),
+                ('categorie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='livres.categorie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('mois', 'categorie'), name='stats_categorie_mois_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmpruntsParLivre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField()),
+                ('nb_emprunts', models.PositiveIntegerField(default=0)),
+                ('livre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='livres.livre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('mois', 'livre'), name='stats_livre_mois_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmpruntsParMembre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semaine', models.DateField()),
+                ('nb_emprunts', models.PositiveIntegerField(default=0)),
+                ('membre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='emprunts.membre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('semaine', 'membre'), name='stats_membre_semaine_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import models
+
+from livres.models import Livre, Auteur, Categorie
+from emprunts.models import Membre
+
+# Summary tables of the Emprunt, filled by statistiques/rafraichissement.py.
+# The dashboards read them instead of grouping the whole Emprunt table.
+
+class EmpruntsParMois(models.Model):
+    """
+        Number of Emprunt started (date_emp) during a month.
+        mois is the first day of the month.
+    """
+    mois = models.DateField()
+    nb_emprunts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class EmpruntsParLivre(EmpruntsParMois):
+    livre = models.ForeignKey(Livre, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['mois', 'livre'], name='stats_livre_mois_unique')]
+
+class EmpruntsParCategorie(EmpruntsParMois):
+    categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['mois', 'categorie'], name='stats_categorie_mois_unique')]
+
+class EmpruntsParAuteur(EmpruntsParMois):
+    auteur = models.ForeignKey(Auteur, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['mois', 'auteur'], name='stats_auteur_mois_unique')]
+
+class EmpruntsParMembre(models.Model):
+    """
+        Number of Emprunt of a Membre during a week, a Membre is active
+        during the weeks it has a row for.
+        semaine is the monday of the week.
+    """
+    semaine = models.DateField()
+    membre = models.ForeignKey(Membre, on_delete=models.CASCADE)
+    nb_emprunts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['semaine', 'membre'], name='stats_membre_semaine_unique')]
+
+class Rafraichissement(models.Model):
+    """
+        Watermark of the refresh: the Emprunt up to dernier_pk are counted.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    dernier_pk = models.BigIntegerField(default=0)
+    date = models.DateTimeField(auto_now=True)
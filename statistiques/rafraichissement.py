@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from api.cache import bump_generation
+from emprunts.models import Emprunt
+from .models import *
+
+# Incremental refresh of the summary tables.
+#
+# Emprunt rows are only read once: rafraichir() groups the Emprunt created
+# since the watermark (pk > Rafraichissement.dernier_pk) by period and adds
+# the counts to the summary rows. Changes to older Emprunt (date_emp, livre,
+# deletion) and rows committed late with a lower pk are only taken into
+# account by reconstruire().
+
+SOURCE = 'emprunts'
+STATS_SCOPE = 'statistiques' # generation of the cached /stats/ responses
+CHUNK_SIZE = 5000 # range of Emprunt pk grouped at once
+
+PERIODES = {
+    'mois': TruncMonth('date_emp'),
+    'semaine': TruncWeek('date_emp'),
+}
+
+# summary model, its period, its key field, the same key from Emprunt
+DIMENSIONS = [
+    (EmpruntsParLivre, 'mois', 'livre', 'livre'),
+    (EmpruntsParCategorie, 'mois', 'categorie', 'livre__categorie'),
+    (EmpruntsParAuteur, 'mois', 'auteur', 'livre__auteur'),
+    (EmpruntsParMembre, 'semaine', 'membre', 'membre'),
+]
+
+def _ajouter(emprunts, model, periode, champ, source):
+    """
+        Adds the counts of emprunts grouped by (periode, source) to the rows of model.
+    """
+    groupes = (
+        emprunts.filter(**{source + '__isnull': False})
+        .annotate(periode=PERIODES[periode])
+        .values('periode', source)
+        .annotate(nombre=Count('pk'))
+        .order_by()
+    )
+    groupes = {(groupe['periode'], groupe[source]): groupe['nombre'] for groupe in groupes}
+    if not groupes:
+        return
+
+    existants = model.objects.filter(**{
+        periode + '__in': {cle[0] for cle in groupes},
+        champ + '__in': {cle[1] for cle in groupes},
+    })
+    existants = {(getattr(row, periode), getattr(row, champ + '_id')): row for row in existants}
+
+    nouveaux = []
+    for cle, nombre in groupes.items():
+        if cle in existants:
+            existants[cle].nb_emprunts += nombre
+        else:
+            nouveaux.append(model(**{periode: cle[0], champ + '_id': cle[1], 'nb_emprunts': nombre}))
+
+    model.objects.bulk_update([existants[cle] for cle in groupes if cle in existants], ['nb_emprunts'])
+    model.objects.bulk_create(nouveaux)
+
+def rafraichir(chunk_size=CHUNK_SIZE):
+    """
+        Counts the Emprunt created since the last refresh.
+        return: the new watermark and the previous one
+    """
+    with transaction.atomic():
+        repere, created = Rafraichissement.objects.select_for_update().get_or_create(source=SOURCE)
+        precedent = repere.dernier_pk
+        dernier = Emprunt.objects.aggregate(dernier=Max('pk'))['dernier'] or 0
+
+        debut = precedent
+        while debut < dernier:
+            fin = min(debut + chunk_size, dernier)
+            emprunts = Emprunt.objects.filter(pk__gt=debut, pk__lte=fin, date_emp__isnull=False)
+            for model, periode, champ, source in DIMENSIONS:
+                _ajouter(emprunts, model, periode, champ, source)
+            debut = fin
+
+        repere.dernier_pk = max(dernier, precedent)
+        repere.save()
+
+    if dernier > precedent:
+        bump_generation(STATS_SCOPE)
+    return repere.dernier_pk, precedent
+
+def reconstruire(chunk_size=CHUNK_SIZE):
+    """
+        Empties the summary tables and counts every Emprunt again.
+    """
+    with transaction.atomic():
+        for model, periode, champ, source in DIMENSIONS:
+            model.objects.all().delete()
+        Rafraichissement.objects.filter(source=SOURCE).update(dernier_pk=0)
+        result = rafraichir(chunk_size)
+
+    bump_generation(STATS_SCOPE)
+    return result
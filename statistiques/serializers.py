@@ -0,0 +1,30 @@
+from rest_framework import serializers
+
+class PeriodeSerializer(serializers.Serializer):
+    """
+        Query parameters of the /stats/ endpoints
+        ?depuis=2025-01-01&jusqua=2025-06-30&limite=10
+    """
+    depuis = serializers.DateField(required=False)
+    jusqua = serializers.DateField(required=False)
+    limite = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+
+    def validate(self, attrs):
+        if attrs.get('depuis') and attrs.get('jusqua') and attrs['depuis'] > attrs['jusqua']:
+            raise serializers.ValidationError({'jusqua': ['Must be after depuis.']})
+        return attrs
+
+class ClassementSerializer(serializers.Serializer):
+    """
+        Row of a ranking: the rang-th most borrowed livre / categorie / auteur of the mois
+    """
+    mois = serializers.DateField(read_only=True)
+    rang = serializers.IntegerField(read_only=True)
+    pk = serializers.IntegerField(read_only=True)
+    nom = serializers.CharField(read_only=True)
+    nb_emprunts = serializers.IntegerField(read_only=True)
+
+class MembresActifsSerializer(serializers.Serializer):
+    semaine = serializers.DateField(read_only=True)
+    membres_actifs = serializers.IntegerField(read_only=True)
+    nb_emprunts = serializers.IntegerField(read_only=True)
@@ -0,0 +1,100 @@
+from io import StringIO
+from datetime import date
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from livres.models import Livre, Auteur, Categorie, User
+from emprunts.models import Membre, Emprunt
+from .models import *
+from .rafraichissement import rafraichir, reconstruire
+
+# Create your tests here.
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StatistiquesTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(username='admin', password='1234')
+        self.auteur = Auteur.objects.create(nom='Sithi', prenom='Jean-Luck')
+        self.categorie = Categorie.objects.create(nom='Aventure')
+        self.livres = [
+            Livre.objects.create(titre='titre1', isbn='1234567890098', auteur=self.auteur),
+            Livre.objects.create(titre='titre2', isbn='1234567890099'),
+        ]
+        self.livres[0].categorie.add(self.categorie)
+        self.membres = [Membre.objects.create() for i in range(2)]
+
+    def emprunter(self, livre, membre, date_emp):
+        return Emprunt.objects.create(livre=livre, membre=membre, date_emp=date_emp)
+
+    def test_rafraichir_is_incremental(self):
+        self.emprunter(self.livres[0], self.membres[0], '2025-01-06')
+        self.emprunter(self.livres[0], self.membres[1], '2025-01-31')
+        self.emprunter(self.livres[1], self.membres[0], '2025-02-01')
+        rafraichir(chunk_size=2)
+
+        self.assertEqual(EmpruntsParLivre.objects.get(livre=self.livres[0], mois=date(2025, 1, 1)).nb_emprunts, 2)
+        self.assertEqual(EmpruntsParCategorie.objects.get(categorie=self.categorie).nb_emprunts, 2)
+        self.assertEqual(EmpruntsParAuteur.objects.get(auteur=self.auteur).nb_emprunts, 2)
+        self.assertEqual(EmpruntsParMembre.objects.get(membre=self.membres[0], semaine=date(2025, 1, 6)).nb_emprunts, 1)
+
+        self.emprunter(self.livres[0], self.membres[0], '2025-01-07')
+        rafraichir()
+        rafraichir()
+        self.assertEqual(EmpruntsParLivre.objects.get(livre=self.livres[0], mois=date(2025, 1, 1)).nb_emprunts, 3)
+        self.assertEqual(EmpruntsParMembre.objects.get(membre=self.membres[0], semaine=date(2025, 1, 6)).nb_emprunts, 2)
+
+    def test_reconstruire(self):
+        emprunt = self.emprunter(self.livres[0], self.membres[0], '2025-01-06')
+        rafraichir()
+        emprunt.delete()
+        self.emprunter(self.livres[1], self.membres[0], '2025-03-06')
+
+        call_command('rafraichir_statistiques', '--reconstruire', stdout=StringIO())
+        self.assertEqual(list(EmpruntsParLivre.objects.values_list('livre', 'nb_emprunts')), [(self.livres[1].pk, 1)])
+
+    def test_endpoints(self):
+        for livre, jour in [(0, 6), (0, 7), (1, 8), (1, 20)]:
+            self.emprunter(self.livres[livre], self.membres[livre], '2025-01-%02d' % (jour))
+        self.emprunter(self.livres[1], self.membres[1], '2025-02-03')
+        self.emprunter(self.livres[1], self.membres[0], '2025-02-04')
+        rafraichir()
+
+        self.assertIn(self.client.get(reverse('statistiques:stats-livres')).status_code, [401, 403])
+        self.client.force_authenticate(self.admin_user)
+        self.assertEqual(self.client.get(reverse('statistiques:stats-list')).status_code, 200)
+
+        response = self.client.get(reverse('statistiques:stats-livres'), {'limite': 1})
+        self.assertEqual(
+            [(row['mois'], row['nom'], row['nb_emprunts']) for row in response.data],
+            [('2025-02-01', 'titre2', 2), ('2025-01-01', 'titre1', 2)],
+        )
+
+        response = self.client.get(reverse('statistiques:stats-auteurs'), {'depuis': '2025-01-01', 'jusqua': '2025-01-31'})
+        self.assertEqual([(row['nom'], row['nb_emprunts']) for row in response.data], [('Jean-Luck Sithi', 2)])
+        self.assertEqual(self.client.get(reverse('statistiques:stats-categories')).data[0]['pk'], self.categorie.pk)
+
+        response = self.client.get(reverse('statistiques:stats-membres-actifs'))
+        self.assertEqual(
+            [(row['semaine'], row['membres_actifs'], row['nb_emprunts']) for row in response.data],
+            [('2025-02-03', 2, 2), ('2025-01-20', 1, 1), ('2025-01-06', 2, 3)],
+        )
+        self.assertEqual(self.client.get(reverse('statistiques:stats-livres'), {'limite': 0}).status_code, 400)
+
+    def test_responses_are_cached_until_the_refresh(self):
+        self.client.force_authenticate(self.admin_user)
+        self.emprunter(self.livres[0], self.membres[0], '2025-01-06')
+        rafraichir()
+        url = reverse('statistiques:stats-livres')
+        self.assertEqual(len(self.client.get(url).data), 1)
+
+        self.emprunter(self.livres[1], self.membres[0], '2025-01-06')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url).data), 1)
+
+        rafraichir()
+        self.assertEqual(len(self.client.get(url).data), 2)
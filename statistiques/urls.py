@@ -0,0 +1,12 @@
+from django.urls import path, include
+from . import views
+from rest_framework_nested import routers
+
+app_name = 'statistiques'
+
+statsRouter = routers.SimpleRouter()
+statsRouter.register(r'stats', views.StatistiquesViewSet, basename='stats')
+
+urlpatterns = [
+    path(r'', include(statsRouter.urls)),
+]
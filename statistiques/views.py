@@ -0,0 +1,100 @@
+from django.db.models import F, Count, Sum, Window, Value
+from django.db.models.functions import RowNumber, Concat, Coalesce
+from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+
+from api.cache import versioned_key, get_or_compute, render_json, CachedJSONResponse
+from .models import *
+from .serializers import *
+from .rafraichissement import STATS_SCOPE
+
+# Create your views here.
+
+CACHE_TIME = 86400 # the responses are versioned by the refresh (STATS_SCOPE)
+
+PERIODE_PARAMETERS = [
+    OpenApiParameter('depuis', str, description='first day (YYYY-MM-DD)'),
+    OpenApiParameter('jusqua', str, description='last day (YYYY-MM-DD)'),
+    OpenApiParameter('limite', int, description='rows per period for the rankings (10 by default, 100 at most)'),
+]
+
+class StatistiquesViewSet(viewsets.ViewSet):
+    """
+        ViewSet of the circulation statistics, read from the summary tables
+        filled by the rafraichir_statistiques command. Staff only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        return Response({
+            name: reverse('statistiques:stats-%s' % (name), request=request)
+            for name in ['livres', 'categories', 'auteurs', 'membres-actifs']
+        })
+
+    def cached(self, request, name, compute):
+        parametres = PeriodeSerializer(data=request.query_params)
+        parametres.is_valid(raise_exception=True)
+
+        key = versioned_key('stats-%s' % (name), [STATS_SCOPE], request.query_params)
+        entry = get_or_compute(key, lambda: render_json(compute(parametres.validated_data)), CACHE_TIME)
+        return CachedJSONResponse(entry)
+
+    def classement(self, model, champ, nom, parametres):
+        """
+            The limite most borrowed rows of model per mois, last mois first.
+        """
+        rows = model.objects.all()
+        if parametres.get('depuis'):
+            rows = rows.filter(mois__gte=parametres['depuis'])
+        if parametres.get('jusqua'):
+            rows = rows.filter(mois__lte=parametres['jusqua'])
+
+        rows = rows.annotate(
+            rang=Window(RowNumber(), partition_by=[F('mois')], order_by=[F('nb_emprunts').desc(), F(champ).asc()]),
+        ).filter(rang__lte=parametres['limite']).order_by('-mois', 'rang')
+        rows = rows.values('mois', 'rang', 'nb_emprunts', pk=F(champ), nom=nom)
+        return ClassementSerializer(rows, many=True).data
+
+    @extend_schema(description='Most borrowed Livre per month', parameters=PERIODE_PARAMETERS, responses=ClassementSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def livres(self, request):
+        return self.cached(request, 'livres', lambda parametres: self.classement(
+            EmpruntsParLivre, 'livre', F('livre__titre'), parametres,
+        ))
+
+    @extend_schema(description='Most borrowed Categorie per month', parameters=PERIODE_PARAMETERS, responses=ClassementSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        return self.cached(request, 'categories', lambda parametres: self.classement(
+            EmpruntsParCategorie, 'categorie', F('categorie__nom'), parametres,
+        ))
+
+    @extend_schema(description='Most borrowed Auteur per month', parameters=PERIODE_PARAMETERS, responses=ClassementSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def auteurs(self, request):
+        nom = Concat(Coalesce('auteur__prenom', Value('')), Value(' '), Coalesce('auteur__nom', Value('')))
+        return self.cached(request, 'auteurs', lambda parametres: self.classement(
+            EmpruntsParAuteur, 'auteur', nom, parametres,
+        ))
+
+    @extend_schema(description='Members with at least one Emprunt per week', parameters=PERIODE_PARAMETERS, responses=MembresActifsSerializer(many=True))
+    @action(detail=False, methods=['get'], url_path='membres-actifs')
+    def membres_actifs(self, request):
+        def compute(parametres):
+            rows = EmpruntsParMembre.objects.all()
+            if parametres.get('depuis'):
+                rows = rows.filter(semaine__gte=parametres['depuis'])
+            if parametres.get('jusqua'):
+                rows = rows.filter(semaine__lte=parametres['jusqua'])
+
+            rows = rows.values('semaine').annotate(
+                membres_actifs=Count('membre'),
+                nb_emprunts=Sum('nb_emprunts'),
+            ).order_by('-semaine')
+            return MembresActifsSerializer(rows, many=True).data
+
+        return self.cached(request, 'membres-actifs', compute)